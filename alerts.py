@@ -0,0 +1,322 @@
+"""
+Saved searches and new-listing alerts
+
+A saved search is a set of criteria stored as JSON in saved_searches:
+
+    {"model": "W124", "year_from": 1982, "year_to": 1985, "max_price": 6000,
+     "country": "DE", "features": ["station", "automaat", "trekhaak"],
+     "near": "Utrecht", "radius_km": 150}
+
+Every key is optional. "features" are the Hot filter of the web page:
+station wagon, automatic transmission and tow bar.
+
+match_saved_searches() runs at the end of every scrape (see
+sources.refresh_derived_data). It reads the change log (listing_changes)
+after the lowest seq any search has seen, so it only looks at ads that
+were inserted, repriced or reactivated since: the cost follows the daily
+churn, not the size of the table. Matches go into alert_outbox, at most
+once per search and vehicle.
+
+deliver_alerts() drains the outbox: one e-mail (config.SMTP_HOST) or
+webhook POST per saved search, or a console message when neither is set.
+The scheduler of main.py (or of web_app.py when run directly) runs it
+every config.ALERT_WORKER_INTERVAL minutes.
+
+Usage:
+    python alerts.py add "Hot W124" --model W124 --max-price 6000 --features station,automaat,trekhaak --near Utrecht --radius-km 150 --email me@example.com
+    python alerts.py list
+    python alerts.py delete 3
+    python alerts.py deliver
+"""
+
+import argparse
+import json
+import math
+import re
+import smtplib
+from datetime import datetime
+from email.message import EmailMessage
+
+import requests
+
+import config
+from enrichment import BODY_TYPE_PATTERNS, TRANSMISSION_PATTERNS
+from geocode import haversine, parse_point
+
+# Hot filter features, same patterns as loadHotListings() in static/script.js
+FEATURES = {
+    'station': ('body_type', 'Station', dict(BODY_TYPE_PATTERNS)['Station']),
+    'automaat': ('transmission', 'Automaat', dict(TRANSMISSION_PATTERNS)['Automaat']),
+    'trekhaak': (None, None, re.compile(r'trekhaak|anhängerkupplung|\bahk\b|towbar|tow bar|attelage', re.IGNORECASE)),
+}
+
+
+def _number(name, value, integer=False):
+    """value as an int or a finite float, None when empty; raises ValueError for anything else"""
+    if value is None or value == '':
+        return None
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number, got {value!r}") from None
+    if not math.isfinite(number) or (integer and not number.is_integer()):
+        raise ValueError(f"{name} must be a{' whole' if integer else ''} number, got {value!r}")
+    return int(number) if integer else number
+
+
+def _text(name, value):
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{name} must be text, got {value!r}")
+    return value.strip().upper() if value and value.strip() else None
+
+
+def build_criteria(model=None, year_from=None, year_to=None, max_price=None, country=None,
+                   features=None, near=None, radius_km=None):
+    """Validate criteria and resolve the near location to coordinates
+
+    Years become ints and prices and radii floats, so matching never
+    compares a number with a string. Raises ValueError for values of the
+    wrong type, unknown features or locations.
+    """
+    if features is not None and (not isinstance(features, list)
+                                 or not all(isinstance(feature, str) for feature in features)):
+        raise ValueError(f"features must be a list of names, got {features!r}")
+
+    criteria = {
+        'model': _text('model', model),
+        'year_from': _number('year_from', year_from, integer=True),
+        'year_to': _number('year_to', year_to, integer=True),
+        'max_price': _number('max_price', max_price),
+        'country': _text('country', country),
+        'features': list(features or []),
+    }
+    radius_km = _number('radius_km', radius_km)
+    if radius_km is not None and radius_km <= 0:
+        raise ValueError(f"radius_km must be positive, got {radius_km!r}")
+
+    unknown = [feature for feature in criteria['features'] if feature not in FEATURES]
+    if unknown:
+        raise ValueError(f"Unknown feature(s): {', '.join(unknown)} (choose from {', '.join(FEATURES)})")
+
+    if near:
+        if not isinstance(near, str):
+            raise ValueError(f"near must be a place or 'latitude,longitude', got {near!r}")
+        point = parse_point(near)
+        if not point:
+            raise ValueError(f"Unknown location: {near}")
+        criteria.update(near=near, latitude=point[0], longitude=point[1], radius_km=radius_km or 100)
+
+    return {key: value for key, value in criteria.items() if value not in (None, [])}
+
+
+def has_feature(ad, feature):
+    field, label, pattern = FEATURES[feature]
+    if field and ad.get(field) == label:
+        return True
+    text = f"{ad.get('title') or ''} {ad.get('description') or ''} {ad.get('model') or ''}"
+    return bool(pattern.search(text))
+
+
+def matches_criteria(criteria, ad):
+    """True if an ad satisfies the criteria of a saved search"""
+    if criteria.get('model') and criteria['model'] not in (ad.get('model') or '').upper():
+        return False
+    if criteria.get('country') and ad.get('country') != criteria['country']:
+        return False
+
+    # Unknown year or price does not match a search that asks for one
+    if criteria.get('year_from') and not (ad.get('year') and ad['year'] >= criteria['year_from']):
+        return False
+    if criteria.get('year_to') and not (ad.get('year') and ad['year'] <= criteria['year_to']):
+        return False
+    # max_price is in euros
+    if criteria.get('max_price') and not (ad.get('price_eur') and ad['price_eur'] <= criteria['max_price']):
+        return False
+
+    if 'latitude' in criteria:
+        distance = haversine(ad.get('latitude'), ad.get('longitude'), criteria['latitude'], criteria['longitude'])
+        if distance is None or distance > criteria['radius_km']:
+            return False
+
+    return all(has_feature(ad, feature) for feature in criteria.get('features', []))
+
+
+def match_saved_searches(db):
+    """Queue alerts for ads changed since each saved search was last matched
+
+    Returns the number of alerts queued.
+    """
+    searches = db.get_saved_searches()
+    if not searches:
+        return 0
+
+    after = min(search['last_change_seq'] for search in searches)
+    ads = db.get_changed_advertisements(after)
+    if not ads:
+        return 0
+
+    watermark = max(ad['change_seq'] for ad in ads)
+
+    matches = []
+    for search in searches:
+        # A broken search (e.g. criteria saved before build_criteria checked
+        # types) is reported and skipped, it must not stop the others or the scrape
+        try:
+            criteria = json.loads(search['criteria'])
+            matches.extend(
+                (search['id'], ad['id'], ad['vehicle_cluster_id'] or ad['id'])
+                for ad in ads
+                if ad['change_seq'] > search['last_change_seq'] and matches_criteria(criteria, ad)
+            )
+        except Exception as e:
+            print(f"Saved search {search['id']} ({search['name']}) skipped: {e}")
+
+    queued = db.add_alerts(matches)
+    db.set_search_watermarks([(max(watermark, search['last_change_seq']), search['id']) for search in searches])
+
+    print(f"Saved searches: {len(ads)} changed ads checked against {len(searches)} searches, {queued} alerts queued")
+    return queued
+
+
+# ============================================================================
+# Delivery
+# ============================================================================
+
+# Outbox columns of Database.get_pending_alerts() rows, the rest is the ad
+ALERT_FIELDS = ('alert_id', 'saved_search_id', 'name', 'email', 'webhook_url')
+
+
+def format_listing(ad):
+    price = f"€{ad['price_eur']:,.0f}".replace(',', '.') if ad.get('price_eur') else 'Prijs op aanvraag'
+    if ad.get('price_eur') and ad.get('currency') not in (None, 'EUR'):
+        price += f" ({ad['price']:,.0f} {ad['currency']})".replace(',', '.')
+    mileage = f"{ad['mileage']:,} km".replace(',', '.') if ad.get('mileage') else 'km onbekend'
+    return (f"{ad.get('title') or ad.get('model')} ({ad.get('year') or '?'})\n"
+            f"  {price} - {mileage} - {ad.get('location') or ad.get('country') or ''}\n"
+            f"  {ad.get('source_url') or ''}")
+
+
+def send_email(address, subject, body):
+    message = EmailMessage()
+    message['From'] = config.SMTP_FROM
+    message['To'] = address
+    message['Subject'] = subject
+    message.set_content(body)
+
+    with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT, timeout=config.REQUEST_TIMEOUT) as smtp:
+        if config.SMTP_STARTTLS:
+            smtp.starttls()
+        if config.SMTP_USER:
+            smtp.login(config.SMTP_USER, config.SMTP_PASSWORD)
+        smtp.send_message(message)
+
+
+def send_webhook(url, search, ads):
+    response = requests.post(url, json={
+        'saved_search': {'id': search['id'], 'name': search['name']},
+        'count': len(ads),
+        'listings': ads,
+    }, timeout=config.REQUEST_TIMEOUT)
+    response.raise_for_status()
+
+
+def deliver(search, ads):
+    """Send one message for the new listings of a saved search"""
+    subject = f"{len(ads)} nieuwe advertentie(s) voor '{search['name']}'"
+
+    if search['webhook_url']:
+        send_webhook(search['webhook_url'], search, ads)
+    if search['email'] and config.SMTP_HOST:
+        send_email(search['email'], subject, '\n\n'.join(format_listing(ad) for ad in ads))
+    if not search['webhook_url'] and not (search['email'] and config.SMTP_HOST):
+        print(f"[Alerts] {subject}")
+        for ad in ads:
+            print(format_listing(ad))
+
+
+def deliver_alerts(db, limit=None):
+    """Send pending alerts from the outbox, grouped per saved search
+
+    Failed deliveries stay in the outbox and are retried up to
+    config.ALERT_MAX_ATTEMPTS times. Returns the number of alerts sent.
+    """
+    pending = db.get_pending_alerts(limit or config.ALERT_BATCH_SIZE)
+    if not pending:
+        return 0
+
+    groups = {}
+    for alert in pending:
+        groups.setdefault(alert['saved_search_id'], []).append(alert)
+
+    sent = 0
+    for alerts in groups.values():
+        search = {
+            'id': alerts[0]['saved_search_id'],
+            'name': alerts[0]['name'],
+            'email': alerts[0]['email'],
+            'webhook_url': alerts[0]['webhook_url'],
+        }
+        ids = [alert['alert_id'] for alert in alerts]
+        ads = [{key: value for key, value in alert.items() if key not in ALERT_FIELDS} for alert in alerts]
+
+        try:
+            deliver(search, ads)
+            db.set_alerts_sent(ids, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            sent += len(ids)
+        except Exception as e:
+            print(f"[Alerts] Delivery for '{search['name']}' failed: {e}")
+            db.set_alerts_failed(ids, str(e)[:500])
+
+    return sent
+
+
+def main():
+    from database import Database
+
+    parser = argparse.ArgumentParser(description='Saved searches and alerts')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='Save a search')
+    add.add_argument('name')
+    add.add_argument('--model', help='W123, W124 or W201')
+    add.add_argument('--year-from', type=int)
+    add.add_argument('--year-to', type=int)
+    add.add_argument('--max-price', type=float)
+    add.add_argument('--country', help='NL, DE, BE, ...')
+    add.add_argument('--features', help=f"Comma separated: {', '.join(FEATURES)}")
+    add.add_argument('--near', help='Place name or lat,lon')
+    add.add_argument('--radius-km', type=float)
+    add.add_argument('--email')
+    add.add_argument('--webhook-url')
+
+    commands.add_parser('list', help='Show saved searches')
+    delete = commands.add_parser('delete', help='Delete a saved search')
+    delete.add_argument('id', type=int)
+    commands.add_parser('deliver', help='Send pending alerts')
+
+    args = parser.parse_args()
+    db = Database()
+
+    if args.command == 'add':
+        try:
+            criteria = build_criteria(args.model, args.year_from, args.year_to, args.max_price, args.country,
+                                      args.features.split(',') if args.features else None,
+                                      args.near, args.radius_km)
+        except ValueError as e:
+            parser.error(str(e))
+        search_id = db.add_saved_search(args.name, criteria, args.email, args.webhook_url)
+        print(f"Saved search {search_id}: {args.name} {json.dumps(criteria)}")
+    elif args.command == 'list':
+        for search in db.get_saved_searches():
+            target = search['email'] or search['webhook_url'] or 'console'
+            print(f"{search['id']:>4}  {search['name']:<25} {target:<30} {search['criteria']}")
+    elif args.command == 'delete':
+        db.delete_saved_search(args.id)
+    elif args.command == 'deliver':
+        print(f"Sent {deliver_alerts(db)} alerts")
+
+
+if __name__ == '__main__':
+    main()
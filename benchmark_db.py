@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Benchmark the database layer
+
+Runs the hot paths of database.py against generated databases of several
+sizes, so a schema or index change can be judged on numbers:
+- upserts: add_advertisement one by one, add_advertisements in batches,
+  and a batched re-upsert of existing ads with new prices
+- reads: get_top_listings (year, price, deal and distance sort),
+  get_country_top_listings, get_statistics and get_pricing_data
+- responses: a 500-listing /api/listings body through dicts and
+  json.dumps (as jsonify does it) against Database.get_listings_json
+- lifecycle: mark_seen and mark_inactive_ads for a run that misses 5%
+  of the ads of every source
+
+The databases are filled by synthetic_data.py (with coordinates,
+duplicate clusters and deal scores) and kept in --dir, so the next run
+of the same size starts right away. Reads run on the database as built,
+upserts and the lifecycle on a scratch copy.
+
+Every benchmark reports the median and p95 in milliseconds per call
+(lower is better), upserts also rows per second. --output writes JSON,
+--compare flags benchmarks whose median got more than --threshold times
+slower than in a stored baseline and exits with status 1 if any did:
+
+    python benchmark_db.py --sizes 10000,100000 --output baseline.json
+    (change database.py)
+    python benchmark_db.py --sizes 10000,100000 --compare baseline.json
+
+Usage:
+    python benchmark_db.py                              # 10k and 100k rows
+    python benchmark_db.py --sizes 1000000 --repeat 5
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from synthetic_data import Generator, generate
+
+DATA_DIR = 'benchmark_data'
+
+# A regression must also cost this much, tiny timings are mostly noise
+MIN_REGRESSION_MS = 0.5
+
+
+def build_database(path, size):
+    """Generate a database of size synthetic ads with all derived data"""
+    from database import Database
+    from sources import refresh_derived_data
+
+    print(f"Building {path} ({size} ads)...")
+    db = Database(path + '.tmp')
+    generate(db, size, batch_size=10000)
+    refresh_derived_data(db)
+    os.replace(path + '.tmp', path)
+
+
+def database_path(directory, size, rebuild=False):
+    path = os.path.join(directory, f'ads-{size}.db')
+    if rebuild or not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        for stale in (path, path + '.tmp'):
+            if os.path.exists(stale):
+                os.remove(stale)
+        build_database(path, size)
+    return path
+
+
+def summarize(timings, rows=None):
+    """Median and p95 of timings in seconds, plus rows per second when each call wrote rows"""
+    timings = sorted(timings)
+    median = timings[len(timings) // 2]
+    result = {
+        'runs': len(timings),
+        'median_ms': median * 1000,
+        'p95_ms': timings[min(len(timings) - 1, int(0.95 * len(timings)))] * 1000,
+    }
+    if rows:
+        result['rows_per_second'] = rows / median
+    return result
+
+
+def timed(function, repeat, warmup=True):
+    if warmup:
+        function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def listings_response_dicts(db, limit=500):
+    """/api/listings body the old way: a dict per row, serialized like jsonify (sorted keys, compact)"""
+    listings = db.get_top_listings(limit)
+    return json.dumps({'success': True, 'count': len(listings), 'listings': listings},
+                      sort_keys=True, separators=(',', ':'))
+
+
+def listings_response_json(db, limit=500):
+    """/api/listings body as web_app.listings_response builds it from Database.get_listings_json"""
+    listings_json, count = db.get_listings_json(limit=limit)
+    envelope = json.dumps({'success': True, 'count': count})
+    return f'{envelope[:-1]}, "listings": {listings_json}}}'
+
+
+def read_benchmarks(db, repeat):
+    utrecht = (52.09, 5.12)
+    cases = {
+        'get_top_listings': lambda: db.get_top_listings(),
+        'get_top_listings_price': lambda: db.get_top_listings(sort='price'),
+        'get_top_listings_deal': lambda: db.get_top_listings(sort='deal'),
+        'get_top_listings_near': lambda: db.get_top_listings(sort='distance', near=utrecht, radius_km=150),
+        'get_top_listings_duplicates': lambda: db.get_top_listings(duplicates=True),
+        'get_country_top_listings_de': lambda: db.get_country_top_listings('DE'),
+        'get_country_top_listings_nl': lambda: db.get_country_top_listings('NL'),
+        'get_statistics': lambda: db.get_statistics(),
+        'listings_response_dicts': lambda: listings_response_dicts(db),
+        'listings_response_json': lambda: listings_response_json(db),
+        'get_pricing_data': lambda: db.get_pricing_data(),
+    }
+    return {name: summarize(timed(function, repeat)) for name, function in cases.items()}
+
+
+def write_benchmarks(db, size, repeat, rows):
+    """Upserts of new and changed ads; numbers from 2 * size so they do not collide with the generated ones"""
+    generator = Generator(seed=size)
+    numbers = itertools.count(size * 2)
+
+    def new_ads(count):
+        return [generator.ad(next(numbers)) for _ in range(count)]
+
+    results = {}
+
+    # One connection and commit per ad: the path of a single-ad caller
+    single_rows = max(rows // 10, 50)
+    timings = []
+    for _ in range(repeat):
+        ads = new_ads(single_rows)
+        start = time.perf_counter()
+        for ad in ads:
+            db.add_advertisement(ad)
+        timings.append(time.perf_counter() - start)
+    results['add_advertisement'] = summarize(timings, single_rows)
+
+    timings, written = [], []
+    for _ in range(repeat):
+        ads = new_ads(rows)
+        start = time.perf_counter()
+        db.add_advertisements(ads)
+        timings.append(time.perf_counter() - start)
+        written.append(ads)
+    results['add_advertisements'] = summarize(timings, rows)
+
+    # The same ads again with a new price: conflict path, listing_changes and triggers
+    timings = []
+    for ads in written:
+        for ad in ads:
+            ad['price'] = (ad['price'] or 5000) + 100
+        start = time.perf_counter()
+        db.add_advertisements(ads)
+        timings.append(time.perf_counter() - start)
+    results['add_advertisements_update'] = summarize(timings, rows)
+
+    return results
+
+
+def lifecycle_benchmarks(db, path, repeat):
+    """mark_seen and mark_inactive_ads for runs that miss 5% of each source's ads"""
+    conn = sqlite3.connect(path)
+    by_source = {}
+    for source, external_id in conn.execute('SELECT source, external_id FROM advertisements WHERE is_active = 1'):
+        by_source.setdefault(source, []).append(external_id)
+    conn.close()
+
+    # A first run that saw everything, so the timed runs have something to deactivate
+    db.mark_seen(db.start_scrape_run(list(by_source)), by_source)
+
+    seen_timings, inactive_timings = [], []
+    for _ in range(repeat):
+        seen = {source: ids[:len(ids) * 95 // 100] for source, ids in by_source.items()}
+        by_source = seen  # the next round misses 5% of what is left
+
+        run_id = db.start_scrape_run(list(seen))
+        start = time.perf_counter()
+        db.mark_seen(run_id, seen)
+        seen_timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        db.mark_inactive_ads(run_id, list(seen))
+        inactive_timings.append(time.perf_counter() - start)
+
+    return {'mark_seen': summarize(seen_timings), 'mark_inactive_ads': summarize(inactive_timings)}
+
+
+def run_size(directory, size, repeat, rows, rebuild=False):
+    from database import Database
+
+    path = database_path(directory, size, rebuild)
+    results = read_benchmarks(Database(path), repeat)
+
+    scratch = os.path.join(directory, f'ads-{size}-scratch.db')
+    shutil.copyfile(path, scratch)
+    try:
+        db = Database(scratch)
+        results.update(write_benchmarks(db, size, max(repeat // 4, 3), rows))
+        results.update(lifecycle_benchmarks(db, scratch, max(repeat // 4, 3)))
+    finally:
+        os.remove(scratch)
+
+    return results
+
+
+def baseline_ms(entry, before):
+    """Baseline median of a benchmark, upserts scaled to this run's batch size"""
+    if 'rows_per_second' in entry and 'rows_per_second' in before:
+        return entry['median_ms'] * entry['rows_per_second'] / before['rows_per_second']
+    return before['median_ms']
+
+
+def compare(results, baseline, threshold):
+    """[(size, benchmark, before_ms, after_ms)] of benchmarks that got slower than threshold"""
+    regressions = []
+    for size, benchmarks in results['sizes'].items():
+        for name, entry in benchmarks.items():
+            before = baseline.get('sizes', {}).get(size, {}).get(name)
+            if not before:
+                continue
+            before_ms = baseline_ms(entry, before)
+            if entry['median_ms'] > before_ms * threshold and entry['median_ms'] - before_ms > MIN_REGRESSION_MS:
+                regressions.append((size, name, before_ms, entry['median_ms']))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    for size, benchmarks in results['sizes'].items():
+        print(f"\n{int(size):,} ads")
+        print(f"  {'benchmark':<30} {'median':>10} {'p95':>10} {'rows/s':>10}" + (f" {'vs baseline':>12}" if baseline else ''))
+        for name, entry in benchmarks.items():
+            rate = f"{entry['rows_per_second']:>10,.0f}" if 'rows_per_second' in entry else f"{'':>10}"
+            line = f"  {name:<30} {entry['median_ms']:>8.2f}ms {entry['p95_ms']:>8.2f}ms {rate}"
+            before = (baseline or {}).get('sizes', {}).get(size, {}).get(name)
+            if before and before['median_ms']:
+                line += f" {(entry['median_ms'] / baseline_ms(entry, before) - 1) * 100:>+11.0f}%"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the database layer')
+    parser.add_argument('--sizes', default='10000,100000', help='Comma separated database sizes (default: 10000,100000)')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed calls per read benchmark (default: 20)')
+    parser.add_argument('--rows', type=int, default=5000, help='Ads per batched upsert (default: 5000)')
+    parser.add_argument('--dir', default=DATA_DIR, help=f'Where generated databases are kept (default: {DATA_DIR})')
+    parser.add_argument('--rebuild', action='store_true', help='Regenerate the databases')
+    parser.add_argument('--output', help='Write the results to a JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Flag benchmarks whose median is this many times slower (default: 1.25)')
+    args = parser.parse_args()
+
+    results = {
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'repeat': args.repeat,
+        'rows': args.rows,
+        'sizes': {},
+    }
+    for size in [int(size) for size in args.sizes.split(',')]:
+        results['sizes'][str(size)] = run_size(args.dir, size, args.repeat, args.rows, args.rebuild)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions (median more than {args.threshold}x the baseline):")
+            for size, name, before, after in regressions:
+                print(f"  {int(size):,} ads  {name:<30} {before:.2f}ms -> {after:.2f}ms")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
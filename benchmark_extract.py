@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark price/year/mileage extraction
+
+Compares the per-scraper functions that normalize.py replaced (copied
+below as legacy_*) with normalize's scalar and batch functions, on pages
+of listing texts generated from data/extract_corpus.tsv. Also prints how
+many golden corpus cases each implementation gets right.
+
+Usage:
+    python benchmark_extract.py
+    python benchmark_extract.py --pages 500 --page-size 40
+"""
+
+import argparse
+import random
+import re
+import time
+
+import normalize
+
+CORPUS_PATH = 'data/extract_corpus.tsv'
+
+
+# ============================================================================
+# The old implementations (fetch_real_data.py / scrape_extra_sources.py)
+# ============================================================================
+
+def legacy_extract_price(price_text):
+    if not price_text:
+        return None
+    price_clean = re.sub(r'[€$£\s.]', '', price_text)
+    price_clean = price_clean.replace(',', '.')
+    try:
+        match = re.search(r'\d+\.?\d*', price_clean)
+        if match:
+            return float(match.group())
+    except:
+        pass
+    return None
+
+
+def legacy_extract_year(text):
+    if not text:
+        return None
+
+    text = str(text)
+
+    ez_match = re.search(r'(?:EZ|Erstzulassung|Bj\.?|Baujahr|Bouwjaar)?\s*(\d{1,2})[/.-]?(19[789]\d|199[0-7])', text, re.IGNORECASE)
+    if ez_match:
+        return int(ez_match.group(2))
+
+    iso_match = re.search(r'(19[789]\d|199[0-7])[/-]\d{1,2}', text)
+    if iso_match:
+        return int(iso_match.group(1))
+
+    plain_match = re.search(r'(19[789]\d|199[0-7])', text)
+    return int(plain_match.group()) if plain_match else None
+
+
+def legacy_extract_mileage(text):
+    if not text:
+        return None
+    try:
+        match = re.search(r'(\d[\d.]*)\s*km', text.lower())
+        if match:
+            mileage_str = match.group(1).replace('.', '')
+            return int(mileage_str)
+    except:
+        pass
+    return None
+
+
+LEGACY = {'price': legacy_extract_price, 'year': legacy_extract_year, 'mileage': legacy_extract_mileage}
+SCALAR = {'price': normalize.parse_price, 'year': normalize.parse_year, 'mileage': normalize.parse_mileage}
+BATCH = {'price': normalize.parse_prices, 'year': normalize.parse_years, 'mileage': normalize.parse_mileages}
+
+
+def load_corpus():
+    """{kind: [(text, expected)]} for the kinds both implementations handle"""
+    corpus = {}
+    with open(CORPUS_PATH, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            kind, text, expected = line.rstrip('\n').split('\t')
+            if kind in LEGACY:
+                corpus.setdefault(kind, []).append((text, float(expected) if expected else None))
+    return corpus
+
+
+def make_pages(corpus, pages, page_size):
+    """Pages of texts: corpus strings with varied numbers, repeated like real result pages"""
+    rng = random.Random(42)
+    texts = {kind: [text for text, _ in cases] for kind, cases in corpus.items()}
+
+    def vary(text):
+        return re.sub(r'(?<=\d)\d', lambda match: str(rng.randint(0, 9)), text) if rng.random() < 0.5 else text
+
+    return {
+        kind: [[vary(rng.choice(strings)) for _ in range(page_size)] for _ in range(pages)]
+        for kind, strings in texts.items()
+    }
+
+
+def clear_caches():
+    normalize._parse_price.cache_clear()
+    normalize._parse_year.cache_clear()
+    normalize._parse_mileage.cache_clear()
+
+
+def timed(function, pages, batch=False):
+    """Seconds to parse all pages, starting with empty caches"""
+    clear_caches()
+    start = time.perf_counter()
+    for page in pages:
+        if batch:
+            function(page)
+        else:
+            for text in page:
+                function(text)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark price/year/mileage extraction')
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--page-size', type=int, default=25)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    pages = make_pages(corpus, args.pages, args.page_size)
+    count = args.pages * args.page_size
+
+    print(f"Golden corpus ({CORPUS_PATH}):")
+    for kind, cases in corpus.items():
+        legacy_ok = sum(1 for text, expected in cases if LEGACY[kind](text) == expected)
+        scalar_ok = sum(1 for text, expected in cases if SCALAR[kind](text) == expected)
+        print(f"  {kind:<8} legacy {legacy_ok:>3}/{len(cases)}   normalize {scalar_ok:>3}/{len(cases)}")
+
+    print(f"\nTiming, {args.pages} pages of {args.page_size} strings ({count} per kind):")
+    print(f"  {'kind':<8} {'legacy':>10} {'scalar':>10} {'batch':>10}")
+    for kind, kind_pages in pages.items():
+        legacy = timed(LEGACY[kind], kind_pages)
+        scalar = timed(SCALAR[kind], kind_pages)
+        batch = timed(BATCH[kind], kind_pages, batch=True)
+        print(f"  {kind:<8} {legacy * 1000:>8.1f}ms {scalar * 1000:>8.1f}ms {batch * 1000:>8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark startup time
+
+Imports what each entry point needs in a fresh interpreter with
+python -X importtime and reports the import time and the heaviest
+modules. Startup is what every CLI call and every WSGI worker boot pays,
+so each mode has modules it must not load: the web app has no use for
+the scrapers, --scrape-only none for Flask. A forbidden import fails the
+run (exit status 1), just like a mode that got more than --threshold
+times slower than in a baseline (--compare).
+
+    python benchmark_startup.py --output startup.json
+    python benchmark_startup.py --compare startup.json
+
+Usage:
+    python benchmark_startup.py
+    python benchmark_startup.py --repeat 10 --top 15
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# (code run in the fresh interpreter, modules it must not import)
+SCRAPER_MODULES = ['bs4', 'requests', 'numpy', 'fake_useragent', 'scrapers', 'sources']
+MODES = {
+    'cli': ('import main', SCRAPER_MODULES + ['flask', 'web_app', 'database']),
+    'wsgi': ('import web_app', SCRAPER_MODULES),
+    'web-only': ('import main; from web_app import app', SCRAPER_MODULES),
+    'scrape-only': ('import main; from scraper_manager import ScraperManager', ['flask', 'web_app']),
+}
+
+# Ignore changes smaller than this, interpreter startup jitters by a few ms
+MIN_REGRESSION_MS = 5
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us, depth)] from python -X importtime output"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def measure(code):
+    """Import time of the top-level imports and the modules loaded, in a fresh interpreter"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(f"{code!r} failed: {result.stderr.strip().splitlines()[-1]}")
+
+    imports = parse_importtime(result.stderr)
+    # Depth 0 are imports from site.py or the code itself; their cumulative times add up
+    total_us = sum(cumulative for _, _, cumulative, depth in imports if depth == 0)
+    return {'import_ms': total_us / 1000, 'modules': {name: cumulative / 1000 for name, _, cumulative, _ in imports}}
+
+
+def run_mode(code, forbidden, repeat):
+    """Best of repeat runs: slower runs measure other load on the machine, not the imports"""
+    runs = [measure(code) for _ in range(repeat)]
+    best = min(runs, key=lambda run: run['import_ms'])
+    modules = best['modules']
+    return {
+        'import_ms': best['import_ms'],
+        'module_count': len(modules),
+        'forbidden': sorted(module for module in forbidden if module in modules),
+        'heaviest': sorted(modules.items(), key=lambda item: item[1], reverse=True),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark import time per entry point')
+    parser.add_argument('--modes', default=','.join(MODES), help=f"Comma separated (default: {','.join(MODES)})")
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per mode, the fastest counts (default: 5)')
+    parser.add_argument('--top', type=int, default=8, help='Heaviest modules to show per mode')
+    parser.add_argument('--output', help='Write the results to a JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='Fail when a mode is this many times slower than the baseline (default: 1.5)')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = {}
+    failures = []
+    for mode in args.modes.split(','):
+        code, forbidden = MODES[mode]
+        result = results[mode] = run_mode(code, forbidden, args.repeat)
+
+        line = f"{mode:<18} {result['import_ms']:>7.1f}ms  {result['module_count']:>4} modules"
+        before = baseline.get(mode)
+        if before:
+            line += f"  {(result['import_ms'] / before['import_ms'] - 1) * 100:>+5.0f}% vs baseline"
+            if (result['import_ms'] > before['import_ms'] * args.threshold
+                    and result['import_ms'] - before['import_ms'] > MIN_REGRESSION_MS):
+                failures.append(f"{mode}: {before['import_ms']:.1f}ms -> {result['import_ms']:.1f}ms")
+        print(line)
+
+        # Packages only, submodules are included in their package's time
+        shown = [(name, ms) for name, ms in result['heaviest'] if '.' not in name][:args.top]
+        print('    ' + ', '.join(f"{name} {ms:.0f}ms" for name, ms in shown))
+        if result['forbidden']:
+            failures.append(f"{mode} imports {', '.join(result['forbidden'])}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({mode: {key: value for key, value in result.items() if key != 'heaviest'}
+                       for mode, result in results.items()}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if failures:
+        print('\nStartup regressions:')
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Content-hash change detection
+
+Most result pages are identical to the previous night's. Scrapers call
+page_unchanged() right after fetching a page and skip parsing when the
+normalized page hash matches the stored one. Hashes of parsed pages are
+kept in memory with remember_page() and written by save_page_hashes()
+after the ads have been saved, so a crashed run never hides a page.
+The ads of a skipped page still count as seen by the run: pop_unchanged_pages()
+returns their ids from the stored hash (see sources.seen_external_ids).
+
+Scrapers report a page they could not fetch or parse with page_failed()
+(or the site's base url when a whole search failed). The run did not see
+the ads on it, so pop_failed_pages() keeps its source from deactivating
+any (see sources.update_lifecycle).
+
+listing_hash() fingerprints the search-result fields of an ad; the
+upsert in Database.add_advertisement skips the write when it is unchanged.
+"""
+
+import hashlib
+import json
+import re
+import threading
+from urllib.parse import urlsplit
+
+import config
+import metrics
+
+# Parts of a page that change on every request without the listings changing
+VOLATILE_PATTERNS = [
+    re.compile(rb'\snonce="[^"]*"'),
+    re.compile(rb'<meta[^>]+csrf[^>]*>', re.IGNORECASE),
+    re.compile(rb'"(?:buildId|requestId|traceId|timestamp|serverTime)"\s*:\s*"?[\w\-:.]*"?'),
+]
+WHITESPACE_PATTERN = re.compile(rb'\s+')
+
+# Search-result fields that make up a listing's fingerprint
+HASHED_FIELDS = ['model', 'year', 'mileage', 'price', 'currency', 'location',
+                 'country', 'source_url', 'title', 'image_url']
+
+_pending = {}
+_unchanged = {}
+_failed = {}
+_pending_lock = threading.Lock()
+_db = None
+
+
+def page_hash(content):
+    """SHA-1 of a page with volatile tokens and whitespace removed"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+
+    for pattern in VOLATILE_PATTERNS:
+        content = pattern.sub(b'', content)
+    content = WHITESPACE_PATTERN.sub(b' ', content)
+
+    return hashlib.sha1(content).hexdigest()
+
+
+def listing_hash(ad):
+    """SHA-1 of the search-result fields of an ad"""
+    values = [ad.get(field) for field in HASHED_FIELDS]
+    return hashlib.sha1(json.dumps(values, default=str).encode('utf-8')).hexdigest()
+
+
+def _get_db():
+    global _db
+    if _db is None:
+        from database import Database
+        _db = Database()
+    return _db
+
+
+def page_unchanged(url, content):
+    """True if the page has the same hash as on the last completed run"""
+    if not config.SKIP_UNCHANGED_PAGES:
+        return False
+
+    stored = _get_db().get_page_hash(url)
+    if stored is None or stored['hash'] != page_hash(content):
+        return False
+
+    with _pending_lock:
+        _unchanged[url] = stored['external_ids']
+    metrics.PAGES_UNCHANGED.inc(host=urlsplit(url).netloc.lower())
+    return True
+
+
+def remember_page(url, content, external_ids):
+    """Queue the hash of a parsed page and the ads found on it"""
+    with _pending_lock:
+        _pending[url] = (page_hash(content), list(external_ids))
+
+
+def save_page_hashes(db=None):
+    """Write queued page hashes (call after the ads have been saved)"""
+    with _pending_lock:
+        pages = dict(_pending)
+        _pending.clear()
+
+    if pages:
+        (db or _get_db()).save_page_hashes(pages)
+    return len(pages)
+
+
+def pop_unchanged_pages():
+    """{url: external_ids} of the pages skipped as unchanged since the last call"""
+    with _pending_lock:
+        pages = dict(_unchanged)
+        _unchanged.clear()
+    return pages
+
+
+def page_failed(url, error):
+    """Record a page that could not be scraped, with the reason"""
+    with _pending_lock:
+        _failed[url] = str(error)
+
+
+def pop_failed_pages():
+    """{url: error} of the pages that failed since the last call"""
+    with _pending_lock:
+        pages = dict(_failed)
+        _failed.clear()
+    return pages
@@ -1,5 +1,7 @@
 # Configuration for Mercedes 190/200 Series Diesel Search
 
+import os
+
 # Search parameters
 MODELS = ['W123', 'W124', 'W201']  # W123 = 200-serie, W124 = 200-serie, W201 = 190-serie
 FUEL_TYPES = ['Diesel']
@@ -74,11 +76,117 @@ MARKETPLACES = {
 # Scraping configuration
 UPDATE_TIME = "06:00"
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+# Rotated by http_client.build_headers()
+USER_AGENTS = [
+    USER_AGENT,
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0",
+]
 REQUEST_TIMEOUT = 30
 REQUEST_DELAY = 2  # seconds between requests
 
+# HTTP response cache (shared by all scrapers, see http_client.py)
+HTTP_CACHE_ENABLED = True
+HTTP_CACHE_PATH = 'http_cache.db'
+HTTP_CACHE_TTL = 6 * 3600  # seconds a cached page is served without revalidation
+HTTP_CACHE_MAX_AGE = 7 * 24 * 3600  # entries older than this are pruned
+
+# Connection reuse (one pooled keep-alive session per host)
+HTTP_POOL_SIZE = 4  # connections kept open per host
+HTTP2_ENABLED = False  # requires: pip install httpx[http2]
+DNS_CACHE_ENABLED = True
+DNS_CACHE_TTL = 300  # seconds
+
+# Concurrent fetching (http_client.fetch_many)
+FETCH_WORKERS = 8
+FETCH_PER_HOST = 2  # max parallel requests to one site
+
+# Source runner (sources.py)
+STATIC_SOURCE_WORKERS = 4  # plain HTTP sources scraped at the same time
+BROWSER_POOL_SIZE = 2  # Chrome instances running at the same time
+
+# Skip parsing result pages whose content hash did not change (change_detection.py)
+SKIP_UNCHANGED_PAGES = True
+
+# Listing lifecycle (see Database.mark_inactive_ads and archive_inactive_ads)
+DEACTIVATE_MISSING_ADS = True  # ads a successful source no longer lists become inactive
+ARCHIVE_AFTER_DAYS = 90  # inactive ads are moved to advertisements_archive after this many days
+
+# Detail page enrichment (see enrichment.py)
+ENRICH_DETAILS = True
+ENRICH_MAX_PER_RUN = 200  # detail pages fetched per entry point run
+
+# Image thumbnails and hashes (see image_cache.py, requires Pillow)
+THUMBNAIL_DIR = 'thumbnails'
+THUMBNAIL_SIZE = (240, 180)  # max width, height in pixels
+THUMBNAIL_QUALITY = 70  # WebP quality
+IMAGE_MAX_PER_RUN = 500
+IMAGE_WORKER_INTERVAL = 15  # minutes between background runs of the scheduler
+
+# Duplicate detection across sources (see dedup.py)
+DEDUP_MILEAGE_BUCKET = 5000  # km
+DEDUP_PRICE_BUCKET = 500  # EUR
+DEDUP_MAX_BLOCK = 50  # larger blocks are not compared
+DEDUP_THRESHOLD = 0.75  # match score needed to merge two listings
+DEDUP_IMAGE_DISTANCE = 6  # max differing bits between image hashes of one car
+
+# Deal scoring (see deal_score.py)
+DEAL_MIN_SAMPLES = 20  # priced ads needed to fit a model for one chassis
+
+# Saved search alerts (see alerts.py)
+ALERT_WORKER_INTERVAL = 5  # minutes between outbox deliveries by the scheduler
+ALERT_BATCH_SIZE = 200  # alerts sent per delivery run
+ALERT_MAX_ATTEMPTS = 5  # failed deliveries are retried this many times
+SMTP_HOST = os.environ.get('SMTP_HOST')  # e-mail alerts are printed when not set
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+SMTP_STARTTLS = True
+SMTP_USER = os.environ.get('SMTP_USER')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_FROM = os.environ.get('SMTP_FROM', 'mercedes-finder@localhost')
+
+# Currencies (see currency.py), prices are converted to EUR when stored
+COUNTRY_CURRENCY = {'NL': 'EUR', 'DE': 'EUR', 'BE': 'EUR', 'FR': 'EUR', 'AT': 'EUR', 'PL': 'PLN', 'CZ': 'CZK'}
+FX_RATES = {}  # overrides for data/fx_rates.tsv, e.g. {'PLN': 0.23} (euros per unit)
+
+# Metrics (see metrics.py), served by the web app on /metrics
+METRICS_ENABLED = True
+METRICS_DIR = 'metrics'  # snapshots written at the end of every scrape run
+
+# Scrape history trend (see scrape_history.py)
+SCRAPE_TREND_RUNS = 7  # earlier runs the last run is compared with
+SCRAPE_SLOWDOWN_FACTOR = 3  # last run this many times the median is flagged
+
+# Profiling (see profiling.py): --profile on main.py / unified_scraper_v2.py and /debug/profile
+PROFILE_DIR = 'profiles'
+PROFILE_SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+PROFILE_ENDPOINT_ENABLED = os.environ.get('PROFILE_ENDPOINT_ENABLED') == '1'  # /debug/profile answers 404 otherwise
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')  # required as ?token= when set
+PROFILE_MAX_SECONDS = 60
+
 # Database
-DB_PATH = 'mercedes_diesel.db'
+DB_PATH = os.environ.get('DB_PATH', 'mercedes_diesel.db')  # e.g. a synthetic_data.py database for load tests
+
+# Schema migrations (see migrations.py)
+AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '1') == '1'  # 0: refuse to start until `python migrations.py` ran
+MIGRATION_BATCH_SIZE = 5000  # rows per backfill transaction
+MIGRATION_BATCH_PAUSE = 0.05  # seconds between backfill batches, lets other writers in
+MIGRATION_LOCK_TIMEOUT = 600  # seconds to wait for another process's migration
+
+# Read snapshots and backups (see snapshot.py)
+SNAPSHOT_READS = os.environ.get('SNAPSHOT_READS') == '1'  # web app reads listings from the latest snapshot
+SNAPSHOT_IN_MEMORY = os.environ.get('SNAPSHOT_IN_MEMORY') == '1'  # load each snapshot into the web process's memory
+SNAPSHOT_DIR = 'snapshots'
+SNAPSHOT_INTERVAL = 15  # minutes between snapshots, one is also made after every scrape
+BACKUP_DIR = 'backups'
+BACKUP_KEEP = 14  # compressed backups kept, oldest are deleted
+BACKUP_IN_APP = os.environ.get('BACKUP_IN_APP') == '1'  # daily backup by the app's scheduler instead of cron
+BACKUP_HOUR = 3  # hour of that backup
+
+# Export (see export.py)
+EXPORT_CHUNK_SIZE = 50000  # rows per query and per Parquet row group / Arrow record batch
 
 # Web server
 FLASK_HOST = '0.0.0.0'
@@ -0,0 +1,66 @@
+"""
+Currencies and conversion to euros
+
+Marketplaces in PL (Otomoto, OLX) and CZ (Sauto) list prices in PLN and
+CZK. Every ad keeps its original price and currency, and the database
+stores price_eur next to them when the ad is written. Listing filters,
+sorts, statistics, duplicate detection and deal scores all use price_eur.
+
+Rates come from the fx_rates table, filled from data/fx_rates.tsv with
+single rates overridden by config.FX_RATES. Database.sync_fx_rates()
+reloads them and recomputes price_eur of ads whose rate changed.
+"""
+
+import os
+import re
+
+import config
+
+FX_RATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'fx_rates.tsv')
+
+# Currency written on a price, checked before the country default
+CURRENCY_PATTERNS = [
+    ('PLN', re.compile(r'zł|\bzl\b|\bpln\b', re.IGNORECASE)),
+    ('CZK', re.compile(r'kč|\bkc\b|\bczk\b', re.IGNORECASE)),
+    ('HUF', re.compile(r'\bft\b|\bhuf\b', re.IGNORECASE)),
+    ('CHF', re.compile(r'\bchf\b|\bfr\.', re.IGNORECASE)),
+    ('GBP', re.compile(r'£|\bgbp\b', re.IGNORECASE)),
+    ('EUR', re.compile(r'€|\beur\b|\beuro\b', re.IGNORECASE)),
+]
+
+
+def load_rates(path=FX_RATES_PATH):
+    """{currency: euros per unit} from the rates file plus config.FX_RATES"""
+    rates = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('#') or not line.strip():
+                    continue
+                currency, rate = line.split()[:2]
+                rates[currency.upper()] = float(rate)
+
+    rates.update({currency.upper(): rate for currency, rate in config.FX_RATES.items()})
+    rates['EUR'] = 1.0
+    return rates
+
+
+def country_currency(country):
+    """Currency prices are listed in for a country code"""
+    return config.COUNTRY_CURRENCY.get((country or '').upper(), 'EUR')
+
+
+def detect_currency(price_text, country=None):
+    """Currency of a price text like '25 000 zł', defaulting to the country's currency"""
+    for currency, pattern in CURRENCY_PATTERNS:
+        if price_text and pattern.search(price_text):
+            return currency
+    return country_currency(country)
+
+
+def to_eur(price, currency, rates):
+    """Price in euros, None when the price or the rate is unknown"""
+    rate = rates.get((currency or 'EUR').upper())
+    if price is None or rate is None:
+        return None
+    return round(price * rate, 2)
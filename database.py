@@ -1,6 +1,135 @@
+import json
+import re
 import sqlite3
 from datetime import datetime
 import config
+import metrics
+import migrations
+from change_detection import listing_hash
+from currency import country_currency, load_rates, to_eur
+from geocode import bounding_box, geocode, haversine
+from migrations import SCRAPE_STATS_COLUMNS
+
+# Insert a new ad or refresh an existing one (see Database.add_advertisement)
+UPSERT_SQL = '''
+    INSERT INTO advertisements
+    (external_id, model, year, mileage, price, currency, location,
+     country, source, source_url, title, description, image_url,
+     transmission, body_type, details_fetched_at, content_hash,
+     latitude, longitude, price_eur)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(external_id) DO UPDATE SET
+        price = excluded.price,
+        currency = excluded.currency,
+        price_eur = excluded.price_eur,
+        mileage = COALESCE(excluded.mileage, advertisements.mileage),
+        description = COALESCE(NULLIF(excluded.description, ''), advertisements.description),
+        transmission = COALESCE(excluded.transmission, advertisements.transmission),
+        body_type = COALESCE(excluded.body_type, advertisements.body_type),
+        location = CASE WHEN excluded.details_fetched_at IS NOT NULL
+                        THEN COALESCE(NULLIF(excluded.location, ''), advertisements.location)
+                        ELSE advertisements.location END,
+        latitude = CASE WHEN excluded.details_fetched_at IS NOT NULL AND excluded.latitude IS NOT NULL
+                        THEN excluded.latitude
+                        ELSE COALESCE(advertisements.latitude, excluded.latitude) END,
+        longitude = CASE WHEN excluded.details_fetched_at IS NOT NULL AND excluded.latitude IS NOT NULL
+                         THEN excluded.longitude
+                         ELSE COALESCE(advertisements.longitude, excluded.longitude) END,
+        details_fetched_at = COALESCE(excluded.details_fetched_at, advertisements.details_fetched_at),
+        content_hash = excluded.content_hash,
+        date_updated = CURRENT_TIMESTAMP,
+        is_active = 1
+    WHERE advertisements.content_hash IS NOT excluded.content_hash
+       OR advertisements.is_active = 0
+       OR excluded.details_fetched_at IS NOT NULL
+'''
+
+# bm25() weights for title, description, model, location
+FTS_WEIGHTS = (10.0, 1.0, 5.0, 2.0)
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word must match as a prefix
+
+    Words are quoted, so user input can never break the FTS5 syntax.
+    """
+    words = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+# Listing queries keep one row per vehicle (see dedup.py): the cheapest
+# listing of each cluster, with the number of listings for that car.
+COLLAPSE_CLUSTERS_SQL = '''
+    SELECT * FROM (
+        SELECT *,
+            ROW_NUMBER() OVER vehicle AS cluster_rank,
+            COUNT(*) OVER (PARTITION BY COALESCE(vehicle_cluster_id, id)) AS duplicate_count
+        FROM ({query})
+        WINDOW vehicle AS (PARTITION BY COALESCE(vehicle_cluster_id, id)
+                           ORDER BY price_eur IS NULL, price_eur, date_updated DESC)
+    )
+    WHERE cluster_rank = 1
+'''
+
+
+# ORDER BY clauses for the listing endpoints
+LISTING_SORTS = {
+    'year': 'year DESC, date_updated DESC',  # newest build year first
+    'deal': 'deal_score IS NULL, deal_score ASC',  # cheapest for the market first
+    'price': 'price_eur IS NULL, price_eur ASC',  # cheapest first, in euros
+    'distance': 'distance_km ASC',  # only with near
+}
+
+
+class Row:
+    """Compact read-only row for bulk reads
+
+    Holds the values tuple and a {column: position} index shared by all
+    rows of a query, so it costs a fraction of a dict per row while
+    reading like one: row['price_eur'], row.get('model'), dict(row).
+    """
+    __slots__ = ('values', 'index')
+
+    def __init__(self, values, index):
+        self.values = values
+        self.index = index
+
+    def __getitem__(self, column):
+        return self.values[self.index[column]]
+
+    def get(self, column, default=None):
+        position = self.index.get(column)
+        return default if position is None else self.values[position]
+
+    def keys(self):
+        return self.index.keys()
+
+    def __contains__(self, column):
+        return column in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return f'Row({dict(self)!r})'
+
+
+def fetch_rows(cursor):
+    """All rows of an executed cursor as Rows"""
+    index = {description[0]: position for position, description in enumerate(cursor.description)}
+    return [Row(values, index) for values in cursor.fetchall()]
+
+
+def json_rows(conn, query, params=()):
+    """Rows of a query as a JSON array of objects built by SQLite, returns (JSON text, row count)"""
+    # Preparing with LIMIT 0 gives the column names without running the query
+    columns = [description[0] for description in conn.execute(f'SELECT * FROM ({query}) LIMIT 0', params).description]
+    fields = ', '.join(f"'{column}', \"{column}\"" for column in columns)
+    rows = conn.execute(f'SELECT json_object({fields}) FROM ({query})', params).fetchall()
+    return '[' + ','.join(row[0] for row in rows) + ']', len(rows)
+
 
 class Database:
     def __init__(self, db_path=config.DB_PATH):
@@ -11,79 +140,78 @@ class Database:
         return sqlite3.connect(self.db_path)
 
     def init_db(self):
-        """Initialize database with required tables"""
+        """Apply pending schema migrations (see migrations.py) and sync the exchange rates
+
+        With config.AUTO_MIGRATE off, a database with pending migrations
+        raises RuntimeError until they are applied with migrations.py.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS advertisements (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                external_id TEXT UNIQUE,
-                model TEXT NOT NULL,
-                year INTEGER,
-                mileage INTEGER,
-                price REAL,
-                currency TEXT DEFAULT 'EUR',
-                location TEXT,
-                country TEXT,
-                source TEXT,
-                source_url TEXT,
-                title TEXT,
-                description TEXT,
-                image_url TEXT,
-                date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                date_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS scrape_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                scrape_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                country TEXT,
-                source TEXT,
-                ads_found INTEGER,
-                ads_new INTEGER,
-                status TEXT
-            )
-        ''')
+        try:
+            if migrations.pending(conn):
+                if not config.AUTO_MIGRATE:
+                    raise RuntimeError(f"Database {self.db_path} is at schema version "
+                                       f"{migrations.current_version(conn)} of {migrations.latest_version()}, "
+                                       f"run: python migrations.py --db {self.db_path}")
+                migrations.migrate(conn)
+
+            self.sync_fx_rates(cursor)
+            conn.commit()
+        finally:
+            conn.close()
 
-        conn.commit()
-        conn.close()
+    def sync_fx_rates(self, cursor):
+        """Load exchange rates into fx_rates and recompute price_eur for currencies whose rate changed
+
+        The recompute is a migrations.backfill() in batches, and the new
+        rates are stored after it, so a start that is interrupted halfway
+        still sees the rates as changed next time and only updates the rows
+        that were not done yet.
+        """
+        rates = load_rates()
+
+        cursor.execute('SELECT currency, rate_to_eur FROM fx_rates')
+        stored = dict(cursor.fetchall())
+        changed = [currency for currency, rate in rates.items() if stored.get(currency) != rate]
+
+        if changed:
+            rate = f"CASE COALESCE(currency, 'EUR') {' '.join('WHEN ? THEN ?' for _ in changed)} END"
+            rate_params = [value for currency in changed for value in (currency, rates[currency])]
+            placeholders = ','.join('?' * len(changed))
+            migrations.backfill(
+                cursor.connection, 'advertisements', f'price_eur = ROUND(price * {rate}, 2)',
+                where=f"price IS NOT NULL AND COALESCE(currency, 'EUR') IN ({placeholders}) "
+                      f"AND price_eur IS NOT ROUND(price * {rate}, 2)",
+                params=[*rate_params, *changed, *rate_params])
+
+            cursor.executemany('''
+                INSERT OR REPLACE INTO fx_rates (currency, rate_to_eur, date_updated)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            ''', [(currency, rates[currency]) for currency in changed])
+
+        self.fx_rates = {**stored, **rates}
 
     def add_advertisement(self, ad_data):
-        """Add or update an advertisement"""
+        """Add or update an advertisement
+
+        Details from a detail page (mileage, description, transmission,
+        body type) are never overwritten by the emptier search-result
+        version of the same ad. Location is only replaced by enriched data.
+        The price is also stored in euros (price_eur) at the current rate.
+
+        When the listing hash is unchanged (and the ad is active and not
+        freshly enriched) the row is left alone, so date_updated keeps
+        pointing at the last real change.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
 
         try:
-            cursor.execute('''
-                INSERT INTO advertisements
-                (external_id, model, year, mileage, price, currency, location,
-                 country, source, source_url, title, description, image_url)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(external_id) DO UPDATE SET
-                    price = excluded.price,
-                    mileage = excluded.mileage,
-                    date_updated = CURRENT_TIMESTAMP,
-                    is_active = 1
-            ''', (
-                ad_data.get('external_id'),
-                ad_data.get('model'),
-                ad_data.get('year'),
-                ad_data.get('mileage'),
-                ad_data.get('price'),
-                ad_data.get('currency', 'EUR'),
-                ad_data.get('location'),
-                ad_data.get('country'),
-                ad_data.get('source'),
-                ad_data.get('source_url'),
-                ad_data.get('title'),
-                ad_data.get('description'),
-                ad_data.get('image_url')
-            ))
-            conn.commit()
+            with metrics.DB_WRITE_SECONDS.time(operation='add_advertisement'):
+                cursor.execute(UPSERT_SQL, self.advertisement_params(ad_data))
+                conn.commit()
+            metrics.DB_ROWS_WRITTEN.inc(cursor.rowcount, operation='add_advertisement')
             return True
         except Exception as e:
             print(f"Error adding advertisement: {e}")
@@ -91,6 +219,208 @@ class Database:
         finally:
             conn.close()
 
+    def add_advertisements(self, ads):
+        """Add or update many advertisements in one transaction
+
+        Returns the number of rows actually written (unchanged ads are
+        skipped by the listing hash).
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            params = [self.advertisement_params(ad) for ad in ads]
+            with metrics.DB_WRITE_SECONDS.time(operation='add_advertisements'):
+                cursor.executemany(UPSERT_SQL, params)
+                conn.commit()
+            metrics.DB_ROWS_WRITTEN.inc(cursor.rowcount, operation='add_advertisements')
+            return cursor.rowcount
+        except Exception as e:
+            conn.rollback()
+            print(f"Error adding advertisements: {e}")
+            return 0
+        finally:
+            conn.close()
+
+    def advertisement_params(self, ad_data):
+        """Bind parameters for UPSERT_SQL"""
+        latitude, longitude = geocode(ad_data.get('location'), ad_data.get('country')) or (None, None)
+        currency = ad_data.get('currency') or country_currency(ad_data.get('country'))
+
+        return (
+            ad_data.get('external_id'),
+            ad_data.get('model'),
+            ad_data.get('year'),
+            ad_data.get('mileage'),
+            ad_data.get('price'),
+            currency,
+            ad_data.get('location'),
+            ad_data.get('country'),
+            ad_data.get('source'),
+            ad_data.get('source_url'),
+            ad_data.get('title'),
+            ad_data.get('description'),
+            ad_data.get('image_url'),
+            ad_data.get('transmission'),
+            ad_data.get('body_type'),
+            ad_data.get('details_fetched_at'),
+            ad_data.get('content_hash') or listing_hash(ad_data),
+            latitude,
+            longitude,
+            to_eur(ad_data.get('price'), currency, self.fx_rates)
+        )
+
+    def get_known_advertisements(self, external_ids):
+        """Get price, title and enrichment state for ads already in the database"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        known = {}
+        external_ids = list(external_ids)
+
+        # Chunked to stay below SQLite's bound-variable limit
+        for start in range(0, len(external_ids), 500):
+            chunk = external_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f'''
+                SELECT external_id, price, title, details_fetched_at
+                FROM advertisements
+                WHERE external_id IN ({placeholders})
+            ''', chunk)
+
+            for external_id, price, title, details_fetched_at in cursor.fetchall():
+                known[external_id] = {
+                    'price': price,
+                    'title': title,
+                    'details_fetched_at': details_fetched_at
+                }
+
+        conn.close()
+        return known
+
+    def get_page_hash(self, url):
+        """Get the stored hash and ad ids of a search result page"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT hash, external_ids FROM page_hashes WHERE url = ?', (url,))
+        row = cursor.fetchone()
+
+        conn.close()
+
+        if not row:
+            return None
+        return {'hash': row[0], 'external_ids': json.loads(row[1] or '[]')}
+
+    def save_page_hashes(self, pages):
+        """Store page hashes: {url: (hash, external_ids)}"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany('''
+            INSERT OR REPLACE INTO page_hashes (url, hash, external_ids, date_checked)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', [(url, page_hash, json.dumps(ids)) for url, (page_hash, ids) in pages.items()])
+
+        conn.commit()
+        conn.close()
+
+    def search(self, text, page=1, per_page=20, country=None):
+        """Full-text search over title, description, model and location
+
+        Returns (listings for the page ordered by relevance, total matches).
+        """
+        query = fts_query(text)
+        if not query:
+            return [], 0
+
+        where = '''
+            FROM advertisements_fts
+            JOIN advertisements a ON a.id = advertisements_fts.rowid
+            WHERE advertisements_fts MATCH ?
+            AND a.is_active = 1
+            AND a.external_id NOT LIKE 'search_%'
+        '''
+        params = [query]
+
+        if country:
+            where += ' AND a.country = ?'
+            params.append(country)
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(f'SELECT COUNT(*) {where}', params)
+        total = cursor.fetchone()[0]
+
+        cursor.execute(f'''
+            SELECT a.*, bm25(advertisements_fts, {', '.join(map(str, FTS_WEIGHTS))}) AS rank
+            {where}
+            ORDER BY rank
+            LIMIT ? OFFSET ?
+        ''', params + [per_page, (page - 1) * per_page])
+
+        columns = [description[0] for description in cursor.description]
+        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        conn.close()
+        return results, total
+
+    def get_changes(self, after=0, limit=1000):
+        """Get change log entries after a seq, oldest first, with the current state of their ad"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT c.seq, c.change_type, c.old_value, c.new_value, c.changed_at, c.advertisement_id,
+                   a.external_id, a.title, a.model, a.year, a.mileage, a.price, a.currency, a.price_eur,
+                   a.location, a.country, a.source, a.source_url, a.is_active
+            FROM listing_changes c
+            LEFT JOIN advertisements a ON a.id = c.advertisement_id
+            WHERE c.seq > ?
+            ORDER BY c.seq
+            LIMIT ?
+        ''', (after, limit))
+
+        columns = [description[0] for description in cursor.description]
+        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        conn.close()
+        return results
+
+    def get_unprocessed_images(self, limit=200):
+        """Get active ads whose image has not been downloaded yet"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT id, image_url FROM advertisements
+            WHERE is_active = 1
+            AND image_url IS NOT NULL AND image_url != ''
+            AND images_processed_at IS NULL
+            ORDER BY date_added DESC
+            LIMIT ?
+        ''', (limit,))
+
+        results = [{'id': row[0], 'image_url': row[1]} for row in cursor.fetchall()]
+
+        conn.close()
+        return results
+
+    def set_image_results(self, results):
+        """Store thumbnails and hashes: [(thumbnail_path, image_hash, processed_at, id)]"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany('''
+            UPDATE advertisements
+            SET thumbnail_path = ?, image_hash = ?, images_processed_at = ?
+            WHERE id = ?
+        ''', results)
+
+        conn.commit()
+        conn.close()
+
     def get_active_advertisements(self, country=None, limit=None):
         """Get active advertisements, optionally filtered by country"""
         conn = self.get_connection()
@@ -118,23 +448,152 @@ class Database:
         conn.close()
         return results
 
-    def get_top_listings(self, limit=500):
-        """Get top listings sorted by date and relevance"""
+    def get_top_listings(self, limit=500, duplicates=False, sort='year', near=None, radius_km=100):
+        """Get top listings sorted by date and relevance
+
+        Listings of the same vehicle are collapsed unless duplicates is True.
+        """
+        return self.get_listings(limit=limit, duplicates=duplicates, sort=sort, near=near, radius_km=radius_km)
+
+    def get_country_top_listings(self, country, limit=100, duplicates=False, sort='year', near=None, radius_km=100):
+        """Get top listings for a specific country"""
+        return self.get_listings(country=country, limit=limit, duplicates=duplicates, sort=sort,
+                                 near=near, radius_km=radius_km)
+
+    def get_listings(self, country=None, limit=500, duplicates=False, sort='year', near=None, radius_km=100):
+        """Get active listings, one row per vehicle unless duplicates is True
+
+        near is a (latitude, longitude) point: only listings within
+        radius_km are returned, with their distance_km.
+        """
         conn = self.get_connection()
+        conn.create_function('haversine', 4, haversine, deterministic=True)
         cursor = conn.cursor()
 
+        cursor.execute(*self.listings_query(country, limit, duplicates, sort, near, radius_km))
+        columns = [description[0] for description in cursor.description]
+        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        conn.close()
+        return results
+
+    def get_listings_json(self, country=None, limit=500, duplicates=False, sort='year', near=None, radius_km=100):
+        """get_listings as a JSON array built by SQLite, returns (JSON text, number of listings)
+
+        For the API: skips the dict per row and jsonify walking them again.
+        Reals have 15 significant digits, like SQLite prints them.
+        """
+        conn = self.get_connection()
+        conn.create_function('haversine', 4, haversine, deterministic=True)
+
+        results = json_rows(conn, *self.listings_query(country, limit, duplicates, sort, near, radius_km))
+
+        conn.close()
+        return results
+
+    def listings_query(self, country=None, limit=500, duplicates=False, sort='year', near=None, radius_km=100):
+        """(query, params) of get_listings, the connection needs the haversine function"""
+        params = []
+        distance = ''
+        if near:
+            distance = ', haversine(latitude, longitude, ?, ?) AS distance_km'
+            params.extend(near)
+
         # Only show 190/200 series diesels from 1979-1986
         # Price > 500 to filter out parts/junk
-        # Sort by year DESC (newest first)
-        cursor.execute('''
-            SELECT * FROM advertisements
+        query = f'''
+            SELECT *{distance} FROM advertisements
             WHERE is_active = 1
             AND external_id NOT LIKE 'search_%'
             AND (year IS NULL OR (year >= 1979 AND year <= 1986))
-            AND (price IS NULL OR price > 500)
-            ORDER BY year DESC, date_updated DESC
-            LIMIT ?
-        ''', (limit,))
+            AND (price_eur IS NULL OR price_eur > 500)
+        '''
+
+        if country:
+            query += ' AND country = ?'
+            params.append(country)
+
+        if near:
+            # Bounding box uses the index, haversine drops the corners
+            query += '''
+                AND latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?
+                AND haversine(latitude, longitude, ?, ?) <= ?
+            '''
+            params.extend(bounding_box(near[0], near[1], radius_km))
+            params.extend([near[0], near[1], radius_km])
+
+        if not duplicates:
+            query = COLLAPSE_CLUSTERS_SQL.format(query=query)
+
+        if sort == 'distance' and not near:
+            sort = 'year'
+        query += f' ORDER BY {LISTING_SORTS.get(sort, LISTING_SORTS["year"])} LIMIT ?'
+        params.append(limit)
+        return query, params
+
+    def get_ungeocoded_advertisements(self):
+        """Get ads with a location but no coordinates"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT id, location, country FROM advertisements
+            WHERE latitude IS NULL AND location IS NOT NULL AND location != ''
+        ''')
+
+        results = [{'id': row[0], 'location': row[1], 'country': row[2]} for row in cursor.fetchall()]
+
+        conn.close()
+        return results
+
+    def set_coordinates(self, coordinates):
+        """Store coordinates: [(latitude, longitude, id)]"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany('UPDATE advertisements SET latitude = ?, longitude = ? WHERE id = ?', coordinates)
+
+        conn.commit()
+        conn.close()
+
+    def get_pricing_data(self):
+        """Get the fields deal scoring needs for every ad ever seen"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT id, model, year, mileage, price_eur, country, body_type
+            FROM advertisements
+            WHERE external_id NOT LIKE 'search_%'
+        ''')
+
+        results = fetch_rows(cursor)
+
+        conn.close()
+        return results
+
+    def set_deal_scores(self, scores):
+        """Store deal scores: [(expected_price, deal_score, id)]"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany(
+            'UPDATE advertisements SET expected_price = ?, deal_score = ? WHERE id = ?',
+            scores
+        )
+
+        conn.commit()
+        conn.close()
+
+    def get_dedup_candidates(self):
+        """Get the fields duplicate detection needs for all active ads"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT * FROM advertisements
+            WHERE is_active = 1 AND external_id NOT LIKE 'search_%'
+        ''')
 
         columns = [description[0] for description in cursor.description]
         results = [dict(zip(columns, row)) for row in cursor.fetchall()]
@@ -142,24 +601,138 @@ class Database:
         conn.close()
         return results
 
-    def get_country_top_listings(self, country, limit=100):
-        """Get top listings for a specific country"""
+    def set_vehicle_clusters(self, clusters):
+        """Store vehicle clusters: {advertisement id: cluster id}"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany('''
+            UPDATE advertisements SET vehicle_cluster_id = ?
+            WHERE id = ? AND vehicle_cluster_id IS NOT ?
+        ''', [(cluster_id, ad_id, cluster_id) for ad_id, cluster_id in clusters.items()])
+
+        conn.commit()
+        conn.close()
+
+    def add_saved_search(self, name, criteria, email=None, webhook_url=None):
+        """Save a search, it only alerts about ads changed from now on"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        # Only show 190/200 series diesels from 1979-1986
-        # Price > 500 to filter out parts/junk
-        # Sort by year DESC (newest first)
         cursor.execute('''
-            SELECT * FROM advertisements
-            WHERE is_active = 1
-            AND external_id NOT LIKE 'search_%'
-            AND country = ?
-            AND (year IS NULL OR (year >= 1979 AND year <= 1986))
-            AND (price IS NULL OR price > 500)
-            ORDER BY year DESC, date_updated DESC
+            INSERT INTO saved_searches (name, criteria, email, webhook_url, last_change_seq)
+            VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(seq), 0) FROM listing_changes))
+        ''', (name, json.dumps(criteria), email, webhook_url))
+        search_id = cursor.lastrowid
+
+        conn.commit()
+        conn.close()
+        return search_id
+
+    def get_saved_searches(self):
+        """Get all active saved searches"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT * FROM saved_searches WHERE is_active = 1 ORDER BY id')
+        columns = [description[0] for description in cursor.description]
+        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        conn.close()
+        return results
+
+    def delete_saved_search(self, search_id):
+        """Delete a saved search and its alerts, returns False if it did not exist"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('DELETE FROM alert_outbox WHERE saved_search_id = ?', (search_id,))
+        cursor.execute('DELETE FROM saved_searches WHERE id = ?', (search_id,))
+        deleted = cursor.rowcount > 0
+
+        conn.commit()
+        conn.close()
+        return deleted
+
+    def get_changed_advertisements(self, after_seq):
+        """Get active ads inserted, repriced or reactivated after a change log seq
+
+        Every ad comes with change_seq, the seq of its latest such change.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT a.*, c.change_seq FROM (
+                SELECT advertisement_id, MAX(seq) AS change_seq FROM listing_changes
+                WHERE seq > ? AND change_type != 'deactivate'
+                GROUP BY advertisement_id
+            ) c
+            JOIN advertisements a ON a.id = c.advertisement_id
+            WHERE a.is_active = 1 AND a.external_id NOT LIKE 'search_%'
+        ''', (after_seq,))
+
+        results = fetch_rows(cursor)
+
+        conn.close()
+        return results
+
+    def add_alerts(self, matches):
+        """Queue alerts: [(saved_search_id, advertisement_id, vehicle key)]
+
+        A search is alerted once per vehicle: a listing whose vehicle
+        cluster was already alerted for that search is skipped. Returns
+        the number of alerts queued.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        queued = 0
+        for search_id, ad_id, vehicle in matches:
+            cursor.execute('''
+                INSERT OR IGNORE INTO alert_outbox (saved_search_id, advertisement_id)
+                SELECT ?, ?
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM alert_outbox o
+                    JOIN advertisements a ON a.id = o.advertisement_id
+                    WHERE o.saved_search_id = ? AND COALESCE(a.vehicle_cluster_id, a.id) = ?
+                )
+            ''', (search_id, ad_id, search_id, vehicle))
+            queued += cursor.rowcount
+
+        conn.commit()
+        conn.close()
+        return queued
+
+    def set_search_watermarks(self, watermarks):
+        """Store how far saved searches have been matched: [(last_change_seq, id)]"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany('''
+            UPDATE saved_searches SET last_change_seq = ?, last_matched_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', watermarks)
+
+        conn.commit()
+        conn.close()
+
+    def get_pending_alerts(self, limit=200):
+        """Get unsent alerts with their saved search and ad, oldest first"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT o.id AS alert_id, o.saved_search_id, s.name, s.email, s.webhook_url,
+                   a.title, a.model, a.year, a.mileage, a.price, a.currency, a.price_eur,
+                   a.location, a.country, a.source, a.source_url, a.image_url
+            FROM alert_outbox o
+            JOIN saved_searches s ON s.id = o.saved_search_id
+            JOIN advertisements a ON a.id = o.advertisement_id
+            WHERE o.sent_at IS NULL AND o.attempts < ?
+            ORDER BY o.id
             LIMIT ?
-        ''', (country, limit))
+        ''', (config.ALERT_MAX_ATTEMPTS, limit))
 
         columns = [description[0] for description in cursor.description]
         results = [dict(zip(columns, row)) for row in cursor.fetchall()]
@@ -167,36 +740,214 @@ class Database:
         conn.close()
         return results
 
-    def mark_inactive_ads(self, active_ids):
-        """Mark ads as inactive if they're not in the active_ids list"""
+    def set_alerts_sent(self, alert_ids, sent_at):
+        """Mark alerts as delivered"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        if active_ids:
-            placeholders = ','.join('?' * len(active_ids))
-            cursor.execute(f'''
-                UPDATE advertisements
-                SET is_active = 0
-                WHERE external_id NOT IN ({placeholders})
-            ''', active_ids)
+        cursor.executemany('UPDATE alert_outbox SET sent_at = ?, attempts = attempts + 1 WHERE id = ?',
+                           [(sent_at, alert_id) for alert_id in alert_ids])
 
         conn.commit()
         conn.close()
 
-    def log_scrape(self, country, source, ads_found, ads_new, status='success'):
-        """Log a scraping session"""
+    def set_alerts_failed(self, alert_ids, error):
+        """Record a failed delivery attempt"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany('UPDATE alert_outbox SET attempts = attempts + 1, last_error = ? WHERE id = ?',
+                           [(error, alert_id) for alert_id in alert_ids])
+
+        conn.commit()
+        conn.close()
+
+    def start_scrape_run(self, sources):
+        """Register a scrape run, returns its id"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('INSERT INTO scrape_runs (sources) VALUES (?)', (','.join(sources),))
+        run_id = cursor.lastrowid
+
+        conn.commit()
+        conn.close()
+        return run_id
+
+    def finish_scrape_run(self, run_id, status='completed', ads_seen=0, ads_deactivated=0, ads_archived=0):
+        """Record the outcome of a scrape run"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
         cursor.execute('''
+            UPDATE scrape_runs
+            SET finished_at = CURRENT_TIMESTAMP, status = ?, ads_seen = ?, ads_deactivated = ?, ads_archived = ?
+            WHERE id = ?
+        ''', (status, ads_seen, ads_deactivated, ads_archived, run_id))
+
+        conn.commit()
+        conn.close()
+
+    def mark_seen(self, run_id, seen):
+        """Stamp ads with the run and source that saw them: {source: external_ids}
+
+        The ids go into a temp table and the update joins on it, so the
+        number of ids is not limited by SQLite's bound-variable limit.
+        Returns the number of stored ads that were seen.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('CREATE TEMP TABLE seen_ads (external_id TEXT PRIMARY KEY, source TEXT)')
+        cursor.executemany('INSERT OR REPLACE INTO temp.seen_ads (external_id, source) VALUES (?, ?)', [
+            (external_id, source) for source, external_ids in seen.items() for external_id in external_ids
+        ])
+        cursor.execute('''
+            UPDATE advertisements
+            SET last_seen_run_id = ?,
+                seen_by = (SELECT source FROM temp.seen_ads WHERE seen_ads.external_id = advertisements.external_id)
+            WHERE external_id IN (SELECT external_id FROM temp.seen_ads)
+        ''', (run_id,))
+        count = cursor.rowcount
+
+        conn.commit()
+        conn.close()
+        return count
+
+    def mark_inactive_ads(self, run_id, sources):
+        """Mark ads as inactive that the given sources did not see in this run
+
+        Only pass sources that completed successfully: a source that
+        failed says nothing about its ads. Ads that no run has seen yet
+        (stored before scrape runs were tracked) are left alone.
+        Returns the number of ads deactivated.
+        """
+        sources = list(sources)
+        if not sources:
+            return 0
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        placeholders = ','.join('?' * len(sources))
+        cursor.execute(f'''
+            UPDATE advertisements
+            SET is_active = 0
+            WHERE is_active = 1 AND seen_by IN ({placeholders}) AND last_seen_run_id < ?
+        ''', [*sources, run_id])
+        count = cursor.rowcount
+
+        conn.commit()
+        conn.close()
+        return count
+
+    def archive_inactive_ads(self, days=config.ARCHIVE_AFTER_DAYS):
+        """Move ads that have been inactive for more than `days` to advertisements_archive
+
+        Age counts from the last run that saw the ad, or date_updated for
+        ads no run has seen. Their undelivered alerts are dropped.
+        Returns the number of ads archived.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TEMP TABLE archived_ads AS
+            SELECT a.id FROM advertisements a
+            LEFT JOIN scrape_runs r ON r.id = a.last_seen_run_id
+            WHERE a.is_active = 0 AND COALESCE(r.started_at, a.date_updated) < datetime('now', ?)
+        ''', (f'-{int(days)} days',))
+
+        cursor.execute('PRAGMA table_info(advertisements)')
+        columns = ', '.join(row[1] for row in cursor.fetchall())
+
+        cursor.execute(f'''
+            INSERT INTO advertisements_archive ({columns}, archived_at)
+            SELECT {columns}, CURRENT_TIMESTAMP FROM advertisements
+            WHERE id IN (SELECT id FROM temp.archived_ads)
+        ''')
+        count = cursor.rowcount
+
+        cursor.execute('''
+            DELETE FROM alert_outbox
+            WHERE sent_at IS NULL AND advertisement_id IN (SELECT id FROM temp.archived_ads)
+        ''')
+        cursor.execute('DELETE FROM advertisements WHERE id IN (SELECT id FROM temp.archived_ads)')
+
+        conn.commit()
+        conn.close()
+        return count
+
+    def log_scrape(self, country, source, ads_found, ads_new, status='success', run_id=None, stats=None):
+        """Log a scraping session
+
+        stats holds the timings and counters of SCRAPE_STATS_COLUMNS
+        (metrics.source_context collects them), missing ones stay NULL.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        stats = stats or {}
+        columns = ', '.join(SCRAPE_STATS_COLUMNS)
+        placeholders = ', '.join('?' * len(SCRAPE_STATS_COLUMNS))
+        cursor.execute(f'''
             INSERT INTO scrape_history
-            (country, source, ads_found, ads_new, status)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (country, source, ads_found, ads_new, status))
+            (country, source, ads_found, ads_new, status, run_id, {columns})
+            VALUES (?, ?, ?, ?, ?, ?, {placeholders})
+        ''', (country, source, ads_found, ads_new, status, run_id, *[stats.get(column) for column in SCRAPE_STATS_COLUMNS]))
 
         conn.commit()
         conn.close()
 
+    def get_scrape_history(self, source=None, days=30, limit=500):
+        """scrape_history rows of the last `days` days, newest first"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        query = "SELECT * FROM scrape_history WHERE scrape_date >= datetime('now', ?)"
+        params = [f'-{int(days)} days']
+        if source:
+            query += ' AND source = ?'
+            params.append(source)
+        query += ' ORDER BY scrape_date DESC, id DESC LIMIT ?'
+        params.append(limit)
+
+        cursor.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        conn.close()
+        return results
+
+    def get_scrape_trend(self, days=30):
+        """Per source and day: runs, average timings and totals of the last `days` days"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT source, date(scrape_date) AS day, COUNT(*) AS runs,
+                   SUM(status != 'success') AS errors,
+                   AVG(duration_seconds) AS duration_seconds,
+                   AVG(fetch_seconds) AS fetch_seconds,
+                   AVG(parse_seconds) AS parse_seconds,
+                   AVG(write_seconds) AS write_seconds,
+                   SUM(http_requests) AS http_requests,
+                   SUM(cache_hits) AS cache_hits,
+                   SUM(bytes_downloaded) AS bytes_downloaded,
+                   SUM(ads_found) AS ads_found,
+                   SUM(ads_rejected) AS ads_rejected
+            FROM scrape_history
+            WHERE scrape_date >= datetime('now', ?)
+            GROUP BY source, day
+            ORDER BY source, day
+        ''', (f'-{int(days)} days',))
+
+        columns = [description[0] for description in cursor.description]
+        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        conn.close()
+        return results
+
     def get_statistics(self):
         """Get database statistics"""
         conn = self.get_connection()
@@ -204,30 +955,37 @@ class Database:
 
         stats = {}
 
-        # Total active ads (190/200 series 1979-1986, price > 500, excluding search links)
+        # Total active vehicles and listings (190/200 series 1979-1986, price > 500,
+        # excluding search links). Listings of the same car count as one vehicle.
         cursor.execute("""
-            SELECT COUNT(*) FROM advertisements
+            SELECT COUNT(DISTINCT COALESCE(vehicle_cluster_id, id)), COUNT(*) FROM advertisements
             WHERE is_active = 1 AND external_id NOT LIKE 'search_%'
             AND (year IS NULL OR (year >= 1979 AND year <= 1986))
-            AND (price IS NULL OR price > 500)
+            AND (price_eur IS NULL OR price_eur > 500)
         """)
-        stats['total_active'] = cursor.fetchone()[0]
+        stats['total_active'], stats['total_listings'] = cursor.fetchone()
 
-        # Ads by country (190/200 series 1979-1986, price > 500)
+        # Vehicles by country (190/200 series 1979-1986, price > 500)
         cursor.execute('''
-            SELECT country, COUNT(*) as count
+            SELECT country, COUNT(DISTINCT COALESCE(vehicle_cluster_id, id)) as count
             FROM advertisements
             WHERE is_active = 1 AND external_id NOT LIKE 'search_%'
             AND (year IS NULL OR (year >= 1979 AND year <= 1986))
-            AND (price IS NULL OR price > 500)
+            AND (price_eur IS NULL OR price_eur > 500)
             GROUP BY country
         ''')
         stats['by_country'] = dict(cursor.fetchall())
 
-        # Last update time (from advertisements table)
-        cursor.execute('SELECT MAX(date_updated) FROM advertisements WHERE is_active = 1')
-        last_update = cursor.fetchone()[0]
-        stats['last_scrape'] = last_update
+        # Last scrape: unchanged ads keep their date_updated (see UPSERT_SQL), so
+        # take it from the runs and the per-source log, the ads only when both are empty
+        cursor.execute('''
+            SELECT COALESCE(
+                (SELECT MAX(last) FROM (SELECT MAX(started_at) AS last FROM scrape_runs
+                                        UNION ALL SELECT MAX(scrape_date) FROM scrape_history)),
+                (SELECT MAX(date_updated) FROM advertisements WHERE is_active = 1)
+            )
+        ''')
+        stats['last_scrape'] = cursor.fetchone()[0]
 
         conn.close()
         return stats
@@ -0,0 +1,102 @@
+"""
+Deal scoring: how cheap is a listing compared to the market
+
+score_deals() fits one log-price model per chassis (W123, W124, W201)
+over all ads ever seen, active or not, with NumPy least squares:
+
+    log(price) ~ year + mileage + mileage unknown + country + body type
+
+For every ad it stores expected_price (the model's estimate) and
+deal_score, the z-score of the log residual: -1.5 means the asking price
+is 1.5 standard deviations below what comparable cars cost. A chassis
+with too few priced ads falls back to a model fitted over all ads.
+
+Prices are compared in euros (price_eur, see currency.py).
+
+Requires numpy (pip install numpy); without it scoring is skipped.
+"""
+
+import math
+
+import config
+from dedup import model_families
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BODY_TYPES = ['Station', 'Cabrio', 'Coupé']  # Sedan is the baseline
+RIDGE = 1e-3  # keeps the fit stable when a country or body type is rare
+
+
+def feature_matrix(ads, countries):
+    """One row of features per ad"""
+    years = np.array([ad['year'] or config.YEAR_FROM for ad in ads], dtype=float)
+    mileage = np.array([ad['mileage'] or 0 for ad in ads], dtype=float)
+    mileage_unknown = np.array([not ad['mileage'] for ad in ads], dtype=float)
+
+    columns = [
+        np.ones(len(ads)),
+        years - config.YEAR_FROM,
+        mileage / 100000,
+        mileage_unknown,
+    ]
+    columns += [np.array([ad['country'] == country for ad in ads], dtype=float) for country in countries[1:]]
+    columns += [np.array([ad['body_type'] == body_type for ad in ads], dtype=float) for body_type in BODY_TYPES]
+
+    return np.column_stack(columns)
+
+
+def fit(features, log_prices):
+    """Ridge least squares, returns (coefficients, residual standard deviation)"""
+    gram = features.T @ features + RIDGE * np.eye(features.shape[1])
+    coefficients = np.linalg.solve(gram, features.T @ log_prices)
+    residuals = log_prices - features @ coefficients
+    return coefficients, max(float(residuals.std()), 1e-6)
+
+
+def score_deals(db):
+    """Recompute expected_price and deal_score for all ads
+
+    Returns the number of ads scored.
+    """
+    if np is None:
+        print("numpy niet geinstalleerd, deal scores overgeslagen (pip install numpy)")
+        return 0
+
+    ads = db.get_pricing_data()
+    priced = [ad for ad in ads if ad['price_eur'] and ad['price_eur'] > 500]
+    if len(priced) < config.DEAL_MIN_SAMPLES:
+        return 0
+
+    countries = sorted({ad['country'] or '' for ad in ads})
+
+    pooled = fit(feature_matrix(priced, countries), np.log([ad['price_eur'] for ad in priced]))
+
+    # Group by chassis, 'W123/W124' goes with the first family it names
+    groups = {}
+    for ad in ads:
+        groups.setdefault(model_families(ad)[0], []).append(ad)
+
+    results = []
+    for family, group in groups.items():
+        family_priced = [ad for ad in group if ad['price_eur'] and ad['price_eur'] > 500]
+        if family != '?' and len(family_priced) >= config.DEAL_MIN_SAMPLES:
+            coefficients, sigma = fit(feature_matrix(family_priced, countries),
+                                      np.log([ad['price_eur'] for ad in family_priced]))
+        else:
+            coefficients, sigma = pooled
+
+        log_expected = feature_matrix(group, countries) @ coefficients
+        prices = np.array([ad['price_eur'] if ad['price_eur'] and ad['price_eur'] > 500 else np.nan for ad in group])
+        deal_scores = (np.log(prices) - log_expected) / sigma
+
+        results.extend(
+            (round(float(expected_price)), None if math.isnan(deal_score) else round(float(deal_score), 3), ad['id'])
+            for ad, expected_price, deal_score in zip(group, np.exp(log_expected), deal_scores)
+        )
+
+    db.set_deal_scores(results)
+    print(f"Deal scores: {len(results)} ads scored over {len(groups)} models")
+    return len(results)
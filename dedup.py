@@ -0,0 +1,162 @@
+"""
+Cross-source duplicate detection
+
+The same car is often listed on AutoScout24, Mobile.de, Kleinanzeigen and
+eBay under different external_ids. assign_clusters() groups those
+listings and stores one vehicle_cluster_id per physical car:
+
+1. Blocking: every ad gets a few cheap keys (model family + year combined
+   with a mileage bucket, a price bucket or the location). Only ads that
+   share a key are compared, so the work stays close to linear.
+   Mileage and price use two bucket grids offset by half a bucket, so
+   values on either side of a bucket edge still meet.
+2. Scoring: title similarity plus agreement on mileage, price and
+   location; a perceptual image hash (image_hash) decides when present.
+3. Clustering: matching pairs are merged with union-find. The cluster id
+   is the lowest advertisement id in the cluster.
+"""
+
+import re
+from collections import defaultdict
+from difflib import SequenceMatcher
+from itertools import combinations
+
+import config
+
+MODEL_PATTERN = re.compile(r'W\d{3}', re.IGNORECASE)
+TITLE_NOISE_PATTERN = re.compile(r'\b(?:mercedes|benz|mb|oldtimer|diesel)\b|[^\w\s]', re.IGNORECASE)
+POSTCODE_PATTERN = re.compile(r'\b\d{4,5}\s*[a-z]{0,2}\b', re.IGNORECASE)
+
+
+def model_families(ad):
+    """Chassis codes an ad may belong to ('W123/W124' belongs to both)"""
+    families = MODEL_PATTERN.findall(ad.get('model') or '')
+    return [family.upper() for family in families] or ['?']
+
+
+def normalize_title(title):
+    return ' '.join(sorted(TITLE_NOISE_PATTERN.sub(' ', (title or '').lower()).split()))
+
+
+def normalize_location(location):
+    return POSTCODE_PATTERN.sub(' ', (location or '').lower()).strip(' ,-')
+
+
+def _buckets(value, size):
+    """Bucket numbers on two grids offset by half a bucket"""
+    return [('a', int(value // size)), ('b', int((value + size / 2) // size))]
+
+
+def blocking_keys(ad):
+    """Keys under which an ad is compared with other ads"""
+    keys = []
+    year = ad.get('year')
+
+    for family in model_families(ad):
+        if ad.get('mileage'):
+            keys.extend((family, year, 'km') + b for b in _buckets(ad['mileage'], config.DEDUP_MILEAGE_BUCKET))
+        if ad.get('price_eur'):
+            keys.extend((family, year, 'eur') + b for b in _buckets(ad['price_eur'], config.DEDUP_PRICE_BUCKET))
+        if ad.get('_location'):
+            keys.append((family, year, 'loc', ad['_location']))
+
+    return keys
+
+
+def hamming(hash_a, hash_b):
+    """Number of differing bits between two hex image hashes"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count('1')
+
+
+def _close(a, b, tolerance):
+    return abs(a - b) <= tolerance * max(a, b)
+
+
+def match_score(ad_a, ad_b):
+    """Likelihood (roughly 0-1) that two listings are the same car"""
+    if ad_a.get('year') and ad_b.get('year') and ad_a['year'] != ad_b['year']:
+        return 0.0
+
+    score = 0.0
+
+    if ad_a.get('mileage') and ad_b.get('mileage'):
+        if _close(ad_a['mileage'], ad_b['mileage'], 0.02):
+            score += 0.25
+        elif not _close(ad_a['mileage'], ad_b['mileage'], 0.10):
+            score -= 0.3
+
+    # In euros, the same car can be listed in PLN on one site and EUR on another
+    if ad_a.get('price_eur') and ad_b.get('price_eur'):
+        if _close(ad_a['price_eur'], ad_b['price_eur'], 0.10):
+            score += 0.15
+        elif not _close(ad_a['price_eur'], ad_b['price_eur'], 0.30):
+            score -= 0.3
+
+    if ad_a['_location'] and ad_a['_location'] == ad_b['_location']:
+        score += 0.15
+
+    if ad_a.get('image_hash') and ad_b.get('image_hash'):
+        distance = hamming(ad_a['image_hash'], ad_b['image_hash'])
+        if distance <= config.DEDUP_IMAGE_DISTANCE:
+            score += 0.5
+        elif distance > 2 * config.DEDUP_IMAGE_DISTANCE:
+            score -= 0.3
+
+    # Title similarity is the expensive part, skip it when it cannot matter
+    if score + 0.5 < config.DEDUP_THRESHOLD:
+        return score
+
+    return score + 0.5 * SequenceMatcher(None, ad_a['_title'], ad_b['_title']).ratio()
+
+
+def find_clusters(ads):
+    """Group ads into vehicles: returns {advertisement id: cluster id}"""
+    for ad in ads:
+        ad['_title'] = normalize_title(ad.get('title'))
+        ad['_location'] = normalize_location(ad.get('location'))
+
+    blocks = defaultdict(list)
+    for ad in ads:
+        for key in blocking_keys(ad):
+            blocks[key].append(ad)
+
+    parent = {ad['id']: ad['id'] for ad in ads}
+
+    def find(ad_id):
+        while parent[ad_id] != ad_id:
+            parent[ad_id] = parent[parent[ad_id]]
+            ad_id = parent[ad_id]
+        return ad_id
+
+    compared = set()
+    for block in blocks.values():
+        # Huge blocks (e.g. a country name as location) say nothing about identity
+        if len(block) < 2 or len(block) > config.DEDUP_MAX_BLOCK:
+            continue
+
+        for ad_a, ad_b in combinations(block, 2):
+            pair = (min(ad_a['id'], ad_b['id']), max(ad_a['id'], ad_b['id']))
+            if pair in compared:
+                continue
+            compared.add(pair)
+
+            if match_score(ad_a, ad_b) >= config.DEDUP_THRESHOLD:
+                root_a, root_b = find(ad_a['id']), find(ad_b['id'])
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    return {ad_id: find(ad_id) for ad_id in parent}
+
+
+def assign_clusters(db):
+    """Recompute vehicle_cluster_id for all active ads
+
+    Returns the number of listings that turned out to be duplicates.
+    """
+    ads = db.get_dedup_candidates()
+    clusters = find_clusters(ads)
+    db.set_vehicle_clusters(clusters)
+
+    duplicates = sum(1 for ad_id, cluster_id in clusters.items() if ad_id != cluster_id)
+    print(f"Duplicate detection: {len(ads)} ads, {len(ads) - duplicates} vehicles, {duplicates} duplicates")
+    return duplicates
@@ -0,0 +1,184 @@
+"""
+Detail page enrichment
+
+Search result pages only give us title, price and sometimes year. For ads
+that are new, changed (price or title differs from the database) or never
+enriched, the detail page is fetched and description, mileage,
+transmission, body type and seller location are filled in.
+
+Detail pages go through http_client.fetch_many(), so at most
+config.FETCH_PER_HOST requests run in parallel per marketplace.
+"""
+
+import json
+import re
+from datetime import datetime
+
+from bs4 import BeautifulSoup
+
+import config
+import http_client
+from change_detection import listing_hash
+
+MILEAGE_PATTERN = re.compile(
+    r'(?:Kilometerstand|Kilometer|Km-stand|Laufleistung|Tachostand|Kilométrage|Przebieg|Najeto)'
+    r'[:\s]*([\d.,\s]{2,9})\s*km',
+    re.IGNORECASE
+)
+MILEAGE_FALLBACK_PATTERN = re.compile(r'(\d{1,3}(?:[.,\s]\d{3})+|\d{4,6})\s*km\b', re.IGNORECASE)
+
+TRANSMISSION_PATTERNS = [
+    ('Automaat', re.compile(r'automatik|automaat|automatic|automatique|automatyczna|\bautomat\b', re.IGNORECASE)),
+    ('Handgeschakeld', re.compile(r'schaltgetriebe|handgeschakeld|handbak|schaltung|manual|manuelle|manualna|manuální', re.IGNORECASE)),
+]
+
+# Same labels as detectCarType() in static/script.js
+BODY_TYPE_PATTERNS = [
+    ('Station', re.compile(r'combi|kombi|estate|t-modell?|\bbreak\b|touring|stationwagen|station wagon|\b[23]\d0\s?t\b|\b[23]\d0\s?td\b', re.IGNORECASE)),
+    ('Cabrio', re.compile(r'cabrio|convertible|roadster', re.IGNORECASE)),
+    ('Coupé', re.compile(r'coup[eé]', re.IGNORECASE)),
+    ('Sedan', re.compile(r'limousine|sedan|saloon|berline|\blimo\b', re.IGNORECASE)),
+]
+
+# Vehicle types that carry the fields we want in JSON-LD
+JSON_LD_TYPES = {'Car', 'Vehicle', 'Product', 'Offer', 'IndividualProduct'}
+
+
+def needs_enrichment(ad, known):
+    """True if the ad is new, changed since the last run or never enriched"""
+    if (ad.get('external_id') or '').startswith('search_') or not ad.get('source_url'):
+        return False
+
+    stored = known.get(ad['external_id'])
+    if not stored:
+        return True
+    if stored['details_fetched_at'] is None:
+        return True
+    return stored['price'] != ad.get('price') or stored['title'] != ad.get('title')
+
+
+def _walk_json_ld(node):
+    """Yield every dict in a JSON-LD document"""
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk_json_ld(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _walk_json_ld(item)
+
+
+def _parse_number(text):
+    digits = re.sub(r'[^\d]', '', str(text))
+    return int(digits) if digits else None
+
+
+def _match_label(patterns, text):
+    for label, pattern in patterns:
+        if pattern.search(text):
+            return label
+    return None
+
+
+def parse_detail_page(html):
+    """Extract description, mileage, transmission, body type and location"""
+    soup = BeautifulSoup(html, 'html.parser')
+    details = {}
+
+    # Structured data first (AutoScout24, Mobile.de, eBay publish JSON-LD)
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            data = json.loads(script.string or '')
+        except ValueError:
+            continue
+
+        for node in _walk_json_ld(data):
+            node_type = node.get('@type')
+            types = set(node_type) if isinstance(node_type, list) else {node_type}
+            if not types & JSON_LD_TYPES and 'address' not in node:
+                continue
+
+            if node.get('description') and 'description' not in details:
+                details['description'] = str(node['description']).strip()
+
+            odometer = node.get('mileageFromOdometer')
+            if odometer and 'mileage' not in details:
+                value = odometer.get('value') if isinstance(odometer, dict) else odometer
+                details['mileage'] = _parse_number(value)
+
+            if node.get('vehicleTransmission') and 'transmission' not in details:
+                details['transmission'] = _match_label(TRANSMISSION_PATTERNS, str(node['vehicleTransmission']))
+
+            if node.get('bodyType') and 'body_type' not in details:
+                details['body_type'] = _match_label(BODY_TYPE_PATTERNS, str(node['bodyType']))
+
+            address = node.get('address')
+            if isinstance(address, dict) and address.get('addressLocality') and 'location' not in details:
+                details['location'] = str(address['addressLocality']).strip()
+
+    # Meta description as fallback
+    if not details.get('description'):
+        meta = soup.find('meta', attrs={'property': 'og:description'}) or soup.find('meta', attrs={'name': 'description'})
+        if meta and meta.get('content'):
+            details['description'] = meta['content'].strip()
+
+    page_text = soup.get_text(' ', strip=True)
+
+    if not details.get('mileage'):
+        match = MILEAGE_PATTERN.search(page_text) or MILEAGE_FALLBACK_PATTERN.search(page_text)
+        if match:
+            details['mileage'] = _parse_number(match.group(1))
+
+    if not details.get('transmission'):
+        details['transmission'] = _match_label(TRANSMISSION_PATTERNS, page_text)
+
+    if not details.get('body_type'):
+        details['body_type'] = _match_label(BODY_TYPE_PATTERNS, f"{details.get('description', '')} {page_text[:2000]}")
+
+    # Drop empty values so they never overwrite data from the search page
+    return {key: value for key, value in details.items() if value}
+
+
+def enrich_advertisements(ads, db):
+    """Fetch detail pages for new/changed ads and merge the details in place
+
+    Returns the number of ads that were enriched.
+    """
+    if not config.ENRICH_DETAILS or not ads:
+        return 0
+
+    known = db.get_known_advertisements(ad['external_id'] for ad in ads if ad.get('external_id'))
+    todo = [ad for ad in ads if needs_enrichment(ad, known)][:config.ENRICH_MAX_PER_RUN]
+
+    print("\n" + "="*60)
+    print(f"ENRICHING {len(todo)} NEW/CHANGED ADS (of {len(ads)})")
+    print("="*60)
+
+    if not todo:
+        return 0
+
+    urls = list({ad['source_url'] for ad in todo})
+    responses = http_client.fetch_many(urls)
+    fetched_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    enriched = 0
+    for ad in todo:
+        response = responses.get(ad['source_url'])
+        if response is None or response.status_code != 200:
+            continue
+
+        try:
+            details = parse_detail_page(response.content)
+        except Exception as e:
+            print(f"  Error parsing {ad['source_url'][:60]}: {e}")
+            continue
+
+        # Fingerprint the search-page version so tomorrow's identical
+        # search result still matches after the details are merged in
+        ad.setdefault('content_hash', listing_hash(ad))
+        ad.update(details)
+        ad['details_fetched_at'] = fetched_at
+        enriched += 1
+
+    print(f"Enriched {enriched} ads with detail page data")
+    return enriched
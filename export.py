@@ -0,0 +1,340 @@
+"""
+Columnar export of listings and history
+
+For analysis outside the app, instead of copying the database file:
+- advertisements: the listings (active and inactive)
+- archive: listings moved to advertisements_archive
+- price_history: listing_changes (price, mileage and active changes) with
+  the ad's external_id, source, country, model, year and currency
+- scrape_history: one row per source per scrape, with its timings
+
+to Parquet or Arrow IPC (both need pyarrow, zstd-compressed) or to gzip
+CSV. Rows are read in chunks of config.EXPORT_CHUNK_SIZE by rowid, each
+chunk a short query of its own, so an export of millions of rows keeps
+little in memory and does not hold a read lock that would stall the
+scrapers' writes. Only the requested columns are read, and the country,
+year and date filters are part of the query (the year filter applies to
+the car's model year, the date filter to date_added, changed_at or
+scrape_date). Timestamps are exported as the text SQLite stores.
+
+The web app serves the same exports at /api/export (from the read
+snapshot when config.SNAPSHOT_READS is on):
+
+    /api/export?dataset=price_history&format=parquet&country=NL,DE&since=2026-01-01
+
+Usage:
+    python export.py advertisements --format parquet --output ads.parquet
+    python export.py price_history --country NL --year-from 1985 --year-to 1995
+    python export.py scrape_history --format csv --since 2026-01-01 --columns source,scrape_date,ads_found
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import os
+import sys
+import time
+
+import config
+
+# name: (FROM clause, table of its own columns, date column, columns joined from the ad as a)
+DATASETS = {
+    'advertisements': ('advertisements t', 'advertisements', 'date_added', []),
+    'archive': ('advertisements_archive t', 'advertisements_archive', 'date_added', []),
+    'price_history': ('listing_changes t LEFT JOIN advertisements a ON a.id = t.advertisement_id',
+                      'listing_changes', 'changed_at',
+                      ['external_id', 'source', 'country', 'model', 'year', 'currency']),
+    'scrape_history': ('scrape_history t', 'scrape_history', 'scrape_date', []),
+}
+
+# Which alias holds country and year: the ad, or the row itself
+FILTER_ALIAS = {'price_history': 'a'}
+
+# format: (file extension, needs pyarrow)
+FORMATS = {
+    'parquet': ('.parquet', True),
+    'arrow': ('.arrow', True),
+    'csv': ('.csv.gz', False),
+}
+MIMETYPES = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file',
+    'csv': 'application/gzip',
+}
+
+
+def pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def table_columns(conn, table):
+    """[(name, declared type)] of a table"""
+    return [(row[1], row[2]) for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def dataset_columns(conn, dataset):
+    """{name: (SQL expression, declared type)} of everything a dataset can export"""
+    _, table, _, joined = DATASETS[dataset]
+    ad_types = dict(table_columns(conn, 'advertisements'))
+    columns = {name: (f't.{name}', declared) for name, declared in table_columns(conn, table)}
+    if table == 'advertisements_archive':
+        # CREATE TABLE AS turned BOOLEAN and TIMESTAMP into NUM, the ads table has the real types
+        columns = {name: (expression, ad_types.get(name, declared)) for name, (expression, declared) in columns.items()}
+    for name in joined:
+        columns.setdefault(name, (f'a.{name}', ad_types.get(name, '')))
+    return columns
+
+
+def build_query(conn, dataset, columns=None, countries=None, year_from=None, year_to=None,
+                since=None, until=None):
+    """SELECT for one chunk (parameters: the last rowid, the chunk size) and its columns
+
+    Returns (sql, params before the rowid, [(name, declared type)]).
+    Raises ValueError for an unknown dataset or column.
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset {dataset!r}, choose from {', '.join(DATASETS)}")
+
+    available = dataset_columns(conn, dataset)
+    if columns:
+        unknown = [name for name in columns if name not in available]
+        if unknown:
+            raise ValueError(f"Unknown columns for {dataset}: {', '.join(unknown)}")
+    selected = [(name, available[name]) for name in (columns or available)]
+
+    from_clause, _, date_column, _ = DATASETS[dataset]
+    alias = FILTER_ALIAS.get(dataset, 't')
+    conditions, params = [], []
+    if countries:
+        conditions.append(f"{alias}.country IN ({', '.join('?' * len(countries))})")
+        params.extend(countries)
+    if year_from is not None or year_to is not None:
+        if dataset == 'scrape_history':
+            raise ValueError('scrape_history has no model year to filter on')
+        if year_from is not None:
+            conditions.append(f'{alias}.year >= ?')
+            params.append(year_from)
+        if year_to is not None:
+            conditions.append(f'{alias}.year <= ?')
+            params.append(year_to)
+    if since:
+        conditions.append(f't.{date_column} >= ?')
+        params.append(since)
+    if until:
+        conditions.append(f't.{date_column} < ?')
+        params.append(until)
+
+    # The rowid comes first so the next chunk can start after it, it is not exported
+    sql = f'''
+        SELECT t.rowid, {', '.join(expression for _, (expression, _) in selected)}
+        FROM {from_clause}
+        WHERE {' AND '.join(conditions + ['t.rowid > ?'])}
+        ORDER BY t.rowid
+        LIMIT ?
+    '''
+    return sql, params, [(name, declared) for name, (_, declared) in selected]
+
+
+def read_chunks(db, sql, params, chunk_size=None):
+    """Yield lists of rows (without the rowid), one query per chunk"""
+    chunk_size = chunk_size or config.EXPORT_CHUNK_SIZE
+    last_rowid = 0
+    while True:
+        conn = db.get_connection()
+        try:
+            rows = conn.execute(sql, (*params, last_rowid, chunk_size)).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return
+        last_rowid = rows[-1][0]
+        yield [row[1:] for row in rows]
+        if len(rows) < chunk_size:
+            return
+
+
+def arrow_type(declared):
+    """Arrow type for an SQLite declared type (column affinity rules), text for anything else"""
+    import pyarrow as pa
+
+    declared = (declared or '').upper()
+    if 'INT' in declared:
+        return pa.int64()
+    if any(name in declared for name in ('REAL', 'FLOA', 'DOUB')):
+        return pa.float64()
+    if 'BOOL' in declared:
+        return pa.bool_()
+    return pa.string()
+
+
+class CsvWriter:
+    """gzip CSV with a header row"""
+
+    def __init__(self, sink, columns):
+        self.gzip = gzip.GzipFile(fileobj=sink, mode='wb', compresslevel=6)
+        self.text = io.TextIOWrapper(self.gzip, encoding='utf-8', newline='')
+        self.writer = csv.writer(self.text)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.text.flush()
+
+    def close(self):
+        self.text.flush()
+        self.text.detach()
+        self.gzip.close()
+
+
+class ArrowWriter:
+    """Parquet or Arrow IPC file, one row group or record batch per chunk"""
+
+    def __init__(self, sink, columns, fmt):
+        import pyarrow as pa
+
+        self.schema = pa.schema([(name, arrow_type(declared)) for name, declared in columns])
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(sink, self.schema, compression='zstd')
+        else:
+            self.writer = pa.ipc.new_file(sink, self.schema,
+                                          options=pa.ipc.IpcWriteOptions(compression='zstd'))
+
+    def write(self, rows):
+        import pyarrow as pa
+
+        arrays = []
+        for index, field in enumerate(self.schema):
+            values = [row[index] for row in rows]
+            if field.type == pa.bool_():
+                # SQLite stores booleans as 0 and 1
+                arrays.append(pa.array(values, type=pa.int64()).cast(pa.bool_()))
+            elif field.type == pa.string():
+                arrays.append(pa.array([value if value is None or isinstance(value, str) else str(value)
+                                        for value in values], type=pa.string()))
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def open_writer(sink, columns, fmt):
+    if fmt == 'csv':
+        return CsvWriter(sink, columns)
+    return ArrowWriter(sink, columns, fmt)
+
+
+class StreamBuffer(io.RawIOBase):
+    """Write-only file that collects what the writers produce until it is drained"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def prepare(db, dataset, fmt, chunk_size=None, **filters):
+    """Check the request and return (chunks, columns) before anything is written
+
+    Raises ValueError for an unknown dataset, format or column, or a
+    format that needs pyarrow when it is not installed.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, choose from {', '.join(FORMATS)}")
+    if FORMATS[fmt][1] and not pyarrow_available():
+        raise ValueError(f'{fmt} export needs pyarrow (pip install pyarrow), or use format csv')
+
+    conn = db.get_connection()
+    try:
+        sql, params, columns = build_query(conn, dataset, **filters)
+    finally:
+        conn.close()
+    return read_chunks(db, sql, params, chunk_size), columns
+
+
+def export(db, dataset, path, fmt='parquet', chunk_size=None, **filters):
+    """Write a dataset to path (complete or not at all), returns the number of rows"""
+    chunks, columns = prepare(db, dataset, fmt, chunk_size, **filters)
+    count = 0
+    try:
+        with open(path + '.tmp', 'wb') as f:
+            writer = open_writer(f, columns, fmt)
+            for rows in chunks:
+                writer.write(rows)
+                count += len(rows)
+            writer.close()
+        os.replace(path + '.tmp', path)
+    finally:
+        if os.path.exists(path + '.tmp'):
+            os.remove(path + '.tmp')
+    return count
+
+
+def stream(chunks, columns, fmt):
+    """Yield the encoded bytes chunk by chunk, for a streamed HTTP response"""
+    buffer = StreamBuffer()
+    writer = open_writer(buffer, columns, fmt)
+    for rows in chunks:
+        writer.write(rows)
+        data = buffer.drain()
+        if data:
+            yield data
+    writer.close()
+    yield buffer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export listings and history for analysis')
+    parser.add_argument('dataset', choices=list(DATASETS))
+    parser.add_argument('--format', choices=list(FORMATS), default='parquet' if pyarrow_available() else 'csv',
+                        help='Output format (default: parquet with pyarrow installed, else csv)')
+    parser.add_argument('--output', help='Output file (default: <dataset><extension>)')
+    parser.add_argument('--db', default=config.DB_PATH, help=f'Database file (default: {config.DB_PATH})')
+    parser.add_argument('--columns', help='Comma separated columns to export (default: all)')
+    parser.add_argument('--country', help='Comma separated country codes')
+    parser.add_argument('--year-from', type=int, help='Earliest model year')
+    parser.add_argument('--year-to', type=int, help='Latest model year')
+    parser.add_argument('--since', help='Rows dated on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--until', help='Rows dated before this date (YYYY-MM-DD)')
+    parser.add_argument('--chunk-size', type=int, default=config.EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from database import Database
+
+    output = args.output or args.dataset + FORMATS[args.format][0]
+    start = time.perf_counter()
+    try:
+        count = export(Database(args.db), args.dataset, output, args.format, args.chunk_size,
+                       columns=args.columns.split(',') if args.columns else None,
+                       countries=args.country.upper().split(',') if args.country else None,
+                       year_from=args.year_from, year_to=args.year_to, since=args.since, until=args.until)
+    except ValueError as e:
+        sys.exit(f"Export failed: {e}")
+
+    print(f"Exported {count} rows of {args.dataset} to {output} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
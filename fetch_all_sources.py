@@ -13,12 +13,18 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-import requests
 from bs4 import BeautifulSoup
 import re
 import time
 import json
 from database import Database
+import http_client
+import metrics
+from enrichment import enrich_advertisements
+from change_detection import page_failed, page_unchanged, remember_page, save_page_hashes
+from sources import log_outcome, refresh_derived_data, run_function
+from normalize import (parse_mileage as extract_mileage, parse_mileages, parse_price as extract_price, parse_prices,
+                       parse_year as extract_year, parse_years)
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -38,6 +44,7 @@ MODERN_KEYWORDS = ['glc', 'gle', 'gla', 'glb', 'gls', 'cls', 'cla', 'eqc', 'eqa'
                   '2020', '2021', '2022', '2023', '2024', '2025', '2026', 'g-klasse', 'g klasse']
 
 
+@metrics.classifier
 def is_classic_mercedes(title, year=None):
     """Check if this is a classic W123/W124"""
     if not title:
@@ -51,31 +58,6 @@ def is_classic_mercedes(title, year=None):
     return is_classic and not is_modern and year_ok
 
 
-def extract_price(text):
-    if not text:
-        return None
-    clean = re.sub(r'[€$£\s.]', '', str(text))
-    clean = clean.replace(',', '.')
-    match = re.search(r'\d+\.?\d*', clean)
-    return float(match.group()) if match else None
-
-
-def extract_year(text):
-    if not text:
-        return None
-    match = re.search(r'(19[789]\d|199[0-7])', str(text))
-    return int(match.group()) if match else None
-
-
-def extract_mileage(text):
-    if not text:
-        return None
-    match = re.search(r'(\d[\d.]*)\s*km', str(text).lower())
-    if match:
-        return int(match.group(1).replace('.', ''))
-    return None
-
-
 def scrape_kleinanzeigen():
     """Scrape Kleinanzeigen.de for Mercedes W123/W124"""
     print("\n" + "="*50)
@@ -98,11 +80,16 @@ def scrape_kleinanzeigen():
         print(f"\nSearching: {search_path}")
 
         try:
-            response = requests.get(url, headers=HEADERS, timeout=30)
+            response = http_client.get(url, headers=HEADERS, timeout=30)
             if response.status_code != 200:
                 print(f"  Status: {response.status_code}")
                 continue
 
+            if page_unchanged(url, response.content):
+                print("  Unchanged since last run")
+                continue
+
+            page_start = len(results)
             soup = BeautifulSoup(response.content, 'html.parser')
 
             # Find ad articles
@@ -181,6 +168,7 @@ def scrape_kleinanzeigen():
                 except Exception as e:
                     continue
 
+            remember_page(url, response.content, [r['external_id'] for r in results[page_start:]])
             time.sleep(1)
 
         except Exception as e:
@@ -215,10 +203,15 @@ def scrape_autoscout24_api():
 
         for url in urls:
             try:
-                response = requests.get(url, headers=HEADERS, timeout=30)
+                response = http_client.get(url, headers=HEADERS, timeout=30)
                 if response.status_code != 200:
                     continue
 
+                if page_unchanged(url, response.content):
+                    print("  Unchanged since last run")
+                    break
+
+                page_start = len(results)
                 soup = BeautifulSoup(response.content, 'html.parser')
 
                 # Try to find JSON data in page
@@ -299,6 +292,7 @@ def scrape_autoscout24_api():
                     except:
                         continue
 
+                remember_page(url, response.content, [r['external_id'] for r in results[page_start:]])
                 time.sleep(1)
                 break  # Only try first working URL
 
@@ -325,10 +319,15 @@ def scrape_marktplaats():
         print(f"\nSearching: {term}")
 
         try:
-            response = requests.get(url, headers=HEADERS, timeout=30)
+            response = http_client.get(url, headers=HEADERS, timeout=30)
             if response.status_code != 200:
                 continue
 
+            if page_unchanged(url, response.content):
+                print("  Unchanged since last run")
+                continue
+
+            page_start = len(results)
             soup = BeautifulSoup(response.content, 'html.parser')
             listings = soup.find_all('li', class_=re.compile(r'[Ll]isting'))
             if not listings:
@@ -402,6 +401,7 @@ def scrape_marktplaats():
                 except:
                     continue
 
+            remember_page(url, response.content, [r['external_id'] for r in results[page_start:]])
             time.sleep(1)
 
         except Exception as e:
@@ -430,21 +430,31 @@ def scrape_mobile_de():
     for url in urls:
         print(f"\nTrying Mobile.de...")
         try:
-            response = requests.get(url, headers=headers_de, timeout=30)
+            response = http_client.get(url, headers=headers_de, timeout=30)
             print(f"  Status: {response.status_code}")
 
             if response.status_code == 403:
                 print("  Bot protection active - skipping")
+                page_failed(url, 'status 403')
+                continue
+
+            if response.status_code == 200 and page_unchanged(url, response.content):
+                print("  Unchanged since last run")
                 continue
 
             if response.status_code == 200:
+                page_start = len(results)
                 soup = BeautifulSoup(response.content, 'html.parser')
 
                 # Look for listings
-                listings = soup.find_all('div', class_=re.compile(r'cBox-body'))
+                listings = soup.find_all('div', class_=re.compile(r'cBox-body'))[:20]
                 print(f"  Found {len(listings)} potential listings")
 
-                for listing in listings[:20]:
+                # Year, mileage and price come from the whole card text, parsed for the page at once
+                texts = [listing.get_text(' ', strip=True) for listing in listings]
+                years, mileages, prices = parse_years(texts), parse_mileages(texts), parse_prices(texts, require_currency=True)
+
+                for i, listing in enumerate(listings):
                     try:
                         link = listing.find('a', href=True)
                         if not link:
@@ -463,14 +473,12 @@ def scrape_mobile_de():
                         id_match = re.search(r'id=(\d+)', href)
                         external_id = id_match.group(1) if id_match else href.split('/')[-1]
 
-                        text = listing.get_text(' ', strip=True)
-
                         ad = {
                             'external_id': f'mobile_de_{external_id}',
                             'model': 'W123/W124',
-                            'year': extract_year(text),
-                            'mileage': extract_mileage(text),
-                            'price': extract_price(text),
+                            'year': years[i],
+                            'mileage': mileages[i],
+                            'price': prices[i],
                             'currency': 'EUR',
                             'location': 'Deutschland',
                             'country': 'DE',
@@ -488,8 +496,13 @@ def scrape_mobile_de():
                     except:
                         continue
 
+                remember_page(url, response.content, [r['external_id'] for r in results[page_start:]])
+            else:
+                page_failed(url, f'status {response.status_code}')
+
         except Exception as e:
             print(f"  Error: {e}")
+            page_failed(url, e)
 
     print(f"\nTotal from Mobile.de: {len(results)}")
     return results
@@ -502,19 +515,21 @@ def main():
 
     db = Database()
     all_results = []
+    outcome = {}
 
-    # Scrape all sources
-    results_kleinanzeigen = scrape_kleinanzeigen()
-    all_results.extend(results_kleinanzeigen)
-
-    results_autoscout = scrape_autoscout24_api()
-    all_results.extend(results_autoscout)
+    # Scrape all sources (AutoScout24 covers NL, DE and BE)
+    for function, label, country in [(scrape_kleinanzeigen, 'Kleinanzeigen.de', 'DE'),
+                                     (scrape_autoscout24_api, 'AutoScout24', None),
+                                     (scrape_marktplaats, 'Marktplaats.nl', 'NL'),
+                                     (scrape_mobile_de, 'Mobile.de', 'DE')]:
+        entry = run_function(function, label, country)
+        outcome[entry['source'].name] = entry
+        all_results.extend(entry['results'])
 
-    results_marktplaats = scrape_marktplaats()
-    all_results.extend(results_marktplaats)
+    known = db.get_known_advertisements(ad['external_id'] for ad in all_results if ad.get('external_id'))
 
-    results_mobile = scrape_mobile_de()
-    all_results.extend(results_mobile)
+    # Fetch detail pages for new/changed ads
+    enrich_advertisements(all_results, db)
 
     # Save to database
     print("\n" + "="*60)
@@ -522,22 +537,33 @@ def main():
     print("="*60)
 
     added = 0
-    for ad in all_results:
-        if ad.get('source_url') and ad.get('external_id'):
-            try:
-                db.add_advertisement(ad)
-                added += 1
-            except:
-                pass
+    for entry in outcome.values():
+        start = time.perf_counter()
+        for ad in entry['results']:
+            if ad.get('source_url') and ad.get('external_id'):
+                try:
+                    db.add_advertisement(ad)
+                    added += 1
+                except:
+                    pass
+        entry['stats']['write_seconds'] = time.perf_counter() - start
 
     print(f"\nTotal scraped: {len(all_results)}")
     print(f"Added to database: {added}")
 
+    # Pages are only marked as seen once their ads are stored
+    save_page_hashes(db)
+    refresh_derived_data(db)
+    log_outcome(db, outcome, known)
+
     # Statistics
     stats = db.get_statistics()
     print(f"\nDatabase now contains: {stats['total_active']} advertisements")
     print(f"By country: {stats['by_country']}")
 
+    http_client.print_cache_stats()
+    metrics.save_snapshot('fetch_all_sources')
+
     return all_results
 
 
@@ -8,12 +8,17 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-import requests
 from bs4 import BeautifulSoup
 import re
 import time
 import json
 from database import Database
+import http_client
+import metrics
+from enrichment import enrich_advertisements
+from change_detection import page_failed, page_unchanged, remember_page, save_page_hashes
+from sources import finish_run, refresh_derived_data, run_function, update_lifecycle
+from normalize import parse_mileage as extract_mileage, parse_price as extract_price, parse_year as extract_year
 
 # Headers to avoid bot detection
 HEADERS = {
@@ -26,63 +31,6 @@ HEADERS = {
 }
 
 
-def extract_price(price_text):
-    """Extract numeric price from text"""
-    if not price_text:
-        return None
-    price_clean = re.sub(r'[€$£\s.]', '', price_text)
-    price_clean = price_clean.replace(',', '.')
-    try:
-        match = re.search(r'\d+\.?\d*', price_clean)
-        if match:
-            return float(match.group())
-    except:
-        pass
-    return None
-
-
-def extract_year(text):
-    """Extract year from text, supporting multiple formats:
-    - Plain year: 1986
-    - Erstzulassung format: EZ 02/1986, Erstzulassung 02/1986
-    - Date format: 02/1986, 1986-02
-    - Bouwjaar: Bj. 1986
-    """
-    if not text:
-        return None
-
-    text = str(text)
-
-    # Format: EZ 02/1986 or Erstzulassung 02/1986 or Bj. 1986
-    ez_match = re.search(r'(?:EZ|Erstzulassung|Bj\.?|Baujahr|Bouwjaar)?\s*(\d{1,2})[/.-]?(19[789]\d|199[0-7])', text, re.IGNORECASE)
-    if ez_match:
-        return int(ez_match.group(2))
-
-    # Format: 1986-02 (ISO-like)
-    iso_match = re.search(r'(19[789]\d|199[0-7])[/-]\d{1,2}', text)
-    if iso_match:
-        return int(iso_match.group(1))
-
-    # Plain year: 1986
-    plain_match = re.search(r'(19[789]\d|199[0-7])', text)
-    return int(plain_match.group()) if plain_match else None
-
-
-def extract_mileage(text):
-    """Extract mileage from text"""
-    if not text:
-        return None
-    try:
-        # Look for patterns like "150.000 km" or "150000 km"
-        match = re.search(r'(\d[\d.]*)\s*km', text.lower())
-        if match:
-            mileage_str = match.group(1).replace('.', '')
-            return int(mileage_str)
-    except:
-        pass
-    return None
-
-
 def scrape_autoscout24(country='nl'):
     """Scrape AutoScout24 for Mercedes W123/W124 Diesel using API"""
 
@@ -110,12 +58,17 @@ def scrape_autoscout24(country='nl'):
         search_url = f'{base_url}/lst?fregfrom=1976&fregto=1987&fuel=D&sort=age&desc=0&query={search["query"].replace(" ", "+")}'
 
         try:
-            session = requests.Session()
-            response = session.get(search_url, headers=HEADERS, timeout=30)
+            response = http_client.get(search_url, headers=HEADERS, timeout=30)
 
             if response.status_code != 200:
+                page_failed(search_url, f'status {response.status_code}')
                 continue
 
+            if page_unchanged(search_url, response.content):
+                print(f"  Unchanged since last run: {search['query']}")
+                continue
+
+            page_start = len(results)
             soup = BeautifulSoup(response.content, 'html.parser')
 
             # Find all links to car listings
@@ -180,10 +133,12 @@ def scrape_autoscout24(country='nl'):
                     results.append(ad)
                     print(f"  Found: {title[:50]}...")
 
+            remember_page(search_url, response.content, [r['external_id'] for r in results[page_start:]])
             time.sleep(1)
 
         except Exception as e:
             print(f"  Error for {search['query']}: {e}")
+            page_failed(search_url, e)
             continue
 
     print(f"Extracted {len(results)} advertisements from AutoScout24.{country}")
@@ -255,6 +210,7 @@ def parse_autoscout24_listing(listing, base_url, country):
     }
 
 
+@metrics.classifier
 def is_classic_mercedes(title, year=None):
     """Check if advertisement is for a classic W123/W124 DIESEL (oldtimer <= 1987)"""
     title_lower = title.lower() if title else ''
@@ -301,10 +257,14 @@ def scrape_marktplaats():
         print(f"\nScraping Marktplaats: {term}...")
 
         try:
-            session = requests.Session()
-            response = session.get(search_url, headers=HEADERS, timeout=30)
+            response = http_client.get(search_url, headers=HEADERS, timeout=30)
             response.raise_for_status()
 
+            if page_unchanged(search_url, response.content):
+                print(f"Unchanged since last run: {term}")
+                continue
+
+            page_start = len(results)
             soup = BeautifulSoup(response.content, 'html.parser')
 
             # Find listings
@@ -330,10 +290,12 @@ def scrape_marktplaats():
                 except:
                     continue
 
+            remember_page(search_url, response.content, [r['external_id'] for r in results[page_start:]])
             time.sleep(1)  # Be polite
 
         except Exception as e:
             print(f"Error scraping Marktplaats ({term}): {e}")
+            page_failed(search_url, e)
 
     print(f"\nExtracted {len(results)} unique advertisements from Marktplaats")
     return results
@@ -417,25 +379,30 @@ def main():
 
     db = Database()
     all_results = []
+    outcome = {}
+
+    # Scrape AutoScout24 NL, DE and BE. The names differ from the registered
+    # sources (scrape_extra_sources.py lists some of the same ads), so each
+    # scraper only retires the ads it was the last to see
+    for country in ['nl', 'de', 'be']:
+        entry = run_function(scrape_autoscout24, f'AutoScout24.{country}', country.upper(),
+                             name=f'autoscout24_html_{country}', hosts=[f'www.autoscout24.{country}'],
+                             country=country)
+        outcome[entry['source'].name] = entry
+        all_results.extend(entry['results'])
+        time.sleep(2)
 
-    # Scrape AutoScout24 NL
-    results_nl = scrape_autoscout24('nl')
-    all_results.extend(results_nl)
-    time.sleep(2)
+    # Scrape Marktplaats
+    entry = run_function(scrape_marktplaats, 'Marktplaats.nl', 'NL',
+                         name='marktplaats_search_nl', hosts=['www.marktplaats.nl'])
+    outcome[entry['source'].name] = entry
+    all_results.extend(entry['results'])
 
-    # Scrape AutoScout24 DE
-    results_de = scrape_autoscout24('de')
-    all_results.extend(results_de)
-    time.sleep(2)
+    run_id = db.start_scrape_run(list(outcome))
+    known = db.get_known_advertisements(ad['external_id'] for ad in all_results if ad.get('external_id'))
 
-    # Scrape AutoScout24 BE
-    results_be = scrape_autoscout24('be')
-    all_results.extend(results_be)
-    time.sleep(2)
-
-    # Scrape Marktplaats
-    results_mp = scrape_marktplaats()
-    all_results.extend(results_mp)
+    # Fetch detail pages for new/changed ads
+    enrich_advertisements(all_results, db)
 
     # Add results to database
     print("\n" + "="*70)
@@ -443,14 +410,17 @@ def main():
     print("="*70)
 
     added = 0
-    for ad in all_results:
-        if ad.get('source_url') and ad.get('external_id'):
-            try:
-                db.add_advertisement(ad)
-                added += 1
-                print(f"+ {ad['source']}: {ad['title'][:50]}...")
-            except Exception as e:
-                print(f"Error adding: {e}")
+    for entry in outcome.values():
+        start = time.perf_counter()
+        for ad in entry['results']:
+            if ad.get('source_url') and ad.get('external_id'):
+                try:
+                    db.add_advertisement(ad)
+                    added += 1
+                    print(f"+ {ad['source']}: {ad['title'][:50]}...")
+                except Exception as e:
+                    print(f"Error adding: {e}")
+        entry['stats']['write_seconds'] = time.perf_counter() - start
 
     print("\n" + "="*70)
     print("SUMMARY")
@@ -458,11 +428,22 @@ def main():
     print(f"Total fetched: {len(all_results)}")
     print(f"Added to database: {added}")
 
+    # Ads that a complete source no longer lists become inactive
+    ads_seen, deactivated = update_lifecycle(db, outcome, run_id)
+
+    # Pages are only marked as seen once their ads are stored
+    save_page_hashes(db)
+    refresh_derived_data(db)
+    finish_run(db, outcome, known, run_id, ads_seen, deactivated)
+
     # Show statistics
     stats = db.get_statistics()
     print(f"\nDatabase now contains: {stats['total_active']} active advertisements")
     print(f"By country: {stats['by_country']}")
 
+    http_client.print_cache_stats()
+    metrics.save_snapshot('fetch_real_data')
+
     return all_results
 
 
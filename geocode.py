@@ -0,0 +1,163 @@
+"""
+Offline geocoding and distance calculations
+
+Ad locations are free text: a seller city ("50667 Köln", "Koeln,
+Nordrhein-Westfalen"), a country name or a country code. geocode() maps
+them to coordinates with the bundled gazetteer in data/gazetteer.tsv
+(cities of NL/DE/BE/PL/CZ/FR/AT with their local, Dutch, German and
+English names). Country-level locations such as "Deutschland" are not
+geocoded: a country centre would put the car in the wrong place.
+
+The gazetteer is loaded once into flat arrays plus a name -> index dict,
+and geocode() is memoized because the same few hundred locations repeat
+in every scrape.
+"""
+
+import math
+import os
+import re
+import unicodedata
+from array import array
+from functools import lru_cache
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer.tsv')
+
+EARTH_RADIUS_KM = 6371.0
+
+# Characters NFKD does not decompose
+TRANSLITERATION = str.maketrans({'ł': 'l', 'Ł': 'L', 'ß': 'ss', 'ø': 'o', 'Ø': 'O'})
+POSTCODE_PATTERN = re.compile(r'\b(?:[A-Z]{1,2}-)?\d{2,3}[\s-]?\d{2,3}(?:\s?[A-Z]{2})?\b')
+SEPARATOR_PATTERN = re.compile(r'[,/;|()]|\s-\s')
+COORDINATES_PATTERN = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def normalize_name(name):
+    """Lower case, no accents, no punctuation: 'Mülheim a.d. Ruhr' -> 'mulheim a d ruhr'"""
+    name = unicodedata.normalize('NFKD', name.translate(TRANSLITERATION))
+    name = ''.join(char for char in name if not unicodedata.combining(char)).lower()
+    name = name.replace("'s-", 's ')
+    return ' '.join(re.findall(r'[a-z0-9]+', name))
+
+
+class Gazetteer:
+    """Place names with coordinates in array-backed storage"""
+
+    def __init__(self, path=GAZETTEER_PATH):
+        self.latitudes = array('f')
+        self.longitudes = array('f')
+        self.countries = []
+        self.names = {}  # (normalized name, country) and normalized name -> index
+
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('#') or not line.strip():
+                    continue
+
+                country, name, latitude, longitude, alternate_names = line.rstrip('\n').split('\t')
+                index = len(self.latitudes)
+                self.latitudes.append(float(latitude))
+                self.longitudes.append(float(longitude))
+                self.countries.append(country)
+
+                for alias in [name] + [alias for alias in alternate_names.split(',') if alias]:
+                    key = normalize_name(alias)
+                    # Larger places come first in the file and win name clashes
+                    self.names.setdefault((key, country), index)
+                    self.names.setdefault(key, index)
+
+    def lookup(self, name, country=None):
+        """Index of a normalized place name, preferring the given country"""
+        if country:
+            index = self.names.get((name, country.upper()))
+            if index is not None:
+                return index
+        return self.names.get(name)
+
+    def coordinates(self, index):
+        return round(self.latitudes[index], 4), round(self.longitudes[index], 4)
+
+
+_gazetteer = None
+
+
+def get_gazetteer():
+    """Return the gazetteer (loaded on first use)"""
+    global _gazetteer
+    if _gazetteer is None:
+        _gazetteer = Gazetteer()
+    return _gazetteer
+
+
+def candidate_names(location):
+    """Names to try for a location string, most specific first"""
+    location = POSTCODE_PATTERN.sub(' ', location)
+
+    # The whole string first: "Frankfurt (Oder)", "Halle (Saale)"
+    yield normalize_name(location)
+
+    for part in SEPARATOR_PATTERN.split(location):
+        name = normalize_name(part)
+        if not name:
+            continue
+        yield name
+
+        # "Köln Ehrenfeld", "Berlin Mitte": try the leading words as well
+        words = name.split()
+        for length in range(len(words) - 1, 0, -1):
+            yield ' '.join(words[:length])
+
+
+@lru_cache(maxsize=4096)
+def geocode(location, country=None):
+    """(latitude, longitude) for a free-text location, or None"""
+    if not location:
+        return None
+
+    gazetteer = get_gazetteer()
+    for name in candidate_names(location):
+        index = gazetteer.lookup(name, country)
+        if index is not None:
+            return gazetteer.coordinates(index)
+    return None
+
+
+def parse_point(text):
+    """Coordinates for '52.09,5.12' or a place name, or None"""
+    match = COORDINATES_PATTERN.match(text or '')
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    return geocode(text)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km"""
+    if lat1 is None or lon1 is None:
+        return None
+
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(min lat, max lat, min lon, max lon) around a point, used with the index"""
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    delta_lon = math.degrees(radius_km / (EARTH_RADIUS_KM * max(math.cos(math.radians(latitude)), 0.01)))
+    return latitude - delta_lat, latitude + delta_lat, longitude - delta_lon, longitude + delta_lon
+
+
+def geocode_missing(db):
+    """Fill in coordinates for ads stored without them
+
+    Returns the number of ads geocoded.
+    """
+    coordinates = []
+    for ad in db.get_ungeocoded_advertisements():
+        point = geocode(ad['location'], ad['country'])
+        if point:
+            coordinates.append((point[0], point[1], ad['id']))
+
+    if coordinates:
+        db.set_coordinates(coordinates)
+    return len(coordinates)
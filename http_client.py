@@ -0,0 +1,375 @@
+"""
+Shared HTTP client for all scrapers
+
+Every scraper fetches its search pages through get() so that pages which
+are requested by more than one module during the same night (AutoScout24,
+Kleinanzeigen, Marktplaats) are only downloaded once:
+- Responses are stored in a SQLite cache with zlib-compressed bodies
+- Fresh entries (younger than HTTP_CACHE_TTL) are served from disk
+- Stale entries are revalidated with If-None-Match / If-Modified-Since
+- Hit/miss counters are printed at the end of a run and, with latency
+  and downloaded bytes per host, recorded in metrics.py
+
+Connections are reused across scrapers: get_session() keeps one pooled
+keep-alive session per host (optionally HTTP/2 via httpx), DNS lookups
+are memoized, and build_headers() picks a User-Agent from the preloaded
+config.USER_AGENTS list instead of loading fake_useragent per scraper.
+
+Network requests to a host are spaced by the interval registered with
+set_host_interval() (sources.py declares one per source), so sources
+that run concurrently never hammer the same site. Cache hits are not
+delayed.
+"""
+
+import json
+import random
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+import config
+import metrics
+
+# Response headers that are kept in the cache
+CACHED_HEADERS = ['Content-Type', 'Content-Encoding', 'ETag', 'Last-Modified']
+
+cache_stats = {
+    'hits': 0,          # served from disk without a request
+    'revalidated': 0,   # server answered 304 Not Modified
+    'misses': 0,        # full download
+    'stored': 0,        # responses written to the cache
+}
+_stats_lock = threading.Lock()
+
+
+def _count(key):
+    with _stats_lock:
+        cache_stats[key] += 1
+
+
+class ResponseCache:
+    """Disk-backed store for GET responses, keyed by URL"""
+
+    def __init__(self, path=config.HTTP_CACHE_PATH, ttl=config.HTTP_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.init_db()
+
+    def get_connection(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def init_db(self):
+        conn = self.get_connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS http_cache (
+                url TEXT PRIMARY KEY,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def get(self, url):
+        """Return the cached entry for url as a dict, or None"""
+        conn = self.get_connection()
+        row = conn.execute('''
+            SELECT status, headers, body, etag, last_modified, fetched_at
+            FROM http_cache WHERE url = ?
+        ''', (url,)).fetchone()
+        conn.close()
+
+        if not row:
+            return None
+
+        return {
+            'status': row[0],
+            'headers': json.loads(row[1] or '{}'),
+            'body': zlib.decompress(row[2]) if row[2] else b'',
+            'etag': row[3],
+            'last_modified': row[4],
+            'fetched_at': row[5],
+        }
+
+    def is_fresh(self, entry):
+        return time.time() - entry['fetched_at'] < self.ttl
+
+    def put(self, url, response):
+        """Store a 200 response"""
+        headers = {k: response.headers[k] for k in CACHED_HEADERS if k in response.headers}
+        # requests already decoded the body, so the stored copy is plain
+        headers.pop('Content-Encoding', None)
+
+        conn = self.get_connection()
+        conn.execute('''
+            INSERT OR REPLACE INTO http_cache
+            (url, status, headers, body, etag, last_modified, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            url,
+            response.status_code,
+            json.dumps(headers),
+            zlib.compress(response.content, 6),
+            response.headers.get('ETag'),
+            response.headers.get('Last-Modified'),
+            time.time()
+        ))
+        conn.commit()
+        conn.close()
+
+    def touch(self, url):
+        """Mark an entry as fresh again after a 304 Not Modified"""
+        conn = self.get_connection()
+        conn.execute('UPDATE http_cache SET fetched_at = ? WHERE url = ?', (time.time(), url))
+        conn.commit()
+        conn.close()
+
+    def prune(self, max_age=None):
+        """Remove entries that have not been refreshed for max_age seconds"""
+        max_age = max_age or config.HTTP_CACHE_MAX_AGE
+        conn = self.get_connection()
+        cursor = conn.execute('DELETE FROM http_cache WHERE fetched_at < ?', (time.time() - max_age,))
+        removed = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return removed
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+_host_intervals = {}
+_host_next_request = {}
+_host_lock = threading.Lock()
+
+_dns_cache = {}
+_dns_lock = threading.Lock()
+_original_getaddrinfo = socket.getaddrinfo
+
+
+def _cached_getaddrinfo(*args, **kwargs):
+    """socket.getaddrinfo with a TTL-bound memo"""
+    key = (args, tuple(sorted(kwargs.items())))
+    now = time.time()
+
+    with _dns_lock:
+        cached = _dns_cache.get(key)
+    if cached and now - cached[0] < config.DNS_CACHE_TTL:
+        return cached[1]
+
+    result = _original_getaddrinfo(*args, **kwargs)
+    with _dns_lock:
+        _dns_cache[key] = (now, result)
+    return result
+
+
+def install_dns_cache():
+    """Route all name lookups in this process through the memo"""
+    if config.DNS_CACHE_ENABLED:
+        socket.getaddrinfo = _cached_getaddrinfo
+
+
+def _new_session():
+    """Create a pooled keep-alive client for one host"""
+    if config.HTTP2_ENABLED:
+        try:
+            import httpx
+            return httpx.Client(http2=True, follow_redirects=True,
+                                limits=httpx.Limits(max_connections=config.HTTP_POOL_SIZE))
+        except ImportError:
+            print("  httpx[http2] niet geinstalleerd, fallback naar HTTP/1.1")
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(url):
+    """Return the shared session for the host of url"""
+    host = urlsplit(url).netloc.lower()
+
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                if not _sessions:
+                    install_dns_cache()
+                session = _new_session()
+                _sessions[host] = session
+    return session
+
+
+def close_sessions():
+    """Close all pooled connections (end of a run)"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def build_headers(accept_language='nl-NL,nl;q=0.9,de;q=0.8,en;q=0.7', accept=None):
+    """Browser-like request headers with a User-Agent from the preloaded list"""
+    return {
+        'User-Agent': random.choice(config.USER_AGENTS),
+        'Accept': accept or 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': accept_language,
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive',
+    }
+
+
+def set_host_interval(host, seconds):
+    """Keep at least seconds between two network requests to host"""
+    with _host_lock:
+        _host_intervals[host.lower()] = seconds
+
+
+def _wait_for_host(url):
+    """Sleep until the host's rate limit allows the next request"""
+    host = urlsplit(url).netloc.lower()
+
+    with _host_lock:
+        interval = _host_intervals.get(host)
+        if not interval:
+            return
+        now = time.time()
+        start = max(now, _host_next_request.get(host, 0))
+        _host_next_request[host] = start + interval
+
+    if start > now:
+        time.sleep(start - now)
+
+
+def get_cache():
+    """Return the process-wide ResponseCache (created on first use)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
+
+
+def _cached_response(url, entry):
+    """Build a requests.Response from a cache entry"""
+    response = requests.Response()
+    response.status_code = entry['status']
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    response._content = entry['body']
+    response.url = url
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.from_cache = True
+    return response
+
+
+def _fetch(fetch, url, **kwargs):
+    """Network GET, timed for metrics (after the rate limit wait)"""
+    _wait_for_host(url)
+    start = time.perf_counter()
+    response = fetch(url, **kwargs)
+    metrics.record_fetch(urlsplit(url).netloc.lower(), time.perf_counter() - start, len(response.content or b''))
+    return response
+
+
+def get(url, headers=None, timeout=config.REQUEST_TIMEOUT, session=None, use_cache=True):
+    """GET a URL through the shared cache
+
+    Requests go over the pooled session for the host unless a session is
+    passed in. Returns a requests.Response; responses served from disk
+    have from_cache set to True.
+    """
+    fetch = (session or get_session(url)).get
+
+    host = urlsplit(url).netloc.lower()
+
+    if not (use_cache and config.HTTP_CACHE_ENABLED):
+        _count('misses')
+        metrics.record_request(host, 'miss')
+        return _fetch(fetch, url, headers=headers, timeout=timeout)
+
+    cache = get_cache()
+    entry = cache.get(url)
+
+    if entry and cache.is_fresh(entry):
+        _count('hits')
+        metrics.record_request(host, 'hit')
+        return _cached_response(url, entry)
+
+    request_headers = dict(headers or {})
+    if entry:
+        if entry['etag']:
+            request_headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            request_headers['If-Modified-Since'] = entry['last_modified']
+
+    response = _fetch(fetch, url, headers=request_headers, timeout=timeout)
+
+    if response.status_code == 304 and entry:
+        _count('revalidated')
+        metrics.record_request(host, 'revalidated')
+        cache.touch(url)
+        return _cached_response(url, entry)
+
+    _count('misses')
+    metrics.record_request(host, 'miss')
+    if response.status_code == 200:
+        cache.put(url, response)
+        _count('stored')
+
+    return response
+
+
+def fetch_many(urls, headers=None, max_workers=None, per_host=None, timeout=config.REQUEST_TIMEOUT,
+               use_cache=True):
+    """GET many URLs concurrently, at most per_host requests in flight per host
+
+    Returns a dict url -> requests.Response (None when the request failed).
+    """
+    max_workers = max_workers or config.FETCH_WORKERS
+    per_host = per_host or config.FETCH_PER_HOST
+    host_slots = defaultdict(lambda: threading.BoundedSemaphore(per_host))
+    for url in urls:
+        host_slots[urlsplit(url).netloc.lower()]
+
+    def fetch(url):
+        with host_slots[urlsplit(url).netloc.lower()]:
+            try:
+                return url, get(url, headers=headers or build_headers(), timeout=timeout, use_cache=use_cache)
+            except Exception as e:
+                print(f"  Error fetching {url[:60]}: {e}")
+                return url, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(executor.map(fetch, urls))
+
+
+def print_cache_stats():
+    """Print the hit/miss counters for this process"""
+    with _stats_lock:
+        stats = dict(cache_stats)
+
+    total = stats['hits'] + stats['revalidated'] + stats['misses']
+    ratio = (stats['hits'] + stats['revalidated']) / total * 100 if total else 0
+
+    print(f"\nHTTP cache: {total} requests, {stats['hits']} hits, "
+          f"{stats['revalidated']} revalidated (304), {stats['misses']} misses "
+          f"({ratio:.0f}% served from cache)")
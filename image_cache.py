@@ -0,0 +1,119 @@
+"""
+Image thumbnails and perceptual hashes
+
+Marketplace images used to be hotlinked at full size. process_images()
+downloads the image of every ad once, and stores:
+- a small WebP thumbnail in a content-addressed store under
+  config.THUMBNAIL_DIR (file name = SHA-1 of the original image), so the
+  same photo on two sites is stored once and the file never changes
+- a 64-bit difference hash (dHash) in advertisements.image_hash, which
+  dedup.py compares by Hamming distance
+
+Thumbnails are served by web_app at /thumbs/<path> with a one year
+immutable Cache-Control header.
+The scheduler (main.py, or web_app.py run directly) runs the worker every
+config.IMAGE_WORKER_INTERVAL minutes.
+
+Requires Pillow (pip install Pillow); without it the worker is skipped.
+"""
+
+import hashlib
+import io
+import os
+from datetime import datetime
+
+import config
+import http_client
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def image_hash(image):
+    """64-bit dHash as 16 hex characters
+
+    The image is shrunk to 9x8 grey pixels and every bit says whether a
+    pixel is brighter than its right neighbour, so recompression, resizing
+    and watermarks change only a few bits.
+    """
+    pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+
+    return f'{bits:016x}'
+
+
+def thumbnail_path(content):
+    """Relative store path for an image: ab/abcdef....webp"""
+    digest = hashlib.sha1(content).hexdigest()
+    return f'{digest[:2]}/{digest}.webp'
+
+
+def store_thumbnail(content):
+    """Create the thumbnail and hash for downloaded image bytes
+
+    Returns (relative thumbnail path, image hash).
+    """
+    path = thumbnail_path(content)
+    full_path = os.path.join(config.THUMBNAIL_DIR, path)
+
+    with Image.open(io.BytesIO(content)) as image:
+        image_hash_value = image_hash(image)
+
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            thumbnail = image.convert('RGB')
+            thumbnail.thumbnail(config.THUMBNAIL_SIZE)
+            # Write next to the target and rename, readers never see half a file
+            thumbnail.save(full_path + '.tmp', 'WEBP', quality=config.THUMBNAIL_QUALITY)
+            os.replace(full_path + '.tmp', full_path)
+
+    return path, image_hash_value
+
+
+def process_images(db, limit=None):
+    """Download, thumbnail and hash images of ads that have not been processed
+
+    Returns the number of images stored.
+    """
+    if Image is None:
+        print("Pillow niet geinstalleerd, thumbnails overgeslagen (pip install Pillow)")
+        return 0
+
+    ads = db.get_unprocessed_images(limit or config.IMAGE_MAX_PER_RUN)
+    if not ads:
+        return 0
+
+    print(f"Processing {len(ads)} new images...")
+
+    urls = list({ad['image_url'] for ad in ads})
+    # Images are stored once, keeping them in the HTTP cache as well is waste
+    responses = http_client.fetch_many(urls, use_cache=False)
+    processed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    results = []
+    stored = 0
+    for ad in ads:
+        response = responses.get(ad['image_url'])
+        path, image_hash_value = None, None
+
+        if response is not None and response.status_code == 200:
+            try:
+                path, image_hash_value = store_thumbnail(response.content)
+                stored += 1
+            except Exception as e:
+                print(f"  Error processing image {ad['image_url'][:60]}: {e}")
+
+        # Failed downloads are marked as well, so they are not retried every run
+        results.append((path, image_hash_value, processed_at, ad['id']))
+
+    db.set_image_results(results)
+    print(f"Stored {stored} thumbnails")
+    return stored
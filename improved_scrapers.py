@@ -2,13 +2,12 @@
 Improved scrapers using APIs and more reliable methods
 """
 
-import requests
 from bs4 import BeautifulSoup
 import time
-import re
-from fake_useragent import UserAgent
 import config
+import http_client
 import json
+from normalize import parse_mileage, parse_price, parse_year
 
 class ImprovedAutoScout24Scraper:
     """
@@ -16,15 +15,12 @@ class ImprovedAutoScout24Scraper:
     """
     def __init__(self, country='nl'):
         self.country = country
-        self.ua = UserAgent()
-        self.session = requests.Session()
 
     def get_headers(self):
-        return {
-            'User-Agent': self.ua.random,
-            'Accept': 'application/json',
-            'Accept-Language': f'{self.country}-{self.country.upper()},en;q=0.9',
-        }
+        return http_client.build_headers(
+            accept_language=f'{self.country}-{self.country.upper()},en;q=0.9',
+            accept='application/json'
+        )
 
     def build_search_url(self, model, year_from, year_to):
         """Build AutoScout24 search URL"""
@@ -58,7 +54,7 @@ class ImprovedAutoScout24Scraper:
             url = self.build_search_url(model, config.YEAR_FROM, config.YEAR_TO)
             print(f"  Fetching: {url[:80]}...")
 
-            response = self.session.get(url, headers=self.get_headers(), timeout=30)
+            response = http_client.get(url, headers=self.get_headers(), timeout=30)
             response.raise_for_status()
 
             soup = BeautifulSoup(response.content, 'html.parser')
@@ -144,34 +140,15 @@ class ImprovedAutoScout24Scraper:
 
     def extract_price(self, text):
         """Extract price from text"""
-        if not text:
-            return None
-        clean = re.sub(r'[€$£\s.]', '', text)
-        clean = clean.replace(',', '.')
-        match = re.search(r'(\d+)\.?\d*', clean)
-        if match:
-            try:
-                return float(match.group(1))
-            except:
-                return None
-        return None
+        return parse_price(text)
 
     def extract_mileage(self, text):
         """Extract mileage from text"""
-        if not text:
-            return None
-        clean = re.sub(r'[^\d]', '', text)
-        try:
-            return int(clean) if clean else None
-        except:
-            return None
+        return parse_mileage(text, require_unit=False)
 
     def extract_year(self, text):
         """Extract year from text"""
-        if not text:
-            return None
-        match = re.search(r'(19|20)\d{2}', text)
-        return int(match.group()) if match else None
+        return parse_year(text, 1900, 2099)
 
 
 def quick_test_scraper():
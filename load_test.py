@@ -0,0 +1,210 @@
+"""
+Load test for the web API
+
+Sends requests to /api/listings (a mix of the filters the web page uses),
+/api/listings/top and /api/statistics from a number of concurrent workers
+and reports per endpoint the throughput and the p50/p95/p99 latency.
+
+Against a running server (python web_app.py, or gunicorn), each worker
+with its own keep-alive session:
+
+    DB_PATH=loadtest.db python web_app.py &
+    python load_test.py --concurrency 16 --duration 30
+
+Or in-process through Flask's test client, which leaves out the network
+and WSGI server and measures the application and database alone:
+
+    DB_PATH=loadtest.db python load_test.py --in-process --concurrency 8
+
+Fill the database with synthetic_data.py first. --output writes the
+results as JSON, --compare prints the change against an earlier run:
+
+    python load_test.py --output before.json
+    python load_test.py --compare before.json
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from statistics import mean
+
+import requests
+
+import config
+
+# (name, path, weight): the mix of a browsing user
+REQUESTS = [
+    ('listings', '/api/listings', 3),
+    ('listings_country', '/api/listings?country={country}', 2),
+    ('listings_price', '/api/listings?sort=price&limit=50', 1),
+    ('listings_deal', '/api/listings?sort=deal', 1),
+    ('listings_near', '/api/listings?near={place}&radius_km=150&sort=distance', 1),
+    ('top', '/api/listings/top', 2),
+    ('statistics', '/api/statistics', 1),
+]
+COUNTRIES = ['NL', 'DE', 'BE', 'FR', 'PL']
+PLACES = ['Utrecht', 'Amsterdam', 'Berlin', 'Hamburg', 'Antwerpen', 'München']
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+class Worker(threading.Thread):
+    """Sends requests until the deadline or its request budget, recording latencies"""
+
+    def __init__(self, get, deadline, budget, seed):
+        super().__init__(daemon=True)
+        self.get = get
+        self.deadline = deadline
+        self.budget = budget
+        self.rng = random.Random(seed)
+        self.latencies = {}
+        self.errors = {}
+
+    def run(self):
+        names = [name for name, _, _ in REQUESTS]
+        weights = [weight for _, _, weight in REQUESTS]
+        paths = {name: path for name, path, _ in REQUESTS}
+        sent = 0
+
+        while time.perf_counter() < self.deadline and (self.budget is None or sent < self.budget):
+            name = self.rng.choices(names, weights)[0]
+            path = paths[name].format(country=self.rng.choice(COUNTRIES), place=self.rng.choice(PLACES))
+            start = time.perf_counter()
+            try:
+                ok = self.get(path)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            sent += 1
+
+            self.latencies.setdefault(name, []).append(elapsed)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def http_client(base_url):
+    """GET function on a keep-alive session for one worker"""
+    session = requests.Session()
+
+    def get(path):
+        response = session.get(base_url + path, timeout=config.REQUEST_TIMEOUT)
+        response.content
+        return response.status_code == 200
+
+    return get
+
+
+def in_process_client():
+    """GET function on Flask's test client for one worker"""
+    from web_app import app
+    client = app.test_client()
+
+    def get(path):
+        response = client.get(path)
+        response.get_data()
+        return response.status_code == 200
+
+    return get
+
+
+def run(make_client, concurrency, duration, total=None, warmup=2.0, seed=1):
+    """Run the load test, returns the results per endpoint"""
+    if warmup:
+        # Fill the SQLite page cache and the normalize caches before measuring
+        Worker(make_client(), time.perf_counter() + warmup, None, seed - 1).run()
+
+    budget = -(-total // concurrency) if total else None
+    deadline = time.perf_counter() + (duration if not total else 24 * 3600)
+    workers = [Worker(make_client(), deadline, budget, seed + index) for index in range(concurrency)]
+
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    latencies, errors = {}, {}
+    for worker in workers:
+        for name, values in worker.latencies.items():
+            latencies.setdefault(name, []).extend(values)
+        for name, count in worker.errors.items():
+            errors[name] = errors.get(name, 0) + count
+    latencies['all'] = [value for values in latencies.values() for value in values]
+    errors['all'] = sum(errors.values())
+
+    endpoints = {}
+    for name, values in latencies.items():
+        values.sort()
+        endpoints[name] = {
+            'requests': len(values),
+            'errors': errors.get(name, 0),
+            'throughput': len(values) / elapsed,
+            'mean_ms': mean(values) * 1000 if values else None,
+            'p50_ms': percentile(values, 0.5) * 1000 if values else None,
+            'p95_ms': percentile(values, 0.95) * 1000 if values else None,
+            'p99_ms': percentile(values, 0.99) * 1000 if values else None,
+            'max_ms': values[-1] * 1000 if values else None,
+        }
+
+    return {'concurrency': concurrency, 'seconds': elapsed, 'endpoints': endpoints}
+
+
+def print_results(results, baseline=None):
+    print(f"\n{results['concurrency']} workers, {results['seconds']:.1f}s\n")
+    print(f"{'Endpoint':<18} {'Requests':>8} {'Errors':>6} {'req/s':>8} {'mean':>8} {'p50':>8} {'p95':>8} "
+          f"{'p99':>8} {'max':>8}" + (f" {'p95 vs baseline':>16}" if baseline else ''))
+
+    for name, entry in sorted(results['endpoints'].items(), key=lambda item: item[0] == 'all'):
+        line = (f"{name:<18} {entry['requests']:>8} {entry['errors']:>6} {entry['throughput']:>8.1f} "
+                f"{entry['mean_ms']:>6.1f}ms {entry['p50_ms']:>6.1f}ms {entry['p95_ms']:>6.1f}ms "
+                f"{entry['p99_ms']:>6.1f}ms {entry['max_ms']:>6.1f}ms")
+        before = (baseline or {}).get('endpoints', {}).get(name)
+        if before and before['p95_ms']:
+            line += f" {(entry['p95_ms'] / before['p95_ms'] - 1) * 100:>+15.0f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the web API')
+    parser.add_argument('--url', default=f'http://localhost:{config.FLASK_PORT}', help='Base URL of the server')
+    parser.add_argument('--in-process', action='store_true', help="Use Flask's test client instead of HTTP")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to run (default: 20)')
+    parser.add_argument('--requests', type=int, help='Total number of requests instead of a duration')
+    parser.add_argument('--warmup', type=float, default=2.0, help='Seconds of unmeasured requests first')
+    parser.add_argument('--output', help='Write the results to a JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    args = parser.parse_args()
+
+    if args.in_process:
+        make_client = in_process_client
+        print(f"Load testing in-process against {config.DB_PATH}...")
+    else:
+        base_url = args.url.rstrip('/')
+        make_client = lambda: http_client(base_url)
+        print(f"Load testing {base_url}...")
+
+    results = run(make_client, args.concurrency, args.duration, args.requests, args.warmup)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
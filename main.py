@@ -1,25 +1,31 @@
 """
 Mercedes W123 & W124 Diesel Finder
 Main application entry point
+
+Each mode imports only what it runs: the web server does not load the
+scrapers (requests, BeautifulSoup, numpy), --scrape-only does not load
+Flask. benchmark_startup.py checks this.
 """
 
 import argparse
 import sys
 from threading import Thread
-from scheduler import DailyScheduler
-from scraper_manager import ScraperManager
-from web_app import app
 import config
+import profiling
 
 
 def run_scheduler():
     """Run the scheduler in a separate thread"""
+    from scheduler import DailyScheduler
+
     scheduler = DailyScheduler()
     scheduler.start()
 
 
 def run_web_server():
     """Run the Flask web server"""
+    from web_app import app
+
     print(f"\n{'='*70}")
     print("Starting Web Server...")
     print(f"Access the application at: http://localhost:{config.FLASK_PORT}")
@@ -30,12 +36,33 @@ def run_web_server():
 
 def run_scraper_once():
     """Run the scraper once and exit"""
+    from scraper_manager import ScraperManager
+
     print("Running scraper once...")
     manager = ScraperManager()
     manager.scrape_all()
     print("\nScraping completed!")
 
 
+def run_all():
+    """Run the scheduler in a thread and the web server in the main thread"""
+    print(f"\n{'='*70}")
+    print("Mercedes W123 & W124 Diesel Finder")
+    print(f"{'='*70}")
+    print("\nStarting application with:")
+    print("  - Web Server (Flask)")
+    print("  - Daily Scheduler (06:00)")
+    print(f"\nWeb interface: http://localhost:{config.FLASK_PORT}")
+    print("\nPress Ctrl+C to stop\n")
+
+    # Start scheduler in separate thread
+    scheduler_thread = Thread(target=run_scheduler, daemon=True)
+    scheduler_thread.start()
+
+    # Run web server in main thread
+    run_web_server()
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Mercedes W123 & W124 Diesel Finder',
@@ -46,6 +73,8 @@ Examples:
   python main.py --web-only         # Run only web server
   python main.py --scrape-only      # Run scraper once and exit
   python main.py --scheduler-only   # Run only scheduler (no web server)
+  python main.py --scrape-only --profile           # Write a profile to profiles/
+  python main.py --web-only --profile cprofile     # Profile the web server until Ctrl+C
         """
     )
 
@@ -74,42 +103,37 @@ Examples:
         help=f'Port for web server (default: {config.FLASK_PORT})'
     )
 
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const='sample',
+        choices=profiling.MODES,
+        help='Profile the run (default: sample) and write it to the profiles directory'
+    )
+
     args = parser.parse_args()
 
     # Update config with port if specified
     if args.port:
         config.FLASK_PORT = args.port
 
-    try:
-        if args.scrape_only:
-            # Just run scraper once
-            run_scraper_once()
-
-        elif args.web_only:
-            # Just run web server
-            run_web_server()
-
-        elif args.scheduler_only:
-            # Just run scheduler
-            run_scheduler()
+    if args.scrape_only:
+        # Just run scraper once
+        name, run = 'scrape', run_scraper_once
+    elif args.web_only:
+        # Just run web server
+        name, run = 'web', run_web_server
+    elif args.scheduler_only:
+        # Just run scheduler
+        name, run = 'scheduler', run_scheduler
+    else:
+        name, run = 'app', run_all
 
+    try:
+        if args.profile:
+            profiling.profile_run(name, run, mode=args.profile)
         else:
-            # Run both web server and scheduler
-            print(f"\n{'='*70}")
-            print("Mercedes W123 & W124 Diesel Finder")
-            print(f"{'='*70}")
-            print("\nStarting application with:")
-            print("  - Web Server (Flask)")
-            print("  - Daily Scheduler (06:00)")
-            print(f"\nWeb interface: http://localhost:{config.FLASK_PORT}")
-            print("\nPress Ctrl+C to stop\n")
-
-            # Start scheduler in separate thread
-            scheduler_thread = Thread(target=run_scheduler, daemon=True)
-            scheduler_thread.start()
-
-            # Run web server in main thread
-            run_web_server()
+            run()
 
     except KeyboardInterrupt:
         print("\n\nApplication stopped by user")
@@ -0,0 +1,336 @@
+"""
+Prometheus-style metrics
+
+A small in-process registry (no prometheus_client needed) with labelled
+counters and histograms, rendered in the Prometheus text format by the
+web app's /metrics endpoint. Recording is a bisect and a locked dict
+update, cheap enough for every request and every classified listing.
+
+Scrapes run in their own process (web_app.run_scrapers starts
+fetch_real_data.py and scrape_extra_sources.py), so each scrape entry
+point calls save_snapshot() at the end of its run. /metrics serves the web
+app's own metrics plus the last snapshot of every entry point, each series
+labelled with the process it came from.
+
+What is measured:
+- http_fetch_seconds, http_response_bytes_total, http_requests_total{result}:
+  network latency, downloaded bytes and cache hits/revalidations/misses
+  per host (every source has its own host, see sources.py)
+- pages_unchanged_total: result pages skipped by change_detection
+- source_stage_seconds{stage}: per source, time in http_client (fetch)
+  and everything else (parse, including page loads of browser sources)
+- listings_classified_total{result}: model filter decisions per source
+- db_write_seconds, db_rows_written_total: upsert latency
+- web_request_seconds, web_requests_total: per endpoint
+- normalize_cache_*: hit ratio of the memoized price/year/mileage parsers
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+import config
+
+# Seconds; covers fast cache/DB operations up to slow browser pages
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REGISTRY = {}
+COLLECTORS = []
+
+_local = threading.local()
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY[name] = self
+
+    def key(self, labels):
+        # Label values are converted to text when rendering, not on every update
+        return tuple(map(labels.get, self.labels))
+
+    def family(self):
+        """{'name', 'type', 'help', 'samples': [[name, labels, value]]}"""
+        with self._lock:
+            values = {key: self.copy(value) for key, value in self._values.items()}
+        samples = []
+        for key, value in sorted(values.items(), key=lambda item: str(item[0])):
+            labels = {label: '' if text is None else str(text) for label, text in zip(self.labels, key)}
+            samples.extend(self.samples(labels, value))
+        return {'name': self.name, 'type': self.type, 'help': self.help, 'samples': samples}
+
+    def copy(self, value):
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not config.METRICS_ENABLED:
+            return
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self, labels, value):
+        return [[self.name, labels, value]]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not config.METRICS_ENABLED:
+            return
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [count per bucket (the last one is +Inf), sum, count]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def copy(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+    def samples(self, labels, value):
+        counts, total, count = value
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            samples.append([f'{self.name}_bucket', {**labels, 'le': str(bound)}, cumulative])
+        samples.append([f'{self.name}_sum', labels, total])
+        samples.append([f'{self.name}_count', labels, count])
+        return samples
+
+
+def register_collector(function):
+    """Add a function returning families that are computed when metrics are read"""
+    COLLECTORS.append(function)
+    return function
+
+
+# ============================================================================
+# Metrics
+# ============================================================================
+
+HTTP_FETCH_SECONDS = Histogram('http_fetch_seconds', 'Network time of HTTP GETs (rate limit wait excluded)', ['host'])
+HTTP_RESPONSE_BYTES = Counter('http_response_bytes_total', 'Response bytes downloaded', ['host'])
+HTTP_REQUESTS = Counter('http_requests_total', 'GETs by cache result (hit, revalidated, miss)', ['host', 'result'])
+PAGES_UNCHANGED = Counter('pages_unchanged_total', 'Result pages skipped because their hash did not change', ['host'])
+SOURCE_STAGE_SECONDS = Histogram('source_stage_seconds', 'Time per source run in http_client (fetch) and the rest (parse)',
+                                 ['source', 'stage'])
+SOURCE_LISTINGS = Counter('source_listings_total', 'Listings returned by a source', ['source'])
+LISTINGS_CLASSIFIED = Counter('listings_classified_total', 'Model filter decisions (accepted, rejected)',
+                              ['source', 'result'])
+DB_WRITE_SECONDS = Histogram('db_write_seconds', 'Advertisement upsert latency', ['operation'])
+DB_ROWS_WRITTEN = Counter('db_rows_written_total', 'Advertisement rows inserted or updated', ['operation'])
+WEB_REQUEST_SECONDS = Histogram('web_request_seconds', 'Web request latency per endpoint', ['endpoint'])
+WEB_REQUESTS = Counter('web_requests_total', 'Web requests per endpoint and status', ['endpoint', 'method', 'status'])
+
+
+@register_collector
+def normalize_cache_families():
+    import normalize
+
+    hits, misses = [], []
+    for kind, function in [('price', normalize._parse_price), ('year', normalize._parse_year),
+                           ('mileage', normalize._parse_mileage)]:
+        info = function.cache_info()
+        hits.append(['normalize_cache_hits_total', {'parser': kind}, info.hits])
+        misses.append(['normalize_cache_misses_total', {'parser': kind}, info.misses])
+
+    return [
+        {'name': 'normalize_cache_hits_total', 'type': 'counter', 'help': 'Memoized parser cache hits', 'samples': hits},
+        {'name': 'normalize_cache_misses_total', 'type': 'counter', 'help': 'Memoized parser cache misses', 'samples': misses},
+    ]
+
+
+# ============================================================================
+# Per-thread state: the source a thread is scraping and its run statistics
+# ============================================================================
+
+def new_source_stats():
+    """Run statistics of one source, the extra columns of scrape_history"""
+    return {
+        'started_at': None,
+        'finished_at': None,
+        'duration_seconds': 0.0,
+        'http_requests': 0,  # network requests, 304 revalidations included
+        'cache_hits': 0,
+        'bytes_downloaded': 0,
+        'fetch_seconds': 0.0,  # in http_client
+        'parse_seconds': 0.0,  # everything else, page loads of browser sources included
+        'write_seconds': 0.0,  # set by the caller that stores the ads
+        'ads_rejected': 0,  # rejected by the model filter
+    }
+
+
+@contextmanager
+def source_context(name):
+    """Attribute HTTP requests and model filter decisions in this thread to a source
+
+    Yields the source's statistics (new_source_stats()), complete when
+    the block ends.
+    """
+    previous = getattr(_local, 'stats', None), getattr(_local, 'source', None)
+    stats = new_source_stats()
+    stats['started_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    _local.source, _local.stats = name, stats
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        total = time.perf_counter() - start
+        stats['finished_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        stats['duration_seconds'] = total
+        stats['parse_seconds'] = max(total - stats['fetch_seconds'], 0.0)
+        SOURCE_STAGE_SECONDS.observe(stats['fetch_seconds'], source=name, stage='fetch')
+        SOURCE_STAGE_SECONDS.observe(stats['parse_seconds'], source=name, stage='parse')
+        _local.stats, _local.source = previous
+
+
+def current_source(default=''):
+    return getattr(_local, 'source', None) or default
+
+
+def _thread_stats():
+    return getattr(_local, 'stats', None)
+
+
+def record_request(host, result):
+    """Called by http_client for every GET: result is hit, revalidated or miss"""
+    HTTP_REQUESTS.inc(host=host, result=result)
+    stats = _thread_stats()
+    if stats is not None:
+        stats['cache_hits' if result == 'hit' else 'http_requests'] += 1
+
+
+def record_fetch(host, seconds, size):
+    """Called by http_client after a network request"""
+    HTTP_FETCH_SECONDS.observe(seconds, host=host)
+    HTTP_RESPONSE_BYTES.inc(size, host=host)
+    stats = _thread_stats()
+    if stats is not None:
+        stats['fetch_seconds'] += seconds
+        stats['bytes_downloaded'] += size
+
+
+def classifier(function):
+    """Count the accept/reject decisions of a model filter per source"""
+    source = function.__module__
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        accepted = function(*args, **kwargs)
+        LISTINGS_CLASSIFIED.inc(source=current_source(source), result='accepted' if accepted else 'rejected')
+        stats = _thread_stats()
+        if stats is not None and not accepted:
+            stats['ads_rejected'] += 1
+        return accepted
+
+    return wrapper
+
+
+# ============================================================================
+# Snapshots and rendering
+# ============================================================================
+
+def collect():
+    """Families of all registered metrics and collectors"""
+    families = [metric.family() for metric in REGISTRY.values()]
+    for collector in COLLECTORS:
+        families.extend(collector())
+    return families
+
+
+def save_snapshot(process):
+    """Write this process's metrics to config.METRICS_DIR/<process>.json"""
+    if not config.METRICS_ENABLED:
+        return
+    os.makedirs(config.METRICS_DIR, exist_ok=True)
+    path = os.path.join(config.METRICS_DIR, f'{process}.json')
+
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'process': process, 'saved_at': time.time(), 'families': collect()}, f)
+    os.replace(path + '.tmp', path)
+
+
+def load_snapshots():
+    """{process: families} of the snapshots in config.METRICS_DIR"""
+    snapshots = {}
+    if not os.path.isdir(config.METRICS_DIR):
+        return snapshots
+
+    for filename in sorted(os.listdir(config.METRICS_DIR)):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(config.METRICS_DIR, filename), encoding='utf-8') as f:
+                snapshot = json.load(f)
+            snapshots[snapshot['process']] = snapshot['families']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[Metrics] Skipping snapshot {filename}: {e}")
+    return snapshots
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def render(processes):
+    """Prometheus text format for {process: families}, one HELP/TYPE block per metric"""
+    merged = {}
+    for process, families in processes.items():
+        for family in families:
+            entry = merged.setdefault(family['name'], {**family, 'samples': []})
+            entry['samples'].extend(
+                [name, {'process': process, **labels}, value] for name, labels, value in family['samples']
+            )
+
+    lines = []
+    for family in merged.values():
+        lines.append(f"# HELP {family['name']} {family['help']}")
+        lines.append(f"# TYPE {family['name']} {family['type']}")
+        for name, labels, value in family['samples']:
+            label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+            lines.append(f'{name}{{{label_text}}} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,499 @@
+"""
+Versioned schema migrations
+
+Every schema change is a numbered migration. schema_version has one row
+per applied migration; opening a Database applies the pending ones in
+order (config.AUTO_MIGRATE) or refuses to start until they are applied
+with this script, e.g. as a deploy step:
+
+    python migrations.py --status
+    python migrations.py
+    python migrations.py --db /srv/finder/mercedes_diesel.db
+
+Each migration runs in its own BEGIN IMMEDIATE transaction and is
+recorded in that same transaction, so a failed schema change leaves no
+trace and a second process waiting for the lock sees it was already
+applied.
+
+Migrations on large tables stay online: DDL like ADD COLUMN and CREATE
+INDEX holds the write lock only as long as SQLite needs for it, and
+backfills go through backfill(), which updates config.MIGRATION_BATCH_SIZE
+rows per transaction with a short pause in between, so the scraper and
+the web app get the lock while it runs:
+
+    @migration(3, 'Price per km of every ad')
+    def add_price_per_km(conn):
+        add_missing_columns(conn.cursor(), 'advertisements', {'price_per_km': 'REAL'})
+        backfill(conn, 'advertisements', 'price_per_km = price_eur / mileage',
+                 where='price_per_km IS NULL AND price_eur IS NOT NULL AND mileage > 0')
+
+A backfill is resumable, not atomic: the batches it committed stay when
+it is interrupted, while the migration is only recorded once it is done.
+Its where clause must therefore skip rows that are done, so the migration
+continues where it stopped when it is run again.
+Migration 1 is the schema as it was before versioning; all its
+statements are idempotent, so it also brings old databases up to date.
+"""
+
+import argparse
+import sqlite3
+import time
+
+import config
+
+MIGRATIONS = []  # (version, description, function), in version order
+
+SCHEMA_VERSION_SQL = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        seconds REAL
+    )
+'''
+
+# Full-text index over the searchable text of an ad. unicode61 with
+# remove_diacritics 2 folds case and accents for NL/DE/FR/PL text
+# (Coupé = coupe, Köln = koln); prefix indexes make "schiebe*" cheap.
+FTS_SCHEMA = '''
+    CREATE VIRTUAL TABLE advertisements_fts USING fts5(
+        title, description, model, location,
+        content='advertisements',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+'''
+
+# Keep the external-content index in sync with the advertisements table
+FTS_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS advertisements_fts_insert AFTER INSERT ON advertisements BEGIN
+        INSERT INTO advertisements_fts (rowid, title, description, model, location)
+        VALUES (new.id, new.title, new.description, new.model, new.location);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS advertisements_fts_delete AFTER DELETE ON advertisements BEGIN
+        INSERT INTO advertisements_fts (advertisements_fts, rowid, title, description, model, location)
+        VALUES ('delete', old.id, old.title, old.description, old.model, old.location);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS advertisements_fts_update
+    AFTER UPDATE OF title, description, model, location ON advertisements BEGIN
+        INSERT INTO advertisements_fts (advertisements_fts, rowid, title, description, model, location)
+        VALUES ('delete', old.id, old.title, old.description, old.model, old.location);
+        INSERT INTO advertisements_fts (rowid, title, description, model, location)
+        VALUES (new.id, new.title, new.description, new.model, new.location);
+    END
+    ''',
+]
+
+
+# Change log: every insert, price or mileage change and (de)activation of
+# an ad gets a row with an increasing seq, written by triggers in the same
+# transaction as the change itself. Consumers poll /api/changes?after=<seq>.
+CHANGE_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS listing_changes_insert AFTER INSERT ON advertisements BEGIN
+        INSERT INTO listing_changes (advertisement_id, change_type, new_value)
+        VALUES (new.id, 'insert', new.price);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS listing_changes_price AFTER UPDATE OF price ON advertisements
+    WHEN old.price IS NOT new.price BEGIN
+        INSERT INTO listing_changes (advertisement_id, change_type, old_value, new_value)
+        VALUES (new.id, 'price', old.price, new.price);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS listing_changes_mileage AFTER UPDATE OF mileage ON advertisements
+    WHEN old.mileage IS NOT new.mileage BEGIN
+        INSERT INTO listing_changes (advertisement_id, change_type, old_value, new_value)
+        VALUES (new.id, 'mileage', old.mileage, new.mileage);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS listing_changes_active AFTER UPDATE OF is_active ON advertisements
+    WHEN old.is_active IS NOT new.is_active BEGIN
+        INSERT INTO listing_changes (advertisement_id, change_type, old_value, new_value)
+        VALUES (new.id, CASE WHEN new.is_active THEN 'reactivate' ELSE 'deactivate' END,
+                old.is_active, new.is_active);
+    END
+    ''',
+]
+
+
+
+# Per-source run statistics in scrape_history (see metrics.new_source_stats)
+SCRAPE_STATS_COLUMNS = {
+    'started_at': 'TIMESTAMP',
+    'finished_at': 'TIMESTAMP',
+    'duration_seconds': 'REAL',
+    'http_requests': 'INTEGER',
+    'cache_hits': 'INTEGER',
+    'bytes_downloaded': 'INTEGER',
+    'fetch_seconds': 'REAL',
+    'parse_seconds': 'REAL',
+    'write_seconds': 'REAL',
+    'ads_rejected': 'INTEGER',
+}
+
+
+def migration(version, description):
+    """Register a function(conn) as migration number version"""
+    def register(function):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migration {version} must come after migration {MIGRATIONS[-1][0]}")
+        MIGRATIONS.append((version, description, function))
+        return function
+    return register
+
+
+def current_version(conn):
+    """Highest applied migration, 0 for a database from before versioning"""
+    try:
+        return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+    except sqlite3.OperationalError as e:
+        # Only a missing table means version 0, a locked database is not a reason to migrate
+        if 'no such table' not in str(e):
+            raise
+        return 0
+
+
+def pending(conn):
+    version = current_version(conn)
+    return [entry for entry in MIGRATIONS if entry[0] > version]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+
+def migrate(conn, target=None):
+    """Apply the pending migrations up to target (default: all), returns the versions applied"""
+    conn.execute(f'PRAGMA busy_timeout = {int(config.MIGRATION_LOCK_TIMEOUT * 1000)}')
+    conn.execute(SCHEMA_VERSION_SQL)
+    conn.commit()
+
+    applied = []
+    for version, description, function in pending(conn):
+        if target is not None and version > target:
+            break
+
+        conn.execute('BEGIN IMMEDIATE')
+        # Another process may have applied it while we waited for the lock
+        if current_version(conn) >= version:
+            conn.rollback()
+            continue
+
+        print(f"[Migrations] {version}: {description}...")
+        start = time.perf_counter()
+        try:
+            function(conn)
+            seconds = time.perf_counter() - start
+            conn.execute('INSERT INTO schema_version (version, description, seconds) VALUES (?, ?, ?)',
+                         (version, description, seconds))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"[Migrations] {version} applied in {seconds:.1f}s")
+        applied.append(version)
+
+    return applied
+
+
+def backfill(conn, table, assignment, where='1', params=(), batch_size=None, pause=None):
+    """UPDATE table SET assignment WHERE where, batch_size rowids per transaction
+
+    params are bound to the placeholders of assignment and where, in that
+    order. Commits after every batch and sleeps pause seconds before taking
+    the write lock again, so an interrupted backfill keeps the batches it
+    committed. Returns the number of rows updated.
+    """
+    batch_size = batch_size or config.MIGRATION_BATCH_SIZE
+    pause = config.MIGRATION_BATCH_PAUSE if pause is None else pause
+
+    low, high = conn.execute(f'SELECT MIN(rowid), MAX(rowid) FROM {table}').fetchone()
+    if low is None:
+        return 0
+
+    updated = 0
+    for start in range(low, high + 1, batch_size):
+        cursor = conn.execute(f'UPDATE {table} SET {assignment} WHERE ({where}) AND rowid BETWEEN ? AND ?',
+                              (*params, start, start + batch_size - 1))
+        updated += cursor.rowcount
+        conn.commit()
+        time.sleep(pause)
+        conn.execute('BEGIN IMMEDIATE')
+
+    return updated
+
+
+# ============================================================================
+# Schema helpers
+# ============================================================================
+
+def add_missing_columns(cursor, table, columns):
+    """Add columns that are missing from an existing table"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    existing = {row[1] for row in cursor.fetchall()}
+
+    for name, column_type in columns.items():
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+
+
+
+def init_search_index(cursor):
+    """Create the FTS5 index and its triggers, fill it on first creation"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'advertisements_fts'")
+    exists = cursor.fetchone() is not None
+
+    if not exists:
+        cursor.execute(FTS_SCHEMA)
+        cursor.execute("INSERT INTO advertisements_fts (advertisements_fts) VALUES ('rebuild')")
+
+    for trigger in FTS_TRIGGERS:
+        cursor.execute(trigger)
+
+
+
+def init_archive(cursor):
+    """Create advertisements_archive with the columns of advertisements plus archived_at"""
+    cursor.execute('CREATE TABLE IF NOT EXISTS advertisements_archive AS SELECT * FROM advertisements WHERE 0')
+
+    cursor.execute('PRAGMA table_info(advertisements)')
+    columns = {row[1]: row[2] for row in cursor.fetchall()}
+    add_missing_columns(cursor, 'advertisements_archive', {**columns, 'archived_at': 'TIMESTAMP'})
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_advertisements_archive_external ON advertisements_archive (external_id)')
+
+
+
+def init_change_log(cursor):
+    """Create the change log and its triggers
+
+    A new log starts with an 'insert' row for every existing ad, so a
+    consumer reading from seq 0 sees all of them.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'listing_changes'")
+    exists = cursor.fetchone() is not None
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS listing_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            advertisement_id INTEGER NOT NULL,
+            change_type TEXT NOT NULL,
+            old_value REAL,
+            new_value REAL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    if not exists:
+        cursor.execute('''
+            INSERT INTO listing_changes (advertisement_id, change_type, new_value)
+            SELECT id, 'insert', price FROM advertisements ORDER BY id
+        ''')
+
+    for trigger in CHANGE_TRIGGERS:
+        cursor.execute(trigger)
+
+    # Saved searches from before the change log start at its end
+    cursor.execute('''
+        UPDATE saved_searches SET last_change_seq = (SELECT COALESCE(MAX(seq), 0) FROM listing_changes)
+        WHERE last_change_seq IS NULL
+    ''')
+
+
+# ============================================================================
+# Migrations
+# ============================================================================
+
+@migration(1, 'Baseline schema')
+def baseline(conn):
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS advertisements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            external_id TEXT UNIQUE,
+            model TEXT NOT NULL,
+            year INTEGER,
+            mileage INTEGER,
+            price REAL,
+            currency TEXT DEFAULT 'EUR',
+            location TEXT,
+            country TEXT,
+            source TEXT,
+            source_url TEXT,
+            title TEXT,
+            description TEXT,
+            image_url TEXT,
+            date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            date_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scrape_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            country TEXT,
+            source TEXT,
+            ads_found INTEGER,
+            ads_new INTEGER,
+            status TEXT
+        )
+    ''')
+
+    # Columns added after the first release
+    add_missing_columns(cursor, 'advertisements', {
+        'transmission': 'TEXT',
+        'body_type': 'TEXT',
+        'details_fetched_at': 'TIMESTAMP',
+        'content_hash': 'TEXT',
+        'vehicle_cluster_id': 'INTEGER',
+        'image_hash': 'TEXT',
+        'thumbnail_path': 'TEXT',
+        'images_processed_at': 'TIMESTAMP',
+        'expected_price': 'REAL',
+        'deal_score': 'REAL',
+        'latitude': 'REAL',
+        'longitude': 'REAL',
+        'price_eur': 'REAL',
+        'last_seen_run_id': 'INTEGER',
+        'seen_by': 'TEXT',
+    })
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_advertisements_cluster ON advertisements (vehicle_cluster_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_advertisements_deal ON advertisements (is_active, deal_score)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_advertisements_geo ON advertisements (latitude, longitude)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_advertisements_updated ON advertisements (date_updated)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_advertisements_price ON advertisements (is_active, price_eur)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_advertisements_seen ON advertisements (seen_by, last_seen_run_id)
+        WHERE is_active = 1
+    ''')
+
+    # One row per scrape run, ads remember the last run that saw them
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            sources TEXT,
+            status TEXT DEFAULT 'running',
+            ads_seen INTEGER,
+            ads_deactivated INTEGER,
+            ads_archived INTEGER
+        )
+    ''')
+    add_missing_columns(cursor, 'scrape_history', {
+        'run_id': 'INTEGER',
+        **SCRAPE_STATS_COLUMNS,
+    })
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scrape_history_source ON scrape_history (source, scrape_date)')
+    init_archive(cursor)
+
+    # Exchange rates for price_eur (see currency.py), synced by Database.sync_fx_rates
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fx_rates (
+            currency TEXT PRIMARY KEY,
+            rate_to_eur REAL NOT NULL,
+            date_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Hash of each search result page (see change_detection.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS page_hashes (
+            url TEXT PRIMARY KEY,
+            hash TEXT,
+            external_ids TEXT,
+            date_checked TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Saved searches and the alerts waiting to be delivered (see alerts.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS saved_searches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            criteria TEXT NOT NULL,
+            email TEXT,
+            webhook_url TEXT,
+            is_active BOOLEAN DEFAULT 1,
+            date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_matched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alert_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            saved_search_id INTEGER NOT NULL,
+            advertisement_id INTEGER NOT NULL,
+            date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            UNIQUE (saved_search_id, advertisement_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alert_outbox_pending ON alert_outbox (id) WHERE sent_at IS NULL')
+
+    add_missing_columns(cursor, 'saved_searches', {'last_change_seq': 'INTEGER'})
+
+    init_search_index(cursor)
+    init_change_log(cursor)
+
+
+@migration(2, 'Index active listings by country and year')
+def add_country_index(conn):
+    # get_country_top_listings and the per-country statistics filtered the
+    # whole active set through idx_advertisements_price before
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_advertisements_country ON advertisements (country, is_active, year)')
+
+
+def print_status(conn):
+    applied = {}
+    try:
+        applied = {row[0]: row for row in conn.execute('SELECT version, description, applied_at, seconds FROM schema_version')}
+    except sqlite3.OperationalError:
+        pass
+
+    for version, description, _ in MIGRATIONS:
+        if version in applied:
+            _, _, applied_at, seconds = applied[version]
+            print(f"  {version:>3}  applied {applied_at} ({seconds or 0:.1f}s)  {description}")
+        else:
+            print(f"  {version:>3}  pending                              {description}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('--db', default=config.DB_PATH, help=f'Database file (default: {config.DB_PATH})')
+    parser.add_argument('--status', action='store_true', help='Show applied and pending migrations')
+    parser.add_argument('--target', type=int, help='Migrate up to this version')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.status:
+            print(f"{args.db}: version {current_version(conn)} of {latest_version()}")
+            print_status(conn)
+            return
+
+        applied = migrate(conn, args.target)
+        print(f"{args.db}: version {current_version(conn)}"
+              + (f", applied {', '.join(map(str, applied))}" if applied else ', up to date'))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
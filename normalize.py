@@ -0,0 +1,172 @@
+"""
+Price, build year and mileage from listing text
+
+One implementation for every scraper, for European number and date
+formats:
+
+    parse_price('1.234,56 €')        -> 1234.56
+    parse_price('€ 12,500')          -> 12500.0
+    parse_year('EZ 02/1986')         -> 1986
+    parse_year('Bj. 85')             -> 1985
+    parse_mileage('250.000 km')      -> 250000
+    parse_mileage('180 Tkm')         -> 180000
+
+All patterns are compiled once and the scalar functions are memoized:
+the same strings ("150.000 km", "EZ 01/1985") come back on every page.
+
+The batch functions (parse_prices, parse_years, parse_mileages) take a
+whole page of strings and parse every distinct string once. Joining a
+page and running each pattern once over it was tried: with finditer
+visiting every number on a card it is 2-3x slower in CPython than the
+memoized per-string search.
+
+data/extract_corpus.tsv is the golden corpus (checked by test_system.py),
+benchmark_extract.py compares the speed with the old per-scraper code.
+"""
+
+import re
+from functools import lru_cache
+
+# Default range of plausible build years, wider ranges are passed explicitly
+FIRST_YEAR = 1970
+LAST_YEAR = 1997
+
+# 1.234 / 1,234 / 1 234 (also non-breaking) / 1'234 groups, or plain digits, with optional
+# decimals (one or two digits only, three digits are a thousands group)
+NUMBER = r'''(?<![\d.,])(?P<number>\d{1,3}(?:[.,\s']\d{3})+(?!\d)|\d+)(?:[.,](?P<decimals>\d{1,2})(?!\d))?'''
+
+NON_DIGIT_PATTERN = re.compile(r'\D')
+PRICE_PATTERN = re.compile(NUMBER)
+
+# Amounts next to a currency, for prices inside longer text ('EZ 02/1986 4.500 €').
+# A currency in front wins: in '1984 € 6.950' the price is not 1984.
+CURRENCY = r'€|\bEUR\b|\bCHF\b|zł|\bPLN\b|Kč|\bCZK\b'
+CURRENCY_PRICE_PATTERNS = [
+    re.compile(rf'(?:{CURRENCY})\s*{NUMBER}', re.IGNORECASE),
+    re.compile(rf'{NUMBER}\s*(?:{CURRENCY}|,[-–])', re.IGNORECASE),
+]
+MILEAGE_PATTERN = re.compile(NUMBER + r'\s*(?P<unit>t(?:sd\.?\s*)?km|km)', re.IGNORECASE)
+
+MONTH = r'(?:0?[1-9]|1[0-2])'
+# Alternatives in order of preference: a registration date (EZ 02/1986,
+# 12.03.1986), a year after a label (Bj. 1985, Bj. 85), ISO-like 1986-02,
+# then any plain four digit year
+YEAR_PATTERN = re.compile(rf'''
+    (?<!\d){MONTH}[/.-](?P<registration>(?:19|20)\d\d)(?!\d)
+  | (?:\bEZ|Erstzulassung|\bBj\.?|Baujahr|Bouwjaar)[:\s]*'?(?:(?P<labelled>(?:19|20)\d\d)|(?P<short>\d\d))(?![\d/.-])
+  | (?<!\d)(?P<iso>(?:19|20)\d\d)[/-]{MONTH}(?!\d)
+  | (?<!\d)(?P<plain>(?:19|20)\d\d)(?!\d)
+''', re.IGNORECASE | re.VERBOSE)
+YEAR_GROUPS = {'registration': 0, 'labelled': 1, 'short': 1, 'iso': 2, 'plain': 3}  # group -> preference
+
+
+def _number(match):
+    digits = NON_DIGIT_PATTERN.sub('', match.group('number'))
+    if match.group('decimals'):
+        return float(f"{digits}.{match.group('decimals')}")
+    return float(digits)
+
+
+def _year(match, first, last):
+    """(preference, year) for a YEAR_PATTERN match, None when out of range"""
+    group = match.lastgroup
+    year = int(match.group(group))
+    if group == 'short':
+        year += 1900
+    if first <= year <= last:
+        return YEAR_GROUPS[group], year
+    return None
+
+
+def _mileage(match):
+    value = _number(match)
+    if match.group('unit').lower().startswith('t'):
+        value *= 1000
+    return int(value)
+
+
+# ============================================================================
+# One string
+# ============================================================================
+
+@lru_cache(maxsize=8192)
+def _parse_price(text, require_currency):
+    for pattern in CURRENCY_PRICE_PATTERNS if require_currency else [PRICE_PATTERN]:
+        match = pattern.search(text)
+        if match:
+            return _number(match)
+    return None
+
+
+def parse_price(text, require_currency=False):
+    """First amount in a price text, in the currency of the text
+
+    With require_currency only an amount next to €, EUR, zł, Kč, ... or
+    followed by ',-' counts, for prices inside a whole listing text.
+    """
+    if not text:
+        return None
+    return _parse_price(str(text), require_currency)
+
+
+@lru_cache(maxsize=8192)
+def _parse_year(text, first, last):
+    best = None
+    for match in YEAR_PATTERN.finditer(text):
+        candidate = _year(match, first, last)
+        if candidate and (best is None or candidate[0] < best[0]):
+            best = candidate
+            if best[0] == 0:
+                break
+    return best[1] if best else None
+
+
+def parse_year(text, first=FIRST_YEAR, last=LAST_YEAR):
+    """Build year: a registration date wins over a labelled year, an ISO date and a plain year"""
+    if not text:
+        return None
+    return _parse_year(str(text), first, last)
+
+
+@lru_cache(maxsize=8192)
+def _parse_mileage(text, require_unit):
+    match = MILEAGE_PATTERN.search(text)
+    if match:
+        return _mileage(match)
+    if not require_unit:
+        match = PRICE_PATTERN.search(text)
+        return int(_number(match)) if match else None
+    return None
+
+
+def parse_mileage(text, require_unit=True):
+    """Mileage in km; without require_unit a bare number ('150.000') counts as well"""
+    if not text:
+        return None
+    return _parse_mileage(str(text), require_unit)
+
+
+# ============================================================================
+# A page of strings
+# ============================================================================
+
+def _parse_all(texts, parse):
+    """Apply a parser to a page of texts, parsing every distinct text once"""
+    texts = list(texts)
+    values = {text: parse(text) for text in dict.fromkeys(texts)}
+    return [values[text] for text in texts]
+
+
+def parse_prices(texts, require_currency=False):
+    """parse_price() for a page of texts"""
+    return _parse_all(texts, lambda text: parse_price(text, require_currency))
+
+
+def parse_years(texts, first=FIRST_YEAR, last=LAST_YEAR):
+    """parse_year() for a page of texts"""
+    return _parse_all(texts, lambda text: parse_year(text, first, last))
+
+
+def parse_mileages(texts, require_unit=True):
+    """parse_mileage() for a page of texts"""
+    return _parse_all(texts, lambda text: parse_mileage(text, require_unit))
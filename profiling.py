@@ -0,0 +1,173 @@
+"""
+Profiling for the scraper and web entry points
+
+Two modes, both writing to config.PROFILE_DIR:
+- sample (default): a background thread records the stack of every
+  thread each config.PROFILE_SAMPLE_INTERVAL seconds. Covers the source
+  thread pools and the Flask request threads, with little overhead.
+- cprofile: cProfile on the calling thread (deterministic, exact call
+  counts, but blind to work in other threads), with the sampler running
+  alongside.
+
+Every run writes <name>-<timestamp>.collapsed (one "frame;frame;frame
+count" line per stack, the input of flamegraph.pl and speedscope) and a
+.txt summary with the hottest functions. The cprofile mode also writes
+a .prof file for pstats or snakeviz.
+
+    python main.py --scrape-only --profile
+    python unified_scraper_v2.py --profile cprofile
+    curl 'http://localhost:5000/debug/profile?seconds=30' > web.collapsed
+
+/debug/profile samples the live web app and only answers when
+config.PROFILE_ENDPOINT_ENABLED is set (and ?token= matches
+config.PROFILE_TOKEN, when one is configured).
+"""
+
+import io
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+
+import config
+
+MODES = ['sample', 'cprofile']
+
+# One /debug/profile sampling at a time
+_endpoint_lock = threading.Lock()
+
+
+class Sampler:
+    """Periodically records the stacks of all other threads"""
+
+    def __init__(self, interval=None):
+        self.interval = interval or config.PROFILE_SAMPLE_INTERVAL
+        self.stacks = Counter()
+        self.samples = 0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+            self._labels[code] = label
+        return label
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).replace(';', ','))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Collapsed stacks, most frequent first"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def summary(self, limit=30):
+        """Functions by samples on top of the stack (self) and anywhere in it (total)"""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')[1:]  # without the thread name
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+
+        samples = sum(self.stacks.values()) or 1
+        lines = [f"{self.samples} samples every {self.interval * 1000:.0f}ms, {samples} thread stacks",
+                 '', f"{'self':>6} {'total':>6}  function"]
+        for frame, count in own.most_common(limit):
+            lines.append(f"{count / samples:>6.1%} {total[frame] / samples:>6.1%}  {frame}")
+        return '\n'.join(lines) + '\n'
+
+
+def output_path(name):
+    """Base path (without extension) for a new profile"""
+    os.makedirs(config.PROFILE_DIR, exist_ok=True)
+    return os.path.join(config.PROFILE_DIR, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+
+
+def save(base, sampler, profiler=None):
+    """Write the .collapsed and .txt files (and .prof for cProfile), returns the paths"""
+    paths = [f'{base}.collapsed', f'{base}.txt']
+
+    with open(paths[0], 'w', encoding='utf-8') as f:
+        f.write(sampler.collapsed())
+
+    summary = sampler.summary()
+    if profiler is not None:
+        import pstats
+
+        paths.append(f'{base}.prof')
+        profiler.dump_stats(paths[-1])
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(40)
+        summary += '\ncProfile (main thread), by cumulative time:\n' + stream.getvalue()
+
+    with open(paths[1], 'w', encoding='utf-8') as f:
+        f.write(summary)
+
+    return paths
+
+
+def profile_run(name, function, *args, mode='sample', **kwargs):
+    """Call function(*args, **kwargs) under the profiler and write the profile, also on errors or Ctrl+C"""
+    if mode not in MODES:
+        raise ValueError(f"Unknown profile mode: {mode} (choose from {', '.join(MODES)})")
+
+    base = output_path(name)
+    sampler = Sampler().start()
+    profiler = None
+    if mode == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        return function(*args, **kwargs)
+    finally:
+        if profiler:
+            profiler.disable()
+        sampler.stop()
+        paths = save(base, sampler, profiler)
+        print(f"\nProfile ({mode}, {sampler.samples} samples) written to: {', '.join(paths)}")
+
+
+def sample_process(seconds, name='web_app'):
+    """Sample the running process for a number of seconds
+
+    Returns the Sampler, or None when another sampling is in progress.
+    """
+    if not _endpoint_lock.acquire(blocking=False):
+        return None
+    try:
+        sampler = Sampler().start()
+        threading.Event().wait(seconds)
+        sampler.stop()
+        save(output_path(name), sampler)
+        return sampler
+    finally:
+        _endpoint_lock.release()
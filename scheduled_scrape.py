@@ -34,6 +34,11 @@ try:
 except Exception as e:
     print(f"Error in scrape_extra_sources: {e}")
 
+# Report the HTTP cache totals for both scrapers and drop old entries
+import http_client
+http_client.print_cache_stats()
+print(f"Pruned {http_client.get_cache().prune()} expired cache entries")
+
 print("\n" + "=" * 60)
 print("SCRAPE COMPLETED")
 print("=" * 60)
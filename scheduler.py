@@ -17,6 +17,8 @@ class DailyScheduler:
         try:
             # Run the scraper
             self.scraper_manager.scrape_all()
+            if config.SNAPSHOT_READS:
+                self.refresh_snapshot()
 
             # Print statistics
             stats = self.scraper_manager.get_statistics()
@@ -36,6 +38,45 @@ class DailyScheduler:
             print(f"ERROR DURING DAILY SCRAPE: {e}")
             print(f"{'='*70}\n")
 
+    def process_images(self):
+        """Thumbnail and hash images of new ads, then refresh duplicate clusters"""
+        from image_cache import process_images
+        from dedup import assign_clusters
+
+        try:
+            db = self.scraper_manager.db
+            if process_images(db):
+                assign_clusters(db)
+        except Exception as e:
+            print(f"[Images] Processing failed: {e}")
+
+    def deliver_alerts(self):
+        """Send alerts of saved searches waiting in the outbox"""
+        from alerts import deliver_alerts
+
+        try:
+            deliver_alerts(self.scraper_manager.db)
+        except Exception as e:
+            print(f"[Alerts] Delivery failed: {e}")
+
+    def refresh_snapshot(self):
+        """Publish a new read snapshot of the database (see snapshot.py)"""
+        from snapshot import create_snapshot
+
+        try:
+            create_snapshot()
+        except Exception as e:
+            print(f"[Snapshot] Failed: {e}")
+
+    def backup(self):
+        """Write a compressed backup and rotate the old ones"""
+        from snapshot import backup
+
+        try:
+            backup()
+        except Exception as e:
+            print(f"[Backup] Failed: {e}")
+
     def start(self):
         """Start the scheduler"""
         print(f"Scheduler started. Daily scraping scheduled at {config.UPDATE_TIME}")
@@ -45,6 +86,15 @@ class DailyScheduler:
         # Schedule the job
         schedule.every().day.at(config.UPDATE_TIME).do(self.run_daily_scrape)
 
+        # Background jobs, as in web_app.start_scheduler (main.py runs this scheduler, not that one)
+        schedule.every(config.IMAGE_WORKER_INTERVAL).minutes.do(self.process_images)
+        schedule.every(config.ALERT_WORKER_INTERVAL).minutes.do(self.deliver_alerts)
+        if config.BACKUP_IN_APP:
+            schedule.every().day.at(f'{config.BACKUP_HOUR:02d}:00').do(self.backup)
+        if config.SNAPSHOT_READS:
+            schedule.every(config.SNAPSHOT_INTERVAL).minutes.do(self.refresh_snapshot)
+            self.refresh_snapshot()
+
         # Run immediately on start (optional - comment out if not needed)
         # print("Running initial scrape...")
         # self.run_daily_scrape()
@@ -8,20 +8,30 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-import requests
 from bs4 import BeautifulSoup
 import re
 import json
+import threading
 import time
 from database import Database
+import http_client
+import metrics
+from enrichment import enrich_advertisements
+from change_detection import page_failed, page_unchanged, remember_page, save_page_hashes
+from sources import SOURCES, finish_run, refresh_derived_data, run_function, update_lifecycle
+from normalize import parse_mileage as extract_mileage, parse_price, parse_year as extract_year
 
 # WebDriver manager for Selenium
+_chrome_install_lock = threading.Lock()
+
 def get_chrome_service():
     """Get a fresh Chrome service for each scraper session"""
     try:
         from selenium.webdriver.chrome.service import Service
         from webdriver_manager.chrome import ChromeDriverManager
-        return Service(ChromeDriverManager().install())
+        # Browser sources run in parallel (sources.py), download the driver once
+        with _chrome_install_lock:
+            return Service(ChromeDriverManager().install())
     except ImportError:
         return None
 
@@ -43,6 +53,7 @@ BENZINE_KEYWORDS = ['200e', '230e', '260e', '280e', '300e', '320e', '200 e', '23
                     'benzine', 'petrol', 'gasoline']
 
 
+@metrics.classifier
 def is_classic_diesel(title, year=None, url=''):
     """Check if this is a classic W123/W124 diesel (oldtimer <= 1987)"""
     # Combine title and URL for matching
@@ -65,50 +76,10 @@ def is_classic_diesel(title, year=None, url=''):
 
 
 def extract_price(text):
-    if not text:
-        return None
+    """Price from a text or an AutoScout24 price object"""
     if isinstance(text, dict):
         text = text.get('priceFormatted', str(text))
-    clean = re.sub(r'[€$£\s.]', '', str(text))
-    clean = clean.replace(',', '.')
-    match = re.search(r'\d+\.?\d*', clean)
-    return float(match.group()) if match else None
-
-
-def extract_year(text):
-    """Extract year from text, supporting multiple formats:
-    - Plain year: 1986
-    - Erstzulassung format: EZ 02/1986, Erstzulassung 02/1986
-    - Date format: 02/1986, 1986-02
-    - Registration: firstRegistration: 1986
-    """
-    if not text:
-        return None
-
-    text = str(text)
-
-    # Format: EZ 02/1986 or Erstzulassung 02/1986 or 02/1986
-    ez_match = re.search(r'(?:EZ|Erstzulassung|Bj\.?|Baujahr)?\s*(\d{1,2})[/.-]?(19[789]\d|199[0-7])', text, re.IGNORECASE)
-    if ez_match:
-        return int(ez_match.group(2))
-
-    # Format: 1986-02 (ISO-like)
-    iso_match = re.search(r'(19[789]\d|199[0-7])[/-]\d{1,2}', text)
-    if iso_match:
-        return int(iso_match.group(1))
-
-    # Plain year: 1986
-    plain_match = re.search(r'(19[789]\d|199[0-7])', text)
-    return int(plain_match.group()) if plain_match else None
-
-
-def extract_mileage(text):
-    if not text:
-        return None
-    match = re.search(r'(\d[\d.]*)\s*km', str(text).lower())
-    if match:
-        return int(match.group(1).replace('.', ''))
-    return None
+    return parse_price(text)
 
 
 def scrape_autoscout24_json(country='de'):
@@ -134,17 +105,24 @@ def scrape_autoscout24_json(country='de'):
         print(f"\nFetching: {search_url[:60]}...")
 
         try:
-            response = requests.get(search_url, headers=HEADERS, timeout=30)
+            response = http_client.get(search_url, headers=HEADERS, timeout=30)
             if response.status_code != 200:
                 print(f"  Status: {response.status_code}")
+                page_failed(search_url, f'status {response.status_code}')
                 continue
 
+            if page_unchanged(search_url, response.content):
+                print("  Unchanged since last run")
+                continue
+
+            page_start = len(results)
             soup = BeautifulSoup(response.content, 'html.parser')
 
             # Find __NEXT_DATA__ JSON
             next_data = soup.find('script', id='__NEXT_DATA__')
             if not next_data:
                 print("  No __NEXT_DATA__ found")
+                page_failed(search_url, 'no __NEXT_DATA__')
                 continue
 
             data = json.loads(next_data.string)
@@ -234,10 +212,12 @@ def scrape_autoscout24_json(country='de'):
                 except Exception as e:
                     continue
 
+            remember_page(search_url, response.content, [r['external_id'] for r in results[page_start:]])
             time.sleep(1)
 
         except Exception as e:
             print(f"  Error: {e}")
+            page_failed(search_url, e)
 
     print(f"\nTotal from AutoScout24.{country}: {len(results)}")
     return results
@@ -391,11 +371,13 @@ def scrape_ebay_motors():
 
             except Exception as e:
                 print(f"  Error: {e}")
+                page_failed(url, e)
 
         driver.quit()
 
     except Exception as e:
         print(f"  Selenium error: {e}")
+        page_failed('https://www.ebay.de/', e)
 
     print(f"\nTotal from eBay.de: {len(results)}")
     return results
@@ -550,11 +532,13 @@ def scrape_kleinanzeigen():
 
             except Exception as e:
                 print(f"  Error: {e}")
+                page_failed(url, e)
 
         driver.quit()
 
     except Exception as e:
         print(f"  Selenium error: {e}")
+        page_failed('https://www.kleinanzeigen.de/', e)
 
     print(f"\nTotal from Kleinanzeigen.de: {len(results)}")
     return results
@@ -711,11 +695,13 @@ def scrape_gaspedaal():
 
             except Exception as e:
                 print(f"  Error: {e}")
+                page_failed(url, e)
 
         driver.quit()
 
     except Exception as e:
         print(f"  Selenium error: {e}")
+        page_failed('https://www.gaspedaal.nl/', e)
 
     print(f"\nTotal from Gaspedaal.nl: {len(results)}")
     return results
@@ -887,11 +873,13 @@ def scrape_2dehands():
 
             except Exception as e:
                 print(f"  Error: {e}")
+                page_failed(url, e)
 
         driver.quit()
 
     except Exception as e:
         print(f"  Selenium error: {e}")
+        page_failed('https://www.2dehands.be/', e)
 
     print(f"\nTotal from 2dehands.be: {len(results)}")
     return results
@@ -1309,11 +1297,13 @@ def scrape_autowereld():
 
             except Exception as e:
                 print(f"  Error: {e}")
+                page_failed(url, e)
 
         driver.quit()
 
     except Exception as e:
         print(f"  Selenium error: {e}")
+        page_failed('https://www.autowereld.nl/', e)
 
     print(f"\nTotal from AutoWereld.nl: {len(results)}")
     return results
@@ -1326,58 +1316,72 @@ def main():
 
     db = Database()
     all_results = []
+    outcome = {}
+
+    # One after another, under the registered source's name and hosts (sources.py)
+    def run(function, name, **kwargs):
+        source = SOURCES[name]
+        entry = run_function(function, source.label, source.country, name=name, hosts=source.hosts, **kwargs)
+        outcome[name] = entry
+        all_results.extend(entry['results'])
 
     # Scrape AutoScout24 (DE, NL, BE, FR, AT)
     for country in ['de', 'nl', 'be', 'fr', 'at']:
-        results = scrape_autoscout24_json(country)
-        all_results.extend(results)
+        run(scrape_autoscout24_json, f'autoscout24_{country}', country=country)
         time.sleep(2)
 
-    # Scrape AutoTrack.nl
-    results_autotrack = scrape_autotrack()
-    all_results.extend(results_autotrack)
-
-    # Scrape AutoWereld.nl
-    results_autowereld = scrape_autowereld()
-    all_results.extend(results_autowereld)
-
-    # Scrape eBay.de
-    results_ebay = scrape_ebay_motors()
-    all_results.extend(results_ebay)
-
-    # Scrape Gaspedaal.nl
-    results_gaspedaal = scrape_gaspedaal()
-    all_results.extend(results_gaspedaal)
-
-    # Scrape 2dehands.be (requires Selenium)
-    results_2dehands = scrape_2dehands()
-    all_results.extend(results_2dehands)
+    run(scrape_autotrack, 'autotrack_nl')
+    run(scrape_autowereld, 'autowereld_nl')
+    run(scrape_ebay_motors, 'ebay_de')
+    run(scrape_gaspedaal, 'gaspedaal_nl')
+    # Requires Selenium
+    run(scrape_2dehands, '2dehands_be')
 
     # Add search links
     add_search_links(db)
 
+    run_id = db.start_scrape_run(list(outcome))
+    known = db.get_known_advertisements(ad['external_id'] for ad in all_results if ad.get('external_id'))
+
+    # Fetch detail pages for new/changed ads
+    enrich_advertisements(all_results, db)
+
     # Save to database
     print("\n" + "="*60)
     print("SAVING TO DATABASE")
     print("="*60)
 
     added = 0
-    for ad in all_results:
-        if ad.get('source_url') and ad.get('external_id'):
-            try:
-                db.add_advertisement(ad)
-                added += 1
-            except:
-                pass
+    for entry in outcome.values():
+        start = time.perf_counter()
+        for ad in entry['results']:
+            if ad.get('source_url') and ad.get('external_id'):
+                try:
+                    db.add_advertisement(ad)
+                    added += 1
+                except:
+                    pass
+        entry['stats']['write_seconds'] = time.perf_counter() - start
 
     print(f"\nTotal scraped: {len(all_results)}")
     print(f"Added to database: {added}")
 
+    # Ads that a complete source no longer lists become inactive
+    ads_seen, deactivated = update_lifecycle(db, outcome, run_id)
+
+    # Pages are only marked as seen once their ads are stored
+    save_page_hashes(db)
+    refresh_derived_data(db)
+    finish_run(db, outcome, known, run_id, ads_seen, deactivated)
+
     # Statistics
     stats = db.get_statistics()
     print(f"\nDatabase now contains: {stats['total_active']} advertisements")
     print(f"By country: {stats['by_country']}")
 
+    http_client.print_cache_stats()
+    metrics.save_snapshot('scrape_extra_sources')
+
 
 if __name__ == '__main__':
     main()
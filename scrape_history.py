@@ -0,0 +1,110 @@
+"""
+Scrape timings over time
+
+Every source run leaves a scrape_history row with its duration, HTTP
+requests, bytes downloaded, the fetch/parse/write split and the number of
+listings the model filter rejected (collected by metrics.source_context,
+written by sources.log_outcome). trend() groups them per source and day
+and flags sources whose last run took config.SCRAPE_SLOWDOWN_FACTOR times
+the median of the runs before it.
+
+The web app serves the same data on /api/scrape-history,
+/api/scrape-history/trend and the /scrape-history page.
+
+Usage:
+    python scrape_history.py                # trend of the last 30 days
+    python scrape_history.py --days 7
+"""
+
+import argparse
+from statistics import median
+
+import config
+
+
+def slowdowns(history):
+    """Compare the last successful run of each source with the runs before it
+
+    history are scrape_history rows, newest first. Returns {source:
+    {'last_seconds', 'median_seconds', 'factor', 'slow'}} for sources with
+    at least two timed runs.
+    """
+    durations = {}
+    for row in history:
+        if row['status'] == 'success' and row['duration_seconds'] is not None:
+            durations.setdefault(row['source'], []).append(row['duration_seconds'])
+
+    result = {}
+    for source, runs in durations.items():
+        previous = runs[1:config.SCRAPE_TREND_RUNS + 1]
+        if not previous:
+            continue
+        typical = median(previous)
+        factor = runs[0] / typical if typical else None
+        result[source] = {
+            'last_seconds': runs[0],
+            'median_seconds': typical,
+            'factor': factor,
+            'slow': factor is not None and factor >= config.SCRAPE_SLOWDOWN_FACTOR,
+        }
+    return result
+
+
+def trend(db, days=30):
+    """Daily timings per source with the slowdown of the last run, slowest first"""
+    series = {}
+    for row in db.get_scrape_trend(days):
+        series.setdefault(row['source'], []).append(row)
+
+    changes = slowdowns(db.get_scrape_history(days=days, limit=10000))
+
+    sources = [
+        {'source': source, 'days': rows, **changes.get(source, {'last_seconds': None, 'median_seconds': None,
+                                                                 'factor': None, 'slow': False})}
+        for source, rows in series.items()
+    ]
+    sources.sort(key=lambda entry: entry['factor'] or 0, reverse=True)
+    return {'days': days, 'slowdown_factor': config.SCRAPE_SLOWDOWN_FACTOR, 'sources': sources}
+
+
+def print_trend(result):
+    print(f"{'Source':<18} {'Runs':>4} {'Last':>7} {'Median':>7} {'Factor':>6}  "
+          f"{'Fetch':>6} {'Parse':>6} {'Write':>6} {'Requests':>8} {'MB':>7} {'Rejected':>8}")
+
+    for entry in result['sources']:
+        rows = entry['days']
+        runs = sum(row['runs'] for row in rows)
+
+        def average(field):
+            values = [row[field] for row in rows if row[field] is not None]
+            return sum(values) / len(values) if values else 0
+
+        def total(field):
+            return sum(row[field] or 0 for row in rows)
+
+        last = f"{entry['last_seconds']:.0f}s" if entry['last_seconds'] is not None else '-'
+        typical = f"{entry['median_seconds']:.0f}s" if entry['median_seconds'] is not None else '-'
+        factor = f"{entry['factor']:.1f}x" if entry['factor'] else '-'
+        print(f"{entry['source']:<18} {runs:>4} {last:>7} {typical:>7} {factor:>6}  "
+              f"{average('fetch_seconds'):>5.0f}s {average('parse_seconds'):>5.0f}s {average('write_seconds'):>5.1f}s "
+              f"{total('http_requests'):>8} {total('bytes_downloaded') / 1e6:>7.1f} {total('ads_rejected'):>8}"
+              f"{'  <- slower than usual' if entry['slow'] else ''}")
+
+
+def main():
+    from database import Database
+
+    parser = argparse.ArgumentParser(description='Scrape timings per source')
+    parser.add_argument('--days', type=int, default=30)
+    args = parser.parse_args()
+
+    result = trend(Database(), args.days)
+    if not result['sources']:
+        print(f"No scrape history in the last {args.days} days")
+        return
+    print(f"Scrape trend, last {args.days} days (averages per run, totals per period)\n")
+    print_trend(result)
+
+
+if __name__ == '__main__':
+    main()
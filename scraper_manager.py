@@ -1,6 +1,9 @@
 import config
+import metrics
 from database import Database
-from scrapers import get_scraper
+from scrapers import scrape_site
+from change_detection import pop_failed_pages, pop_unchanged_pages, save_page_hashes
+from sources import refresh_derived_data
 import time
 from datetime import datetime
 
@@ -13,7 +16,14 @@ class ScraperManager:
         print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Starting scrape session...")
 
         all_ads = []
-        active_ids = []
+        seen = {}
+        completed = []
+        failed_sites = []
+
+        run_id = self.db.start_scrape_run([
+            f'{site_name}_{country_code}'.lower()
+            for country_code, country_data in config.MARKETPLACES.items() for site_name in country_data['sites']
+        ])
 
         for country_code, country_data in config.MARKETPLACES.items():
             print(f"\n{'='*60}")
@@ -22,20 +32,37 @@ class ScraperManager:
 
             for site_name, site_url in country_data['sites'].items():
                 print(f"\nScraping {site_name}...")
+                source_name = f'{site_name}_{country_code}'.lower()
+                pop_unchanged_pages()
+                pop_failed_pages()
 
                 try:
-                    ads = self.scrape_site(site_name, country_code)
+                    with metrics.source_context(source_name) as stats:
+                        ads = self.scrape_site(site_name, country_code)
+                    metrics.SOURCE_LISTINGS.inc(len(ads), source=source_name)
                     all_ads.extend(ads)
 
                     # Save ads to database
+                    start = time.perf_counter()
                     new_count = 0
                     for ad in ads:
                         if self.db.add_advertisement(ad):
                             new_count += 1
-                            active_ids.append(ad['external_id'])
+                    stats['write_seconds'] = time.perf_counter() - start
+
+                    # Sites run one after another, so the skipped and failed pages are this site's
+                    seen[source_name] = {ad['external_id'] for ad in ads}
+                    for external_ids in pop_unchanged_pages().values():
+                        seen[source_name].update(external_ids)
+                    failed = pop_failed_pages()
+                    if seen[source_name] and not failed:
+                        completed.append(source_name)
 
                     print(f"  Found: {len(ads)} ads")
                     print(f"  New: {new_count} ads")
+                    if failed:
+                        failed_sites.append(source_name)
+                        print(f"  Failed: {len(failed)} page(s), {site_name} retires no ads this run")
 
                     # Log scrape
                     self.db.log_scrape(
@@ -43,62 +70,56 @@ class ScraperManager:
                         source=site_name,
                         ads_found=len(ads),
                         ads_new=new_count,
-                        status='success'
+                        status=f"error: {len(failed)} page(s) failed: {next(iter(failed.values()))}" if failed else 'success',
+                        run_id=run_id,
+                        stats=stats
                     )
 
                 except Exception as e:
+                    failed_sites.append(source_name)
                     print(f"  Error scraping {site_name}: {e}")
                     self.db.log_scrape(
                         country=country_code,
                         source=site_name,
                         ads_found=0,
                         ads_new=0,
-                        status=f'error: {str(e)}'
+                        status=f'error: {str(e)}',
+                        run_id=run_id,
+                        stats=stats
                     )
 
                 # Delay between sites
                 time.sleep(config.REQUEST_DELAY * 2)
 
-        # Mark inactive ads
-        if active_ids:
-            # self.db.mark_inactive_ads(active_ids)  # DISABLED: keep old ads
+        # Ads a successful site no longer lists become inactive
+        ads_seen = self.db.mark_seen(run_id, seen)
+        deactivated = self.db.mark_inactive_ads(run_id, completed) if config.DEACTIVATE_MISSING_ADS else 0
+
+        # Pages are only marked as seen once their ads are stored
+        save_page_hashes(self.db)
+        refresh_derived_data(self.db)
+
+        archived = self.db.archive_inactive_ads(config.ARCHIVE_AFTER_DAYS)
+        # Like sources.finish_run: any site that raised or had a failed page makes the run partial
+        self.db.finish_scrape_run(run_id, 'partial' if failed_sites else 'completed',
+                                  ads_seen, deactivated, archived)
+
+        metrics.save_snapshot('scraper_manager')
 
         print(f"\n{'='*60}")
         print(f"Scrape session completed")
         print(f"Total ads found: {len(all_ads)}")
+        print(f"Deactivated: {deactivated}, archived: {archived}")
         print(f"{'='*60}\n")
 
         return all_ads
 
     def scrape_site(self, site_name, country_code):
         """Scrape a specific site for all models"""
-        scraper = get_scraper(site_name, country_code.lower())
-
-        if not scraper:
-            print(f"  No scraper available for {site_name}")
-            return []
-
-        all_results = []
-
-        # Scrape for each model
-        for model in config.MODELS:
-            try:
-                print(f"  Searching for {model}...")
-                results = scraper.scrape(model)
-
-                # Filter by year
-                filtered = [
-                    ad for ad in results
-                    if ad.get('year') and config.YEAR_FROM <= ad.get('year') <= config.YEAR_TO
-                ]
-
-                all_results.extend(filtered)
-                print(f"    Found {len(filtered)} ads for {model}")
-
-            except Exception as e:
-                print(f"    Error scraping {model}: {e}")
+        results = scrape_site(site_name, country_code.lower())
 
-        return all_results
+        # Only keep ads with a known year
+        return [ad for ad in results if ad.get('year')]
 
     def scrape_country(self, country_code):
         """Scrape only a specific country"""
@@ -123,6 +144,8 @@ class ScraperManager:
             except Exception as e:
                 print(f"Error scraping {site_name}: {e}")
 
+        save_page_hashes(self.db)
+        refresh_derived_data(self.db)
         return all_ads
 
     def get_statistics(self):
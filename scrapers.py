@@ -1,59 +1,30 @@
-import requests
 from bs4 import BeautifulSoup
 import time
 import re
-from fake_useragent import UserAgent
 import config
+import http_client
+from change_detection import page_failed, page_unchanged, remember_page
+from currency import detect_currency
+from normalize import parse_mileage, parse_price, parse_year
 
 class BaseScraper:
     def __init__(self):
-        self.ua = UserAgent()
-        self.session = requests.Session()
         self.results = []
 
     def get_headers(self):
-        return {
-            'User-Agent': self.ua.random,
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'nl-NL,nl;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-        }
+        return http_client.build_headers(accept_language='nl-NL,nl;q=0.9,en;q=0.8')
 
     def extract_price(self, price_text):
         """Extract numeric price from text"""
-        if not price_text:
-            return None
-        # Remove currency symbols and thousands separators
-        price_clean = re.sub(r'[€$£\s.]', '', price_text)
-        price_clean = price_clean.replace(',', '.')
-        try:
-            return float(re.search(r'\d+\.?\d*', price_clean).group())
-        except:
-            return None
+        return parse_price(price_text)
 
     def extract_mileage(self, mileage_text):
         """Extract numeric mileage from text"""
-        if not mileage_text:
-            return None
-        # Remove km and thousands separators
-        mileage_clean = re.sub(r'[^\d]', '', mileage_text)
-        try:
-            return int(mileage_clean)
-        except:
-            return None
+        return parse_mileage(mileage_text, require_unit=False)
 
     def extract_year(self, year_text):
         """Extract year from text"""
-        if not year_text:
-            return None
-        try:
-            year_match = re.search(r'(19|20)\d{2}', year_text)
-            if year_match:
-                return int(year_match.group())
-        except:
-            pass
-        return None
+        return parse_year(year_text, 1900, 2099)
 
 
 class AutoScout24Scraper(BaseScraper):
@@ -88,9 +59,14 @@ class AutoScout24Scraper(BaseScraper):
         url = self.build_search_url(model, config.YEAR_FROM, config.YEAR_TO)
 
         try:
-            response = self.session.get(url, headers=self.get_headers(), timeout=config.REQUEST_TIMEOUT)
+            response = http_client.get(url, headers=self.get_headers(), timeout=config.REQUEST_TIMEOUT)
             response.raise_for_status()
 
+            if page_unchanged(url, response.content):
+                print("    Unchanged since last run")
+                return self.results
+
+            page_start = len(self.results)
             soup = BeautifulSoup(response.content, 'html.parser')
 
             # Find all car listings
@@ -105,10 +81,12 @@ class AutoScout24Scraper(BaseScraper):
                     print(f"Error parsing listing: {e}")
                     continue
 
+            remember_page(url, response.content, [ad['external_id'] for ad in self.results[page_start:]])
             time.sleep(config.REQUEST_DELAY)
 
         except Exception as e:
             print(f"Error scraping AutoScout24 {self.country}: {e}")
+            page_failed(url, e)
 
         return self.results
 
@@ -134,7 +112,8 @@ class AutoScout24Scraper(BaseScraper):
 
             # Extract price
             price_elem = listing.find('span', class_=lambda x: x and 'Price' in x)
-            price = self.extract_price(price_elem.get_text() if price_elem else '')
+            price_text = price_elem.get_text() if price_elem else ''
+            price = self.extract_price(price_text)
 
             # Extract year and mileage
             details = listing.find_all('span', class_=lambda x: x and 'VehicleDetailTable' in x)
@@ -162,7 +141,7 @@ class AutoScout24Scraper(BaseScraper):
                 'year': year,
                 'mileage': mileage,
                 'price': price,
-                'currency': 'EUR',
+                'currency': detect_currency(price_text, self.country),
                 'location': location,
                 'country': self.country.upper(),
                 'source': 'AutoScout24',
@@ -204,9 +183,14 @@ class MobileDeScraper(BaseScraper):
         url = self.build_search_url(model, config.YEAR_FROM, config.YEAR_TO)
 
         try:
-            response = self.session.get(url, headers=self.get_headers(), timeout=config.REQUEST_TIMEOUT)
+            response = http_client.get(url, headers=self.get_headers(), timeout=config.REQUEST_TIMEOUT)
             response.raise_for_status()
 
+            if page_unchanged(url, response.content):
+                print("    Unchanged since last run")
+                return self.results
+
+            page_start = len(self.results)
             soup = BeautifulSoup(response.content, 'html.parser')
 
             # Find all car listings
@@ -221,10 +205,12 @@ class MobileDeScraper(BaseScraper):
                     print(f"Error parsing listing: {e}")
                     continue
 
+            remember_page(url, response.content, [ad['external_id'] for ad in self.results[page_start:]])
             time.sleep(config.REQUEST_DELAY)
 
         except Exception as e:
             print(f"Error scraping Mobile.de: {e}")
+            page_failed(url, e)
 
         return self.results
 
@@ -250,7 +236,8 @@ class MobileDeScraper(BaseScraper):
 
             # Extract price
             price_elem = listing.find('span', class_=lambda x: x and 'price' in str(x).lower())
-            price = self.extract_price(price_elem.get_text() if price_elem else '')
+            price_text = price_elem.get_text() if price_elem else ''
+            price = self.extract_price(price_text)
 
             # Extract details
             year = None
@@ -278,7 +265,7 @@ class MobileDeScraper(BaseScraper):
                 'year': year,
                 'mileage': mileage,
                 'price': price,
-                'currency': 'EUR',
+                'currency': detect_currency(price_text, 'DE'),
                 'location': location,
                 'country': 'DE',
                 'source': 'Mobile.de',
@@ -309,9 +296,14 @@ class MarktplaatsScraper(BaseScraper):
         url = self.build_search_url(model)
 
         try:
-            response = self.session.get(url, headers=self.get_headers(), timeout=config.REQUEST_TIMEOUT)
+            response = http_client.get(url, headers=self.get_headers(), timeout=config.REQUEST_TIMEOUT)
             response.raise_for_status()
 
+            if page_unchanged(url, response.content):
+                print("    Unchanged since last run")
+                return self.results
+
+            page_start = len(self.results)
             soup = BeautifulSoup(response.content, 'html.parser')
 
             # Find all listings
@@ -326,10 +318,12 @@ class MarktplaatsScraper(BaseScraper):
                     print(f"Error parsing listing: {e}")
                     continue
 
+            remember_page(url, response.content, [ad['external_id'] for ad in self.results[page_start:]])
             time.sleep(config.REQUEST_DELAY)
 
         except Exception as e:
             print(f"Error scraping Marktplaats: {e}")
+            page_failed(url, e)
 
         return self.results
 
@@ -355,7 +349,8 @@ class MarktplaatsScraper(BaseScraper):
 
             # Extract price
             price_elem = listing.find('span', class_=lambda x: x and 'mp-Listing-price' in str(x))
-            price = self.extract_price(price_elem.get_text() if price_elem else '')
+            price_text = price_elem.get_text() if price_elem else ''
+            price = self.extract_price(price_text)
 
             # Extract description for details
             desc_elem = listing.find('p', class_=lambda x: x and 'mp-Listing-description' in str(x))
@@ -380,7 +375,7 @@ class MarktplaatsScraper(BaseScraper):
                 'year': year,
                 'mileage': mileage,
                 'price': price,
-                'currency': 'EUR',
+                'currency': detect_currency(price_text, 'NL'),
                 'location': location,
                 'country': 'NL',
                 'source': 'Marktplaats',
@@ -408,3 +403,41 @@ def get_scraper(site_name, country='nl'):
     if scraper_func:
         return scraper_func(country)
     return None
+
+
+def scrape_site(site_name, country='nl'):
+    """Scrape one site for all configured models
+
+    Ads outside the configured year range are dropped; ads without a
+    year are kept. A page or model that fails is reported with
+    change_detection.page_failed(), the ads of the others are returned.
+    """
+    scraper = get_scraper(site_name, country)
+
+    if not scraper:
+        print(f"  No scraper available for {site_name}")
+        return []
+
+    all_results = []
+
+    for model in config.MODELS:
+        try:
+            print(f"  Searching {site_name} for {model}...")
+            results = scraper.scrape(model)
+
+            filtered = [
+                ad for ad in results
+                if ad.get('year') is None or config.YEAR_FROM <= ad.get('year') <= config.YEAR_TO
+            ]
+
+            all_results.extend(filtered)
+            print(f"    Found {len(filtered)} ads for {model}")
+
+        except Exception as e:
+            print(f"    Error scraping {model}: {e}")
+            page_failed(scraper.base_url, e)
+
+        # Scrapers collect into self.results, reset for the next model
+        scraper.results = []
+
+    return all_results
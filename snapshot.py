@@ -0,0 +1,198 @@
+"""
+Read snapshots and compressed backups
+
+Both are copies made with SQLite's online backup API, which gives a
+consistent copy of the live database without stopping the scrapers
+(unlike copying the file, which can catch a transaction halfway).
+
+Snapshots: create_snapshot() writes config.SNAPSHOT_DIR/snapshot.db and
+renames it into place, so a published snapshot never changes. With
+config.SNAPSHOT_READS the web app serves listings, search and statistics
+from the latest snapshot (web_app.get_read_db), opened read-only and
+immutable, so those reads take no locks on the primary database and never
+wait for a scraper's write transaction. With config.SNAPSHOT_IN_MEMORY the
+web process loads each new snapshot into memory (SQLite memdb) first.
+The scheduler (main.py, or web_app.py run directly) makes a snapshot
+every config.SNAPSHOT_INTERVAL minutes and after every scrape; reads fall
+back to the primary while there is none or it is more than two intervals
+old. Saved searches and the change feed always use the primary.
+
+Backups: backup() writes a gzip-compressed copy to config.BACKUP_DIR and
+keeps the newest config.BACKUP_KEEP. Run it daily from cron
+(deployment/DEPLOYMENT.md), or set config.BACKUP_IN_APP to have the
+scheduler run it at config.BACKUP_HOUR. To restore, stop the app and:
+
+    gunzip -c backups/mercedes_diesel-20260101-030000.db.gz > mercedes_diesel.db
+
+Usage:
+    python snapshot.py                  # make a snapshot now
+    python snapshot.py backup
+    python snapshot.py list
+"""
+
+import argparse
+import gzip
+import itertools
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import weakref
+from datetime import datetime
+
+import config
+from currency import load_rates
+from database import Database
+
+SNAPSHOT_NAME = 'snapshot.db'
+
+_lock = threading.Lock()
+_current = None  # (snapshot mtime, SnapshotDatabase)
+_memory_names = itertools.count(1)
+
+
+class SnapshotDatabase(Database):
+    """Read-only Database on a snapshot: no migrations, no writes"""
+
+    def __init__(self, uri, path, keeper=None):
+        self.db_path = path
+        self.uri = uri
+        self.fx_rates = load_rates()
+        # For in-memory snapshots: keeps the memdb alive. It is closed when the
+        # last request using this snapshot drops it, not when a newer one replaces
+        # it, so a long request (an export) keeps reading the data it started on.
+        self.keeper = keeper
+        if keeper is not None:
+            weakref.finalize(self, keeper.close)
+
+    def get_connection(self):
+        return sqlite3.connect(self.uri, uri=True)
+
+
+def snapshot_path():
+    return os.path.join(config.SNAPSHOT_DIR, SNAPSHOT_NAME)
+
+
+def copy_database(target, source=None):
+    """Consistent copy of the database (default config.DB_PATH) to target"""
+    src = sqlite3.connect(source or config.DB_PATH)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def create_snapshot(source=None):
+    """Write a new snapshot and publish it atomically, returns its path"""
+    os.makedirs(config.SNAPSHOT_DIR, exist_ok=True)
+    path = snapshot_path()
+    start = time.perf_counter()
+
+    if os.path.exists(path + '.tmp'):
+        os.remove(path + '.tmp')
+    copy_database(path + '.tmp', source)
+    os.replace(path + '.tmp', path)
+
+    print(f"[Snapshot] {path} written in {time.perf_counter() - start:.1f}s")
+    return path
+
+
+def _open(path):
+    if not config.SNAPSHOT_IN_MEMORY:
+        return SnapshotDatabase(f"file:{os.path.abspath(path)}?mode=ro&immutable=1", path)
+
+    uri = f"file:/snapshot-{os.getpid()}-{next(_memory_names)}?vfs=memdb"
+    keeper = sqlite3.connect(uri, uri=True)
+    src = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro&immutable=1", uri=True)
+    try:
+        src.backup(keeper)
+    finally:
+        src.close()
+    return SnapshotDatabase(uri, path, keeper)
+
+
+def latest():
+    """SnapshotDatabase on the newest snapshot
+
+    None when there is none yet or it is older than twice
+    config.SNAPSHOT_INTERVAL (the job that refreshes it is not running),
+    so reads fall back to the primary instead of serving old data.
+    """
+    global _current
+
+    path = snapshot_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if time.time() - mtime / 1e9 > 2 * config.SNAPSHOT_INTERVAL * 60:
+        return None
+
+    current = _current
+    if current is not None and current[0] == mtime:
+        return current[1]
+
+    with _lock:
+        if _current is None or _current[0] != mtime:
+            _current = (mtime, _open(path))
+        return _current[1]
+
+
+def backup(keep=None, source=None):
+    """Write a gzip-compressed backup and delete all but the newest keep, returns its path"""
+    keep = config.BACKUP_KEEP if keep is None else keep
+    os.makedirs(config.BACKUP_DIR, exist_ok=True)
+
+    name = os.path.splitext(os.path.basename(source or config.DB_PATH))[0]
+    path = os.path.join(config.BACKUP_DIR, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db.gz")
+    copy = path[:-len('.gz')] + '.tmp'
+    start = time.perf_counter()
+
+    try:
+        copy_database(copy, source)
+        with open(copy, 'rb') as f_in, gzip.open(path + '.tmp', 'wb', compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.replace(path + '.tmp', path)
+    finally:
+        if os.path.exists(copy):
+            os.remove(copy)
+
+    for old in list_backups(name)[keep:]:
+        os.remove(old)
+
+    print(f"[Backup] {path} ({os.path.getsize(path) / 1e6:.1f} MB) written in {time.perf_counter() - start:.1f}s")
+    return path
+
+
+def list_backups(name=None):
+    """Backup paths, newest first"""
+    if not os.path.isdir(config.BACKUP_DIR):
+        return []
+    name = name or os.path.splitext(os.path.basename(config.DB_PATH))[0]
+    backups = [os.path.join(config.BACKUP_DIR, filename) for filename in os.listdir(config.BACKUP_DIR)
+               if filename.startswith(f'{name}-') and filename.endswith('.db.gz')]
+    return sorted(backups, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Database snapshots and backups')
+    parser.add_argument('command', nargs='?', default='snapshot', choices=['snapshot', 'backup', 'list'])
+    parser.add_argument('--db', default=config.DB_PATH, help=f'Database file (default: {config.DB_PATH})')
+    parser.add_argument('--keep', type=int, default=config.BACKUP_KEEP, help='Backups to keep')
+    args = parser.parse_args()
+
+    if args.command == 'snapshot':
+        create_snapshot(args.db)
+    elif args.command == 'backup':
+        backup(args.keep, args.db)
+    else:
+        name = os.path.splitext(os.path.basename(args.db))[0]
+        for path in list_backups(name):
+            print(f"{path}  {os.path.getsize(path) / 1e6:>8.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
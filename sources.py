@@ -0,0 +1,329 @@
+"""
+Source registry and runner
+
+Every marketplace is declared once with register_source():
+- country and label
+- fetch type: STATIC (plain HTTP via http_client) or BROWSER (Selenium)
+- hosts and min_interval: seconds between two requests to each host,
+  enforced by http_client for every source that talks to that host
+- cost: rough runtime in seconds, the slowest sources are started first
+- default: part of a normal nightly run
+
+run_sources() runs static sources on a thread pool and browser sources on
+a separate pool of at most config.BROWSER_POOL_SIZE Chrome instances, both
+at the same time. Scrape functions are referenced as 'module:function' and
+only imported when the source runs, so listing sources never loads Selenium.
+
+save_results() stores a run and keeps the active set current: every ad a
+source lists (or that is on one of its unchanged pages) is stamped with
+the run id, ads that a successful source no longer lists are deactivated,
+and ads that have been inactive for config.ARCHIVE_AFTER_DAYS are moved to
+advertisements_archive. A source with a page that failed (see
+change_detection.page_failed) counts as failed, even though its other
+pages are stored. The standalone scrapers run the same lifecycle with
+update_lifecycle() and finish_run().
+"""
+
+import importlib
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import config
+import http_client
+import metrics
+from alerts import match_saved_searches
+from change_detection import pop_failed_pages, pop_unchanged_pages, save_page_hashes
+from dedup import assign_clusters
+from deal_score import score_deals
+from enrichment import enrich_advertisements
+from geocode import geocode_missing
+from image_cache import process_images
+
+STATIC = 'static'
+BROWSER = 'browser'
+
+
+class Source:
+    """A marketplace that can be scraped"""
+
+    def __init__(self, name, label, country, fetch_type, target, hosts=(),
+                 min_interval=config.REQUEST_DELAY, cost=30, default=True, kwargs=None):
+        self.name = name
+        self.label = label
+        self.country = country
+        self.fetch_type = fetch_type
+        self.target = target
+        self.hosts = list(hosts)
+        self.min_interval = min_interval
+        self.cost = cost
+        self.default = default
+        self.kwargs = kwargs or {}
+
+    def load(self):
+        """Import and return the scrape function"""
+        if callable(self.target):
+            return self.target
+        module_name, function_name = self.target.split(':')
+        return getattr(importlib.import_module(module_name), function_name)
+
+    def run(self):
+        return self.load()(**self.kwargs) or []
+
+
+SOURCES = {}
+
+
+def register_source(name, label, country, fetch_type, target, **options):
+    """Add a source to the registry"""
+    SOURCES[name] = Source(name, label, country, fetch_type, target, **options)
+    return SOURCES[name]
+
+
+# ============================================================================
+# Registered sources
+# ============================================================================
+
+for _country in ['de', 'nl', 'be', 'fr', 'at']:
+    register_source(f'autoscout24_{_country}', f'AutoScout24.{_country}', _country.upper(), STATIC,
+                    'scrape_extra_sources:scrape_autoscout24_json',
+                    hosts=[f'www.autoscout24.{_country}'], min_interval=1, cost=20,
+                    default=_country in ('de', 'nl'), kwargs={'country': _country})
+
+register_source('marktplaats_nl', 'Marktplaats.nl', 'NL', STATIC, 'scrapers:scrape_site',
+                hosts=['www.marktplaats.nl'], min_interval=1, cost=30, default=False,
+                kwargs={'site_name': 'Marktplaats'})
+register_source('mobile_de', 'Mobile.de', 'DE', STATIC, 'fetch_all_sources:scrape_mobile_de',
+                hosts=['suchen.mobile.de'], cost=10, default=False)
+register_source('autotrack_nl', 'AutoTrack.nl', 'NL', STATIC, 'scrape_extra_sources:scrape_autotrack',
+                hosts=['www.autotrack.nl'], cost=0)
+
+register_source('ebay_de', 'eBay.de', 'DE', BROWSER, 'scrape_extra_sources:scrape_ebay_motors',
+                hosts=['www.ebay.de'], cost=60)
+register_source('kleinanzeigen_de', 'Kleinanzeigen.de', 'DE', BROWSER, 'scrape_extra_sources:scrape_kleinanzeigen',
+                hosts=['www.kleinanzeigen.de'], cost=60)
+register_source('gaspedaal_nl', 'Gaspedaal.nl', 'NL', BROWSER, 'scrape_extra_sources:scrape_gaspedaal',
+                hosts=['www.gaspedaal.nl'], cost=60)
+register_source('2dehands_be', '2dehands.be', 'BE', BROWSER, 'scrape_extra_sources:scrape_2dehands',
+                hosts=['www.2dehands.be'], cost=90)
+register_source('autowereld_nl', 'AutoWereld.nl', 'NL', BROWSER, 'scrape_extra_sources:scrape_autowereld',
+                hosts=['www.autowereld.nl'], cost=120)
+
+
+def select_sources(names=None):
+    """Resolve source names (None = all default sources)"""
+    if not names:
+        return [source for source in SOURCES.values() if source.default]
+
+    unknown = [name for name in names if name not in SOURCES]
+    if unknown:
+        raise ValueError(f"Unknown source(s): {', '.join(unknown)} (see --list)")
+    return [SOURCES[name] for name in names]
+
+
+def print_sources():
+    """Print the registry as a table"""
+    print(f"{'Name':<18} {'Country':<8} {'Type':<8} {'Cost':>5}  Default")
+    for source in SOURCES.values():
+        print(f"{source.name:<18} {source.country:<8} {source.fetch_type:<8} "
+              f"{source.cost:>4}s  {'yes' if source.default else ''}")
+
+
+def _run_source(source):
+    start = time.time()
+    with metrics.source_context(source.name) as stats:
+        try:
+            results, error = source.run(), None
+        except Exception as e:
+            results, error = [], str(e)
+    metrics.SOURCE_LISTINGS.inc(len(results), source=source.name)
+    return {'source': source, 'results': results, 'error': error, 'seconds': time.time() - start, 'stats': stats}
+
+
+def run_function(function, label, country, name=None, hosts=(), **kwargs):
+    """Run a scrape function that is not in the registry the way run_sources() does
+
+    For the standalone scrapers (fetch_real_data.py, scrape_extra_sources.py,
+    ...). name (default: the label) is what the ads it lists are stamped
+    with, hosts attribute its unchanged and failed pages to it. Returns an
+    outcome entry, errors are caught and reported.
+    """
+    source = Source(name or label.lower(), label, country, STATIC, function, hosts=hosts, kwargs=kwargs)
+    entry = _run_source(source)
+    if entry['error']:
+        print(f"❌ {label}: {entry['error']}")
+    return entry
+
+
+def run_sources(names=None):
+    """Scrape the given sources concurrently
+
+    Returns {name: {'source', 'results', 'error', 'seconds', 'stats'}} in
+    registry order, stats being metrics.new_source_stats().
+    """
+    sources = sorted(select_sources(names), key=lambda source: source.cost, reverse=True)
+
+    for source in sources:
+        for host in source.hosts:
+            http_client.set_host_interval(host, source.min_interval)
+
+    print(f"Running {len(sources)} sources: {', '.join(source.name for source in sources)}")
+
+    # Left over from an earlier run in this process
+    pop_unchanged_pages()
+    pop_failed_pages()
+
+    outcome = {}
+    with ThreadPoolExecutor(max_workers=config.STATIC_SOURCE_WORKERS) as static_pool, \
+            ThreadPoolExecutor(max_workers=config.BROWSER_POOL_SIZE) as browser_pool:
+        futures = [
+            (browser_pool if source.fetch_type == BROWSER else static_pool).submit(_run_source, source)
+            for source in sources
+        ]
+
+        for future in as_completed(futures):
+            entry = future.result()
+            source = entry['source']
+            if entry['error']:
+                print(f"❌ {source.label}: {entry['error']} ({entry['seconds']:.0f}s)")
+            else:
+                print(f"✅ Added {len(entry['results'])} ads from {source.label} ({entry['seconds']:.0f}s)")
+            outcome[source.name] = entry
+
+    return {name: outcome[name] for name in SOURCES if name in outcome}
+
+
+def source_for_url(outcome, url):
+    """Name of the source in a run whose hosts include the url's host, None if there is none"""
+    host = urlparse(url).hostname
+    for name, entry in outcome.items():
+        if host in entry['source'].hosts:
+            return name
+    return None
+
+
+def seen_external_ids(outcome, unchanged_pages):
+    """{source name: external ids} of the ads each source listed in a run
+
+    Pages skipped as unchanged are attributed to a source by host.
+    """
+    seen = {name: {ad['external_id'] for ad in entry['results'] if ad.get('external_id')}
+            for name, entry in outcome.items()}
+
+    for url, external_ids in unchanged_pages.items():
+        name = source_for_url(outcome, url)
+        if name:
+            seen[name].update(external_ids)
+
+    return seen
+
+
+def mark_failed_pages(outcome, failed_pages):
+    """Give every source with a failed page an error, its results are kept
+
+    Pages are attributed to a source by host, like unchanged pages.
+    """
+    failures = {}
+    for url, error in failed_pages.items():
+        name = source_for_url(outcome, url)
+        if name:
+            failures.setdefault(name, []).append(error)
+
+    for name, errors in failures.items():
+        entry = outcome[name]
+        if not entry['error']:
+            entry['error'] = f"{len(errors)} page(s) failed: {errors[0]}"
+            print(f"⚠️  {entry['source'].label}: {entry['error']}")
+
+
+def update_lifecycle(db, outcome, run_id):
+    """Stamp the ads each source listed with the run, deactivate what complete sources no longer list
+
+    Only sources without an error or a failed page that listed anything
+    at all can retire ads. Call after the ads are stored.
+    Returns (ads seen, ads deactivated).
+    """
+    mark_failed_pages(outcome, pop_failed_pages())
+    seen = seen_external_ids(outcome, pop_unchanged_pages())
+    ads_seen = db.mark_seen(run_id, seen)
+
+    deactivated = 0
+    if config.DEACTIVATE_MISSING_ADS:
+        completed = [name for name, entry in outcome.items() if not entry['error'] and seen[name]]
+        deactivated = db.mark_inactive_ads(run_id, completed)
+    return ads_seen, deactivated
+
+
+def finish_run(db, outcome, known, run_id, ads_seen, deactivated):
+    """Archive long-inactive ads, log the sources and close the run (partial if any source failed)"""
+    archived = db.archive_inactive_ads(config.ARCHIVE_AFTER_DAYS)
+    print(f"Lifecycle: {ads_seen} ads seen, {deactivated} deactivated, {archived} archived")
+
+    log_outcome(db, outcome, known, run_id)
+
+    failed = any(entry['error'] for entry in outcome.values())
+    db.finish_scrape_run(run_id, 'partial' if failed else 'completed', ads_seen, deactivated, archived)
+
+
+def save_results(outcome, db):
+    """Enrich, store and cluster the ads of a run, log one scrape_history row per source
+
+    Returns (ads scraped, rows written).
+    """
+    run_id = db.start_scrape_run(list(outcome))
+
+    # The same ad can show up on more than one search page, it is stored
+    # with the first source that listed it
+    batches, unique = {}, {}
+    for name, entry in outcome.items():
+        batches[name] = []
+        for ad in entry['results']:
+            if ad.get('external_id') and ad['external_id'] not in unique:
+                unique[ad['external_id']] = ad
+                batches[name].append(ad)
+    all_results = list(unique.values())
+
+    known = db.get_known_advertisements(unique)
+
+    # Fetch detail pages for new/changed ads
+    enrich_advertisements(all_results, db)
+
+    # One transaction per source, so each gets its own write time
+    written = 0
+    for name, ads in batches.items():
+        start = time.perf_counter()
+        written += db.add_advertisements(ads) if ads else 0
+        outcome[name]['stats']['write_seconds'] = time.perf_counter() - start
+
+    ads_seen, deactivated = update_lifecycle(db, outcome, run_id)
+
+    # Pages are only marked as seen once their ads are stored
+    save_page_hashes(db)
+
+    # Image hashes feed duplicate detection
+    process_images(db)
+    refresh_derived_data(db)
+
+    finish_run(db, outcome, known, run_id, ads_seen, deactivated)
+
+    return len(all_results), written
+
+
+def log_outcome(db, outcome, known, run_id=None):
+    """One scrape_history row per source, with its timings; known are the ads stored before the run"""
+    for entry in outcome.values():
+        source = entry['source']
+        ads_new = sum(1 for ad in entry['results'] if ad.get('external_id') not in known)
+        status = f"error: {entry['error']}" if entry['error'] else 'success'
+        db.log_scrape(source.country, source.label, len(entry['results']), ads_new, status, run_id, entry['stats'])
+
+
+def refresh_derived_data(db):
+    """Recompute what is derived from the stored ads: coordinates, vehicle clusters, deal scores
+
+    Saved searches are matched last, they use all of the above.
+    """
+    geocode_missing(db)
+    assign_clusters(db)
+    score_deals(db)
+    match_saved_searches(db)
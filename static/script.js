@@ -28,6 +28,11 @@ const countryNames = {
 
 // Detect car type from title/description
 function detectCarType(listing) {
+    // Body type from the detail page (enrichment.py) wins
+    if (listing.body_type) {
+        return listing.body_type;
+    }
+
     const text = ((listing.title || '') + ' ' + (listing.description || '') + ' ' + (listing.model || '')).toLowerCase();
 
     // Station wagon / Combi
@@ -191,8 +196,16 @@ function renderTable(tbodyId, listings) {
 function createTableRow(listing) {
     const tr = document.createElement('tr');
 
-    // Model
+    // Model (with locally cached thumbnail when available)
     const modelCell = document.createElement('td');
+    if (listing.thumbnail_path) {
+        const thumb = document.createElement('img');
+        thumb.className = 'listing-thumb';
+        thumb.src = '/thumbs/' + listing.thumbnail_path;
+        thumb.loading = 'lazy';
+        thumb.alt = '';
+        modelCell.appendChild(thumb);
+    }
     const modelBadge = document.createElement('span');
     modelBadge.className = `model-badge ${listing.model && listing.model.includes('W123') ? 'w123' : 'w124'}`;
     modelBadge.textContent = listing.model || 'Onbekend';
@@ -240,19 +253,23 @@ function createTableRow(listing) {
     }
     tr.appendChild(mileageCell);
 
-    // Price
+    // Price (converted to euros, original currency in the tooltip)
     const priceCell = document.createElement('td');
-    if (listing.price) {
+    const priceEur = listing.price_eur || (listing.currency === 'EUR' ? listing.price : null);
+    if (priceEur) {
         const priceSpan = document.createElement('span');
         priceSpan.className = 'price';
-        if (listing.price < 5000) {
+        if (priceEur < 5000) {
             priceSpan.classList.add('low');
-        } else if (listing.price > 15000) {
+        } else if (priceEur > 15000) {
             priceSpan.classList.add('expensive');
         } else {
             priceSpan.classList.add('moderate');
         }
-        priceSpan.textContent = '€' + formatNumber(listing.price);
+        priceSpan.textContent = '€' + formatNumber(Math.round(priceEur));
+        if (listing.currency && listing.currency !== 'EUR') {
+            priceSpan.title = formatNumber(listing.price) + ' ' + listing.currency;
+        }
         priceCell.appendChild(priceSpan);
     } else {
         priceCell.textContent = 'Op aanvraag';
@@ -539,8 +556,8 @@ function sortByColumn(column) {
                 valB = b.mileage || 999999999;
                 break;
             case 'price':
-                valA = a.price || 999999999;
-                valB = b.price || 999999999;
+                valA = a.price_eur || 999999999;
+                valB = b.price_eur || 999999999;
                 break;
             case 'location':
                 valA = (a.location || a.country || '').toLowerCase();
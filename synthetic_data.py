@@ -0,0 +1,245 @@
+"""
+Synthetic advertisements at scale
+
+demo_data.py adds a few dozen hand-written ads; this generates any number
+of realistic ones for load tests and benchmarks:
+- countries weighted like the real sources, prices in the local currency
+- chassis (W123, W124, W201) and variants from config.MODEL_VARIANTS with
+  their production years
+- price from chassis, variant, age, mileage and country (log-normal noise)
+- locations drawn from the gazetteer, so geocoding and radius search work
+- station wagons, automatics and tow bars in titles and descriptions
+- about 10% of the cars listed twice on different sources (for dedup)
+
+Ads are written through Database.add_advertisements (the bulk path the
+scrapers use, triggers and all) in batches. Their external ids start with
+'synthetic_', --clear removes them again. They go into loadtest.db unless
+--db says otherwise; the live database (config.DB_PATH) needs --force,
+its saved searches would send alerts for the fake listings.
+
+Usage:
+    python synthetic_data.py --count 1000000 --db loadtest.db
+    python synthetic_data.py --count 100000 --db loadtest.db --derive
+    python synthetic_data.py --clear --db loadtest.db
+"""
+
+import argparse
+import math
+import os
+import random
+import sqlite3
+import time
+
+import config
+from geocode import GAZETTEER_PATH
+
+PREFIX = 'synthetic_'
+DEFAULT_DB_PATH = 'loadtest.db'
+
+# Share of the listings per country, currency follows config.COUNTRY_CURRENCY
+COUNTRY_WEIGHTS = {'DE': 0.42, 'NL': 0.2, 'BE': 0.1, 'FR': 0.1, 'AT': 0.06, 'PL': 0.08, 'CZ': 0.04}
+COUNTRY_PRICE_FACTOR = {'DE': 1.0, 'NL': 1.1, 'BE': 0.95, 'FR': 0.95, 'AT': 1.0, 'PL': 0.75, 'CZ': 0.7}
+SOURCES = {
+    'DE': ['AutoScout24', 'Mobile.de', 'Kleinanzeigen.de', 'eBay.de'],
+    'NL': ['AutoScout24', 'Marktplaats', 'Gaspedaal.nl', 'AutoTrack.nl'],
+    'BE': ['AutoScout24', '2dehands.be'],
+    'FR': ['AutoScout24'],
+    'AT': ['AutoScout24'],
+    'PL': ['Otomoto'],
+    'CZ': ['Sauto'],
+}
+
+# Chassis: share of listings, production years, base price in EUR of a good example
+CHASSIS = {
+    'W123': (0.35, 1976, 1985, 7500),
+    'W124': (0.4, 1985, 1995, 5500),
+    'W201': (0.25, 1983, 1993, 4000),
+}
+VARIANT_PRICE_FACTOR = {'300D Turbo': 1.35, '300TD': 1.3, '250TD': 1.15, '250D Kombi': 1.15, '300D': 1.15,
+                        '190D 2.5': 1.15, '240D': 1.05}
+
+WORDS = {
+    'DE': ('Mercedes-Benz', 'Scheckheft', 'TÜV neu', 'Rostfrei', 'Anhängerkupplung', 'Automatik', 'T-Modell'),
+    'NL': ('Mercedes-Benz', 'Dealer onderhouden', 'APK nieuw', 'Roestvrij', 'Trekhaak', 'Automaat', 'Stationwagen'),
+    'default': ('Mercedes-Benz', 'Full history', 'New MOT', 'Rust free', 'Towbar', 'Automatic', 'Estate'),
+}
+LANGUAGE = {'BE': 'NL', 'AT': 'DE'}
+COLOURS = ('', 'beige', 'white', 'blue', 'green', 'silver', 'red', 'black', 'brown', 'grey', 'ivory', 'anthracite')
+TITLES = (
+    '{make} {variant} {chassis} {year}',
+    '{make} {chassis} {variant} {colour} {extra}',
+    '{variant} {extra} {colour}',
+    'Mercedes {variant} {year} {extra}',
+    '{make} {chassis} {variant} {mileage} km {colour}',
+    '{chassis} {variant} {colour} {extra} {year}',
+)
+
+
+def load_places():
+    """{country: [place names]} from the gazetteer"""
+    places = {}
+    with open(GAZETTEER_PATH, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            country, name = line.split('\t')[:2]
+            places.setdefault(country, []).append(name)
+    return places
+
+
+def _fx_rates():
+    from currency import load_rates
+    return load_rates()
+
+
+class Generator:
+    """Deterministic stream of synthetic ads for a seed"""
+
+    def __init__(self, seed=42):
+        self.rng = random.Random(seed)
+        self.places = load_places()
+        self.rates = _fx_rates()
+        self.countries = list(COUNTRY_WEIGHTS)
+        self.country_weights = list(COUNTRY_WEIGHTS.values())
+        self.chassis = list(CHASSIS)
+        self.chassis_weights = [CHASSIS[name][0] for name in self.chassis]
+        self.listed = []  # recent ads, some reappear on another source
+
+    def ad(self, number):
+        rng = self.rng
+        if self.listed and rng.random() < 0.1:
+            return self.relist(number, rng.choice(self.listed))
+
+        country = rng.choices(self.countries, self.country_weights)[0]
+        chassis = rng.choices(self.chassis, self.chassis_weights)[0]
+        _, first_year, last_year, base_price = CHASSIS[chassis]
+        variant = rng.choice(config.MODEL_VARIANTS[chassis])
+        year = rng.randint(first_year, last_year)
+        mileage = int(min(max(rng.gauss(260000, 90000), 40000), 750000) // 100 * 100)
+
+        station = 'T' in variant.replace('Turbo', '') or 'Kombi' in variant or rng.random() < 0.15
+        automatic = rng.random() < 0.3
+        towbar = rng.random() < 0.25
+
+        price_eur = (base_price * VARIANT_PRICE_FACTOR.get(variant, 1.0) * COUNTRY_PRICE_FACTOR[country]
+                     * (1 + (year - first_year) * 0.03) * (1.4 - mileage / 750000)
+                     * (1.1 if station else 1.0) * math.exp(rng.gauss(0, 0.35)))
+        currency = config.COUNTRY_CURRENCY.get(country, 'EUR')
+        price = round(price_eur / self.rates.get(currency, 1.0) / 50) * 50 if rng.random() > 0.03 else None
+
+        words = WORDS.get(LANGUAGE.get(country, country), WORDS['default'])
+        extras = [words[1 + index] for index in rng.sample(range(3), rng.randint(0, 2))]
+        extras += [words[4]] if towbar else []
+        extras += [words[5]] if automatic else []
+        extras += [words[6]] if station else []
+        place = rng.choice(self.places.get(country) or ['Unknown'])
+
+        ad = {
+            'external_id': f'{PREFIX}{number}',
+            'model': f'{chassis} {variant}',
+            'year': year,
+            'mileage': mileage if rng.random() > 0.05 else None,
+            'price': price,
+            'currency': currency,
+            'location': place,
+            'country': country,
+            'source': rng.choice(SOURCES[country]),
+            'source_url': f'https://example.com/{country.lower()}/{number}',
+            'title': ' '.join(rng.choice(TITLES).format(
+                make=words[0], variant=variant, chassis=chassis, year=year, mileage=mileage // 1000,
+                colour=rng.choice(COLOURS), extra=extras[0] if extras else '').split()),
+            'description': ', '.join(extras),
+            'image_url': '',
+            'transmission': 'Automaat' if automatic else 'Handgeschakeld',
+            'body_type': 'Station' if station else 'Sedan',
+        }
+
+        self.listed.append(ad)
+        if len(self.listed) > 1000:
+            self.listed = self.listed[-500:]
+        return ad
+
+    def relist(self, number, ad):
+        """The same car on another source: same details, slightly different price and text"""
+        copy = dict(ad)
+        copy['external_id'] = f'{PREFIX}{number}'
+        copy['source'] = self.rng.choice(SOURCES[ad['country']])
+        copy['source_url'] = f"https://example.com/{ad['country'].lower()}/{number}"
+        if ad['price']:
+            copy['price'] = round(ad['price'] * self.rng.uniform(0.97, 1.03) / 50) * 50
+        return copy
+
+    def batches(self, count, batch_size, start=0):
+        for offset in range(start, start + count, batch_size):
+            yield [self.ad(number) for number in range(offset, min(offset + batch_size, start + count))]
+
+
+def next_number(db_path):
+    """First unused synthetic number, so repeated runs add instead of overwrite"""
+    conn = sqlite3.connect(db_path)
+    row = conn.execute(f"""
+        SELECT MAX(CAST(SUBSTR(external_id, {len(PREFIX) + 1}) AS INTEGER))
+        FROM advertisements WHERE external_id LIKE '{PREFIX}%'
+    """).fetchone()
+    conn.close()
+    return (row[0] + 1) if row and row[0] is not None else 0
+
+
+def generate(db, count, batch_size=5000, seed=42):
+    """Write count synthetic ads through the bulk path, returns rows written"""
+    start_number = next_number(db.db_path)
+    generator = Generator(seed + start_number)
+    written = 0
+    start = time.perf_counter()
+
+    for batch in generator.batches(count, batch_size, start_number):
+        written += db.add_advertisements(batch)
+        elapsed = time.perf_counter() - start
+        print(f"  {written:>9} ads written ({written / elapsed:,.0f}/s)", end='\r')
+
+    print(f"  {written:>9} ads written in {time.perf_counter() - start:.1f}s")
+    return written
+
+
+def clear(db_path):
+    """Remove all synthetic ads, returns the number deleted"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute(f"DELETE FROM advertisements WHERE external_id LIKE '{PREFIX}%'")
+    conn.commit()
+    conn.close()
+    return cursor.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic advertisements')
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help=f'Database file (default: {DEFAULT_DB_PATH})')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--derive', action='store_true',
+                        help='Recompute coordinates, duplicate clusters and deal scores afterwards')
+    parser.add_argument('--clear', action='store_true', help='Remove synthetic ads and exit')
+    parser.add_argument('--force', action='store_true',
+                        help=f'Allow generating into the live database ({config.DB_PATH})')
+    args = parser.parse_args()
+
+    if not args.clear and not args.force and os.path.abspath(args.db) == os.path.abspath(config.DB_PATH):
+        parser.error(f'{args.db} is the live database (config.DB_PATH), pass --force to write fake ads into it')
+
+    from database import Database
+    db = Database(args.db)
+
+    if args.clear:
+        print(f"Removed {clear(args.db)} synthetic ads from {args.db}")
+        return
+
+    print(f"Generating {args.count} synthetic ads into {args.db}...")
+    generate(db, args.count, args.batch_size, args.seed)
+
+    if args.derive:
+        from sources import refresh_derived_data
+        refresh_derived_data(db)
+
+
+if __name__ == '__main__':
+    main()
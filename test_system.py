@@ -43,13 +43,6 @@ def test_imports():
         print("✗ schedule - Run: pip install schedule")
         return False
 
-    try:
-        from fake_useragent import UserAgent
-        print("✓ fake-useragent")
-    except ImportError:
-        print("✗ fake-useragent - Run: pip install fake-useragent")
-        return False
-
     return True
 
 
@@ -82,6 +75,22 @@ def test_database():
         db.add_advertisement(test_ad)
         print("✓ Database write test passed")
 
+        # Test full-text search
+        listings, total = db.search('test mercedes')
+        if not total:
+            print("✗ Full-text search returned no results")
+            return False
+        print(f"✓ Full-text search test passed ({total} matches)")
+
+        # Test saved search criteria
+        from alerts import matches_criteria
+        stored_ad = dict(test_ad, price_eur=test_ad['price'])
+        if not matches_criteria({'model': 'W123', 'max_price': 15000}, stored_ad) \
+                or matches_criteria({'model': 'W123', 'max_price': 10000}, stored_ad):
+            print("✗ Saved search matching failed")
+            return False
+        print("✓ Saved search matching test passed")
+
         # Test reading
         ads = db.get_active_advertisements(limit=1)
         if ads:
@@ -96,6 +105,55 @@ def test_database():
         return False
 
 
+def test_migrations():
+    """Test that an interrupted backfill resumes where it stopped"""
+    print("\nTesting migrations...")
+
+    try:
+        import sqlite3
+        from migrations import backfill
+
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE ads (id INTEGER PRIMARY KEY, price REAL, price_eur REAL)')
+        conn.executemany('INSERT INTO ads (price) VALUES (?)', [(n,) for n in range(1, 101)])
+        conn.commit()
+
+        # Fails on the 36th row, in the fourth batch of ten
+        converted = []
+        def convert(price):
+            if len(converted) == 35:
+                raise RuntimeError('interrupted')
+            converted.append(price)
+            return price * 2
+        conn.create_function('convert', 1, convert)
+
+        try:
+            backfill(conn, 'ads', 'price_eur = convert(price)', where='price_eur IS NULL', batch_size=10, pause=0)
+            print("✗ Backfill was not interrupted")
+            return False
+        except sqlite3.OperationalError:
+            conn.rollback()
+
+        done = conn.execute('SELECT COUNT(*) FROM ads WHERE price_eur IS NOT NULL').fetchone()[0]
+        if done != 30:
+            print(f"✗ Interrupted backfill kept {done} rows, expected the 30 of its committed batches")
+            return False
+
+        resumed = backfill(conn, 'ads', 'price_eur = price * 2', where='price_eur IS NULL', batch_size=10, pause=0)
+        conn.commit()
+        wrong = conn.execute('SELECT COUNT(*) FROM ads WHERE price_eur IS NOT price * 2').fetchone()[0]
+        if resumed != 70 or wrong:
+            print(f"✗ Resumed backfill updated {resumed} rows, {wrong} still wrong")
+            return False
+        print("✓ Interrupted backfill resume test passed")
+
+        return True
+
+    except Exception as e:
+        print(f"✗ Migrations test failed: {e}")
+        return False
+
+
 def test_config():
     """Test configuration"""
     print("\nTesting configuration...")
@@ -138,6 +196,49 @@ def test_scrapers():
         return False
 
 
+def test_normalize():
+    """Test price, year and mileage extraction against the golden corpus"""
+    print("\nTesting extraction...")
+
+    try:
+        import normalize
+
+        parsers = {
+            'price': (normalize.parse_price, normalize.parse_prices),
+            'listing_price': (lambda text: normalize.parse_price(text, require_currency=True),
+                              lambda texts: normalize.parse_prices(texts, require_currency=True)),
+            'year': (normalize.parse_year, normalize.parse_years),
+            'mileage': (normalize.parse_mileage, normalize.parse_mileages),
+        }
+
+        cases = {}
+        with open('data/extract_corpus.tsv', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('#') or not line.strip():
+                    continue
+                kind, text, expected = line.rstrip('\n').split('\t')
+                cases.setdefault(kind, []).append((text, float(expected) if expected else None))
+
+        failed = 0
+        for kind, kind_cases in cases.items():
+            parse, parse_all = parsers[kind]
+            batch = parse_all([text for text, _ in kind_cases])
+            for (text, expected), batch_value in zip(kind_cases, batch):
+                value = parse(text)
+                if value != expected or batch_value != expected:
+                    print(f"✗ {kind} {text!r}: {value} / {batch_value}, expected {expected}")
+                    failed += 1
+
+        if failed:
+            return False
+        print(f"✓ {sum(len(kind_cases) for kind_cases in cases.values())} corpus cases passed")
+        return True
+
+    except Exception as e:
+        print(f"✗ Extraction test failed: {e}")
+        return False
+
+
 def test_web_app():
     """Test web application"""
     print("\nTesting web application...")
@@ -193,7 +294,9 @@ def main():
         ("Imports", test_imports),
         ("Configuration", test_config),
         ("Database", test_database),
+        ("Migrations", test_migrations),
         ("Scrapers", test_scrapers),
+        ("Extraction", test_normalize),
         ("Web Application", test_web_app),
         ("Templates & Static Files", test_templates),
     ]
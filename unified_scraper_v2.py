@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 """
 Unified Mercedes Diesel Scraper V2
-Uses ONLY scrape_extra_sources.py (proven working scrapers)
+Runs the sources from the registry in sources.py
 Skips broken Marktplaats scraper from scrapers.py
 
-Sources:
+Default sources:
 - AutoScout24 (DE, NL)
 - eBay.de
 - Kleinanzeigen.de
@@ -12,14 +12,25 @@ Sources:
 - 2dehands.be
 - AutoTrack.nl
 - AutoWereld.nl
+
+Usage:
+    python unified_scraper_v2.py                               # default sources
+    python unified_scraper_v2.py --sources ebay_de,gaspedaal_nl
+    python unified_scraper_v2.py --list                        # show all sources
+    python unified_scraper_v2.py --profile [cprofile]          # write a profile to profiles/
 """
 
+import argparse
 import sys
 from datetime import datetime
 from database import Database
 import config
+import http_client
+import metrics
+import profiling
+import sources
 
-def main():
+def main(source_names=None):
     print("="*80)
     print("  UNIFIED MERCEDES DIESEL SCRAPER V2")
     print("  190/200 Series Diesel (1979-1986)")
@@ -28,132 +39,15 @@ def main():
     print(f"Models: {config.MODELS}")
     print(f"Year range: {config.YEAR_FROM}-{config.YEAR_TO}")
     print()
-    print("Using: scrape_extra_sources.py (AutoScout24, eBay, Kleinanzeigen, etc.)")
-    print()
 
     db = Database()
-    all_results = []
 
-    # Import functions from scrape_extra_sources
     try:
-        from scrape_extra_sources import (
-            scrape_autoscout24_json,
-            scrape_ebay_motors,
-            scrape_kleinanzeigen,
-            scrape_gaspedaal,
-            scrape_2dehands,
-            scrape_autotrack,
-            scrape_autowereld
-        )
-    except ImportError as e:
-        print(f"ERROR: Could not import scrape_extra_sources.py: {e}")
-        print("Make sure scrape_extra_sources.py is in the same directory!")
+        outcome = sources.run_sources(source_names)
+    except ValueError as e:
+        print(f"ERROR: {e}")
         sys.exit(1)
 
-    # ========================================================================
-    # AutoScout24 Germany
-    # ========================================================================
-    print("\n" + "="*60)
-    print("AUTOSCOUT24.DE")
-    print("="*60)
-    try:
-        results = scrape_autoscout24_json(country='de')
-        all_results.extend(results)
-        print(f"✅ Added {len(results)} ads from AutoScout24.de")
-    except Exception as e:
-        print(f"❌ Error: {e}")
-
-    # ========================================================================
-    # AutoScout24 Netherlands
-    # ========================================================================
-    print("\n" + "="*60)
-    print("AUTOSCOUT24.NL")
-    print("="*60)
-    try:
-        results = scrape_autoscout24_json(country='nl')
-        all_results.extend(results)
-        print(f"✅ Added {len(results)} ads from AutoScout24.nl")
-    except Exception as e:
-        print(f"❌ Error: {e}")
-
-    # ========================================================================
-    # eBay Motors Germany
-    # ========================================================================
-    print("\n" + "="*60)
-    print("EBAY.DE MOTORS")
-    print("="*60)
-    try:
-        results = scrape_ebay_motors()
-        all_results.extend(results)
-        print(f"✅ Added {len(results)} ads from eBay.de")
-    except Exception as e:
-        print(f"❌ Error: {e}")
-
-    # ========================================================================
-    # Kleinanzeigen.de (formerly eBay Kleinanzeigen)
-    # ========================================================================
-    print("\n" + "="*60)
-    print("KLEINANZEIGEN.DE")
-    print("="*60)
-    try:
-        results = scrape_kleinanzeigen()
-        all_results.extend(results)
-        print(f"✅ Added {len(results)} ads from Kleinanzeigen.de")
-    except Exception as e:
-        print(f"❌ Error: {e}")
-
-    # ========================================================================
-    # Gaspedaal.nl
-    # ========================================================================
-    print("\n" + "="*60)
-    print("GASPEDAAL.NL")
-    print("="*60)
-    try:
-        results = scrape_gaspedaal()
-        all_results.extend(results)
-        print(f"✅ Added {len(results)} ads from Gaspedaal.nl")
-    except Exception as e:
-        print(f"❌ Error: {e}")
-
-    # ========================================================================
-    # 2dehands.be (Selenium required)
-    # ========================================================================
-    print("\n" + "="*60)
-    print("2DEHANDS.BE")
-    print("="*60)
-    try:
-        results = scrape_2dehands()
-        all_results.extend(results)
-        print(f"✅ Added {len(results)} ads from 2dehands.be")
-    except Exception as e:
-        print(f"❌ Error: {e}")
-
-    # ========================================================================
-    # AutoTrack.nl
-    # ========================================================================
-    print("\n" + "="*60)
-    print("AUTOTRACK.NL")
-    print("="*60)
-    try:
-        results = scrape_autotrack()
-        all_results.extend(results)
-        print(f"✅ Added {len(results)} ads from AutoTrack.nl")
-    except Exception as e:
-        print(f"❌ Error: {e}")
-
-    # ========================================================================
-    # AutoWereld.nl
-    # ========================================================================
-    print("\n" + "="*60)
-    print("AUTOWERELD.NL")
-    print("="*60)
-    try:
-        results = scrape_autowereld()
-        all_results.extend(results)
-        print(f"✅ Added {len(results)} ads from AutoWereld.nl")
-    except Exception as e:
-        print(f"❌ Error: {e}")
-
     # ========================================================================
     # Save to Database
     # ========================================================================
@@ -161,25 +55,13 @@ def main():
     print("SAVING TO DATABASE")
     print("="*80)
 
-    saved_count = 0
-    error_count = 0
-    duplicate_count = 0
+    total, written = sources.save_results(outcome, db)
+    failed = [name for name, entry in outcome.items() if entry['error']]
 
-    for ad in all_results:
-        try:
-            if db.add_advertisement(ad):
-                saved_count += 1
-            else:
-                duplicate_count += 1
-        except Exception as e:
-            error_count += 1
-            if error_count <= 3:  # Only show first 3 errors
-                print(f"❌ Error saving ad: {e}")
-
-    print(f"\nTotal ads scraped: {len(all_results)}")
-    print(f"✅ New/updated: {saved_count}")
-    print(f"⏭️  Duplicates: {duplicate_count}")
-    print(f"❌ Errors: {error_count}")
+    print(f"\nTotal ads scraped: {total}")
+    print(f"✅ New/updated: {written}")
+    print(f"⏭️  Unchanged: {total - written}")
+    print(f"❌ Failed sources: {', '.join(failed) if failed else 'none'}")
 
     # ========================================================================
     # Final Statistics
@@ -192,13 +74,29 @@ def main():
     print(f"Total active ads (1979-1986): {stats['total_active']}")
     print(f"By country: {stats['by_country']}")
     print(f"Last update: {stats['last_scrape']}")
+
+    http_client.print_cache_stats()
+    metrics.save_snapshot('unified_scraper_v2')
     print()
     print("="*80)
     print(f"✅ Completed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*80)
 
-    # NOTE: We do NOT call mark_inactive_ads()
-    # This preserves old listings that couldn't be re-scraped
+    # Ads that a successful source no longer lists were deactivated by
+    # save_results(); failed sources keep their listings active
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Unified Mercedes Diesel Scraper')
+    parser.add_argument('--sources', help='Comma separated source names (default: all default sources)')
+    parser.add_argument('--list', action='store_true', help='List available sources and exit')
+    parser.add_argument('--profile', nargs='?', const='sample', choices=profiling.MODES,
+                        help='Profile the run (default: sample) and write it to the profiles directory')
+    args = parser.parse_args()
+
+    source_names = args.sources.split(',') if args.sources else None
+    if args.list:
+        sources.print_sources()
+    elif args.profile:
+        profiling.profile_run('unified_scraper_v2', main, source_names, mode=args.profile)
+    else:
+        main(source_names)
@@ -1,14 +1,37 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, g, render_template, jsonify, request, send_from_directory
 from database import Database
+from geocode import parse_point
 import config
+import metrics
 from datetime import datetime, timedelta
 import threading
 import subprocess
 import sys
 import os
+import json
+import time
 
 app = Flask(__name__)
-db = Database()
+_db = None
+
+
+def get_db():
+    """The Database, opened on first use so importing the app (every WSGI worker) does not touch the file"""
+    global _db
+    if _db is None:
+        _db = Database()
+    return _db
+
+
+def get_read_db():
+    """Database for listing reads: the latest snapshot with config.SNAPSHOT_READS, else the primary"""
+    if config.SNAPSHOT_READS:
+        import snapshot
+        db = snapshot.latest()
+        if db is not None:
+            return db
+    return get_db()
+
 
 # Scheduler status
 scheduler_status = {
@@ -55,6 +78,8 @@ def run_scrapers():
                     print(f"[Scheduler] {scraper} failed: {result.stderr[:200]}")
 
         scheduler_status['last_result'] = 'success'
+        if config.SNAPSHOT_READS:
+            refresh_snapshot()
         print(f"[Scheduler] Scrape completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
     except Exception as e:
@@ -65,9 +90,52 @@ def run_scrapers():
         scheduler_status['is_running'] = False
 
 
+def process_new_images():
+    """Thumbnail and hash images of new ads, then refresh duplicate clusters"""
+    from image_cache import process_images
+    from dedup import assign_clusters
+
+    try:
+        db = get_db()
+        if process_images(db):
+            assign_clusters(db)
+    except Exception as e:
+        print(f"[Images] Processing failed: {e}")
+
+
+def deliver_pending_alerts():
+    """Send alerts of saved searches waiting in the outbox"""
+    from alerts import deliver_alerts
+
+    try:
+        deliver_alerts(get_db())
+    except Exception as e:
+        print(f"[Alerts] Delivery failed: {e}")
+
+
+def refresh_snapshot():
+    """Publish a new read snapshot of the database"""
+    from snapshot import create_snapshot
+
+    try:
+        create_snapshot()
+    except Exception as e:
+        print(f"[Snapshot] Failed: {e}")
+
+
+def backup_database():
+    """Write a compressed backup and rotate the old ones"""
+    from snapshot import backup
+
+    try:
+        backup()
+    except Exception as e:
+        print(f"[Backup] Failed: {e}")
+
+
 def should_scrape_on_startup():
     """Check if we should scrape on startup (last scrape > 24 hours ago)"""
-    stats = db.get_statistics()
+    stats = get_db().get_statistics()
     last_scrape = stats.get('last_scrape')
 
     if not last_scrape:
@@ -88,6 +156,7 @@ def start_scheduler():
     """Start the background scheduler"""
     from apscheduler.schedulers.background import BackgroundScheduler
     from apscheduler.triggers.cron import CronTrigger
+    from apscheduler.triggers.interval import IntervalTrigger
 
     scheduler = BackgroundScheduler(daemon=True)
 
@@ -100,6 +169,45 @@ def start_scheduler():
         replace_existing=True
     )
 
+    # Download images of new ads in the background
+    scheduler.add_job(
+        process_new_images,
+        IntervalTrigger(minutes=config.IMAGE_WORKER_INTERVAL),
+        id='image_worker',
+        name='Thumbnail and image hash worker',
+        replace_existing=True
+    )
+
+    # Send saved search alerts
+    scheduler.add_job(
+        deliver_pending_alerts,
+        IntervalTrigger(minutes=config.ALERT_WORKER_INTERVAL),
+        id='alert_worker',
+        name='Saved search alert delivery',
+        replace_existing=True
+    )
+
+    # Compressed backup of the database, unless cron makes it (see deployment/DEPLOYMENT.md)
+    if config.BACKUP_IN_APP:
+        scheduler.add_job(
+            backup_database,
+            CronTrigger(hour=config.BACKUP_HOUR, minute=0),
+            id='backup',
+            name='Daily database backup',
+            replace_existing=True
+        )
+
+    # Read snapshot for the listing endpoints, first one right away
+    if config.SNAPSHOT_READS:
+        scheduler.add_job(
+            refresh_snapshot,
+            IntervalTrigger(minutes=config.SNAPSHOT_INTERVAL),
+            id='snapshot',
+            name='Read snapshot',
+            replace_existing=True,
+            next_run_time=datetime.now()
+        )
+
     scheduler.start()
 
     # Calculate next run time
@@ -118,75 +226,269 @@ def start_scheduler():
     return scheduler
 
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Latency per endpoint (for streamed responses: until the first byte)"""
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.WEB_REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    metrics.WEB_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+
 @app.route('/')
 def index():
     """Main page showing all listings"""
     return render_template('index.html')
 
 
+@app.route('/thumbs/<path:filename>')
+def get_thumbnail(filename):
+    """Serve a cached thumbnail, file names are content hashes so they never change"""
+    response = send_from_directory(os.path.abspath(config.THUMBNAIL_DIR), filename, max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+def listings_response(listings, **fields):
+    """{'success', fields, 'count', 'listings'} response around listings the database serialized
+
+    listings is (JSON array, count) from Database.get_listings_json.
+    """
+    listings_json, count = listings
+    envelope = json.dumps({'success': True, **fields, 'count': count}, ensure_ascii=False)
+    return Response(f'{envelope[:-1]}, "listings": {listings_json}}}', mimetype='application/json')
+
+
 @app.route('/api/listings')
 def get_listings():
     """API endpoint to get listings with optional filtering"""
     country = request.args.get('country')
     limit = request.args.get('limit', 100, type=int)
-
-    if country:
-        listings = db.get_country_top_listings(country, limit)
-    else:
-        listings = db.get_top_listings(limit)
-
-    return jsonify({
-        'success': True,
-        'count': len(listings),
-        'listings': listings
-    })
+    # One row per vehicle unless ?duplicates=1
+    duplicates = request.args.get('duplicates', '0') == '1'
+    # sort=year (default), sort=price (in euros), sort=deal (cheapest compared
+    # to the market first) or sort=distance (with near)
+    sort = request.args.get('sort', 'year')
+
+    # near=Utrecht or near=52.09,5.12, radius_km defaults to 100
+    near = None
+    if request.args.get('near'):
+        near = parse_point(request.args['near'])
+        if not near:
+            return jsonify({
+                'success': False,
+                'message': f"Unknown location: {request.args['near']}"
+            }), 400
+    radius_km = request.args.get('radius_km', 100, type=float)
+
+    return listings_response(get_read_db().get_listings_json(country, limit, duplicates, sort, near, radius_km))
 
 
 @app.route('/api/listings/top')
 def get_top_listings():
     """Get top 100 listings overall"""
-    listings = db.get_top_listings(100)
-    return jsonify({
-        'success': True,
-        'count': len(listings),
-        'listings': listings
-    })
+    return listings_response(get_read_db().get_listings_json(limit=100))
 
 
 @app.route('/api/listings/nl')
 def get_nl_listings():
     """Get top 50 listings from Netherlands"""
-    listings = db.get_country_top_listings('NL', 50)
-    return jsonify({
-        'success': True,
-        'country': 'Nederland',
-        'count': len(listings),
-        'listings': listings
-    })
+    return listings_response(get_read_db().get_listings_json('NL', 50), country='Nederland')
 
 
 @app.route('/api/listings/de')
 def get_de_listings():
     """Get top 50 listings from Germany"""
-    listings = db.get_country_top_listings('DE', 50)
+    return listings_response(get_read_db().get_listings_json('DE', 50), country='Duitsland')
+
+
+@app.route('/api/search')
+def search_listings():
+    """Full-text search over titles and descriptions, ranked by relevance"""
+    query = request.args.get('q', '').strip()
+    country = request.args.get('country')
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+
+    if not query:
+        return jsonify({
+            'success': False,
+            'message': 'Missing search query (q)'
+        }), 400
+
+    listings, total = get_read_db().search(query, page, per_page, country)
+
     return jsonify({
         'success': True,
-        'country': 'Duitsland',
+        'query': query,
+        'page': page,
+        'per_page': per_page,
+        'total': total,
         'count': len(listings),
         'listings': listings
     })
 
 
+@app.route('/api/changes')
+def get_changes():
+    """Stream change log entries after ?after=<seq> as NDJSON, one change per line
+
+    Consumers remember the seq of the last line and pass it as after on
+    the next poll. ?limit caps the number of lines (default 10000).
+    """
+    after = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', 10000, type=int), 1), 100000)
+
+    def generate():
+        last_seq, remaining = after, limit
+        while remaining > 0:
+            changes = get_db().get_changes(last_seq, min(remaining, 1000))
+            if not changes:
+                break
+            for change in changes:
+                yield json.dumps(change, ensure_ascii=False) + '\n'
+            last_seq, remaining = changes[-1]['seq'], remaining - len(changes)
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app.route('/api/export')
+def export_dataset():
+    """Stream a dataset as Parquet, Arrow IPC or gzip CSV (see export.py)
+
+    ?dataset= advertisements (default), archive, price_history or scrape_history
+    ?format= parquet (default), arrow or csv
+    ?columns=, ?country= (comma separated), ?year_from=, ?year_to=, ?since=, ?until=
+    """
+    import export
+
+    dataset = request.args.get('dataset', 'advertisements')
+    fmt = request.args.get('format', 'parquet')
+    columns = request.args.get('columns')
+    country = request.args.get('country')
+
+    try:
+        chunks, selected = export.prepare(
+            get_read_db(), dataset, fmt,
+            columns=columns.split(',') if columns else None,
+            countries=country.upper().split(',') if country else None,
+            year_from=request.args.get('year_from', type=int),
+            year_to=request.args.get('year_to', type=int),
+            since=request.args.get('since'),
+            until=request.args.get('until'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
+    filename = f"{dataset}-{datetime.now().strftime('%Y%m%d')}{export.FORMATS[fmt][0]}"
+    return Response(export.stream(chunks, selected, fmt), mimetype=export.MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@app.route('/api/saved-searches')
+def get_saved_searches():
+    """List saved searches"""
+    searches = get_db().get_saved_searches()
+    for search in searches:
+        search['criteria'] = json.loads(search['criteria'])
+
+    return jsonify({
+        'success': True,
+        'count': len(searches),
+        'saved_searches': searches
+    })
+
+
+@app.route('/api/saved-searches', methods=['POST'])
+def create_saved_search():
+    """Save a search: JSON with name, criteria (see alerts.py), email and/or webhook_url"""
+    from alerts import build_criteria
+
+    data = request.get_json(silent=True) or {}
+    if not data.get('name'):
+        return jsonify({
+            'success': False,
+            'message': 'Missing name'
+        }), 400
+
+    try:
+        criteria = build_criteria(**data.get('criteria', {}))
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
+    search_id = get_db().add_saved_search(data['name'], criteria, data.get('email'), data.get('webhook_url'))
+
+    return jsonify({
+        'success': True,
+        'id': search_id,
+        'criteria': criteria
+    }), 201
+
+
+@app.route('/api/saved-searches/<int:search_id>', methods=['DELETE'])
+def delete_saved_search(search_id):
+    """Delete a saved search"""
+    if not get_db().delete_saved_search(search_id):
+        return jsonify({
+            'success': False,
+            'message': 'Saved search not found'
+        }), 404
+
+    return jsonify({'success': True})
+
+
 @app.route('/api/statistics')
 def get_statistics():
     """Get statistics about the database"""
-    stats = db.get_statistics()
+    stats = get_read_db().get_statistics()
     return jsonify({
         'success': True,
         'statistics': stats
     })
 
 
+@app.route('/api/scrape-history')
+def get_scrape_history():
+    """Scrape runs per source with timings, newest first (?source=, ?days=30, ?limit=500)"""
+    days = request.args.get('days', 30, type=int)
+    limit = min(request.args.get('limit', 500, type=int), 5000)
+    history = get_read_db().get_scrape_history(request.args.get('source'), days, limit)
+    return jsonify({
+        'success': True,
+        'count': len(history),
+        'history': history
+    })
+
+
+@app.route('/api/scrape-history/trend')
+def get_scrape_trend():
+    """Daily timings per source and sources whose last run was much slower than usual"""
+    from scrape_history import trend
+
+    return jsonify({
+        'success': True,
+        'trend': trend(get_read_db(), request.args.get('days', 30, type=int))
+    })
+
+
+@app.route('/scrape-history')
+def scrape_history_page():
+    """Trend view of the scrape timings"""
+    from scrape_history import trend
+
+    return render_template('scrape_history.html', trend=trend(get_read_db(), request.args.get('days', 30, type=int)))
+
+
 @app.route('/api/scheduler')
 def get_scheduler_status():
     """Get scheduler status"""
@@ -215,6 +517,37 @@ def trigger_scrape():
     })
 
 
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics of the web app and of the last run of every scrape entry point"""
+    processes = {'web_app': metrics.collect(), **metrics.load_snapshots()}
+    return Response(metrics.render(processes), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Sample the live process for ?seconds= (default 10) and return collapsed stacks for a flamegraph"""
+    if not config.PROFILE_ENDPOINT_ENABLED or (config.PROFILE_TOKEN and request.args.get('token') != config.PROFILE_TOKEN):
+        return jsonify({
+            'success': False,
+            'message': 'Not found'
+        }), 404
+
+    from profiling import sample_process
+
+    seconds = min(max(request.args.get('seconds', 10, type=float), 0.1), config.PROFILE_MAX_SECONDS)
+    sampler = sample_process(seconds)
+    if sampler is None:
+        return jsonify({
+            'success': False,
+            'message': 'A profile is already running'
+        }), 409
+
+    if request.args.get('format') == 'summary':
+        return Response(sampler.summary(), mimetype='text/plain')
+    return Response(sampler.collapsed(), mimetype='text/plain')
+
+
 @app.template_filter('format_price')
 def format_price(price):
     """Format price with Euro symbol"""